@@ -1,17 +1,31 @@
+"""Flask backend: auth, uploads, charts and chat over the user's portfolio.
+
+Build the app with create_app(). Importing this module has no side effects
+beyond reading configuration: the outbound clients are created on first
+use in each process (so forked workers never share them), the spreadsheet
+stack (pandas, openpyxl) is imported by the code paths that parse
+workbooks, and warm_up() front-loads both for servers that want to pay
+for them before taking traffic.
+"""
+
 import re
 import json
-from flask import Flask, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    request,
+    jsonify,
+    stream_with_context,
+)
 from flask_jwt_extended import (
     create_access_token,
     jwt_required,
     JWTManager,
     get_jwt_identity,
 )
-from pymongo import MongoClient
-import boto3
 
-from openai import OpenAI
 from flask_cors import CORS
 import os
 import logging
@@ -21,58 +35,107 @@ import datetime
 
 import time
 
-from boto3.dynamodb.conditions import Key
 import hashlib
-import pandas as pd
-from io import BytesIO
-import zipfile
+import uuid
+
+from workbook_cache import workbook_cache
+from file_cache import LocalFileCache
+from upload_jobs import UploadJobs
+from chat_store import ChatWriteBehind
+from conversation import ConversationMemory, HISTORY_LOAD_LIMIT
+from response_cache import ResponseCache
+from passwords import HashingBusy, PasswordHashing
+from user_cache import UserCache
+from retrieval import CONTEXT_TOKEN_BUDGET
+from spreadsheet_pool import (
+    SpreadsheetBusy,
+    SpreadsheetPool,
+    combine_workbooks,
+    prepare_workbook,
+    warm_up as import_spreadsheet_modules,
+)
+from tokens import count_tokens
+import telemetry
+from telemetry import span
+import portfolio_metrics
+import prompts
+from model_router import ModelRouter, depends_on_conversation
+import outbound
+from outbound import CircuitBreaker, PerProcess, UpstreamUnavailable
+from charts import (
+    chart_etag,
+    etag_matches,
+    parse_selection,
+    select_charts,
+)
 
 load_dotenv()
-# Initialize Flask app
-# logging.basicConfig(level=logging.DEBUG)
-app = Flask(__name__)
+# Routes live on a blueprint; create_app() builds the Flask app around it
+api = Blueprint("api", __name__)
 
 logging.basicConfig(
-    level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 logger = logging.getLogger(__name__)
 
-CORS(app)
-# logging.info("Request reached the server! 1")
 # OpenAI client setup
 API_KEY = os.getenv("API_KEY")
 ORGANIZATION = os.getenv("ORGANIZATION")
 PROJECT_ID = os.getenv("PROJECT_ID")
-logger.debug("Loading OpenAI client configuration")
-client = OpenAI(
-    api_key=API_KEY,
-    organization=ORGANIZATION,
-    project=PROJECT_ID,
+# Each upstream fails fast behind its own circuit breaker once degraded
+openai_breaker = CircuitBreaker("OpenAI", outbound.openai_failure)
+dynamodb_breaker = CircuitBreaker("DynamoDB")
+s3_breaker = CircuitBreaker("S3")
+# Clients are built on first use in each process, see outbound.PerProcess
+client = PerProcess(
+    lambda: outbound.openai_client(
+        api_key=API_KEY,
+        organization=ORGANIZATION,
+        project=PROJECT_ID,
+    )
 )
-file_summary = ""
-logger.debug("jwt k upr ---------------------------------")
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
-jwt = JWTManager(app)
-logger.debug("jwt k niche ---------------------------------")
+jwt = JWTManager()
 # dynamodb connection
-logger.debug("Connecting to DynamoDB")
-dynamodb = boto3.resource(
-    "dynamodb",
-    region_name="us-east-1",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
+dynamodb = PerProcess(
+    lambda: outbound.aws_resource(
+        "dynamodb",
+        dynamodb_breaker,
+        region_name="us-east-1",
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
+    )
 )
-users_table = dynamodb.Table("Users")
-chats_table = dynamodb.Table("Chats")
-file_summaries_table = dynamodb.Table("Files")
-
-logger.debug("Setting up S3 client")
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
+users_table = PerProcess(lambda: dynamodb.Table("Users"))
+chats_table = PerProcess(lambda: dynamodb.Table("Chats"))
+file_summaries_table = PerProcess(lambda: dynamodb.Table("Files"))
+upload_jobs_table = PerProcess(
+    lambda: dynamodb.Table(os.getenv("UPLOAD_JOBS_TABLE", "UploadJobs"))
+)
+
+# Chat items are batched off the request path unless CHAT_WRITE_BEHIND=0.
+# The writer runs a thread, so each process starts its own
+chat_writer = None
+if os.getenv("CHAT_WRITE_BEHIND", "1") != "0":
+    chat_writer = PerProcess(lambda: ChatWriteBehind(chats_table))
+
+s3_client = PerProcess(
+    lambda: outbound.aws_client(
+        "s3",
+        s3_breaker,
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
+    )
 )
 bucket_name = "rentwiseai-storage"
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+
+# Replies to repeated questions about an unchanged workbook, unless disabled
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "1") != "0"
+response_cache = ResponseCache()
+
+# Picks the model per question, or answers it from the portfolio metrics
+chat_router = ModelRouter()
 
 
 # Generate JWT token
@@ -84,14 +147,129 @@ def generate_token(email):
     return token
 
 
-# Define Local Storage Path (Ensure this exists)
+# Local storage path, created by create_app()
 UPLOAD_FOLDER = "filestorage"
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+
+
+def download_from_s3(s3_file_path, local_path):
+    with span("s3_download"):
+        s3_client.download_file(bucket_name, s3_file_path, local_path)
+    telemetry.file_bytes.observe(os.path.getsize(local_path), direction="download")
+
+
+def s3_etag(s3_file_path):
+    return s3_client.head_object(Bucket=bucket_name, Key=s3_file_path)["ETag"]
+
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_MULTIPART_THRESHOLD = int(
+    os.getenv("UPLOAD_MULTIPART_THRESHOLD", 8 * 1024 * 1024)
+)
+UPLOAD_MULTIPART_CHUNKSIZE = int(
+    os.getenv("UPLOAD_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024)
+)
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "8"))
+
+
+def s3_transfer_config():
+    """Large workbooks go to S3 as concurrent multipart uploads"""
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=UPLOAD_MULTIPART_THRESHOLD,
+        multipart_chunksize=UPLOAD_MULTIPART_CHUNKSIZE,
+        max_concurrency=UPLOAD_MAX_CONCURRENCY,
+    )
+
+
+upload_jobs = UploadJobs(table=upload_jobs_table)
+
+# CPU-bound workbook parsing and aggregation run in worker processes.
+# They start on first use, or up front from the server entry points
+spreadsheet_pool = SpreadsheetPool()
+
+
+@api.app_errorhandler(SpreadsheetBusy)
+def spreadsheet_busy(e):
+    logger.warning(f"Rejecting request: {e}")
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+
+def workbook_artifacts(path):
+    """Files derived from a cached workbook, evicted along with it"""
+    import ingest
+
+    return [ingest.artifact_dir(path)]
+
+
+# Local copies of uploaded workbooks, refreshed per upload and bounded on disk
+file_cache = LocalFileCache(
+    UPLOAD_FOLDER,
+    download=download_from_s3,
+    head_etag=s3_etag,
+    max_bytes=int(os.getenv("FILE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))),
+    companions=workbook_artifacts,
+    on_evict=workbook_cache.invalidate,
+)
+
+
+# Passwords are hashed on their own bounded pool; user lookups are cached briefly
+password_hashing = PasswordHashing()
+user_cache = UserCache()
+
+
+@api.app_errorhandler(HashingBusy)
+def hashing_busy(e):
+    logger.warning(f"Rejecting request: {e}")
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+
+@api.app_errorhandler(UpstreamUnavailable)
+def upstream_unavailable(e):
+    logger.warning(f"Rejecting request: {e}")
+    return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
+
+def find_user(email):
+    """The `Users` item of an email, or None when there is no such user"""
+    cached, user = user_cache.get(email)
+    if cached:
+        return user
+    with span("dynamodb"):
+        user = users_table.get_item(Key={"email": email}).get("Item")
+    user_cache.put(email, user)
+    return user
+
+
+def create_user(username, email, hashed_password):
+    """Stores a new user; returns False when the email is already registered"""
+    user = {"user_id": username, "email": email, "password": hashed_password}
+    try:
+        with span("dynamodb"):
+            users_table.put_item(
+                Item=user, ConditionExpression="attribute_not_exists(email)"
+            )
+    except users_table.meta.client.exceptions.ConditionalCheckFailedException:
+        user_cache.invalidate(email)
+        return False
+    user_cache.put(email, user)
+    return True
+
+
+def store_password_hash(user, hashed_password):
+    """Replaces a user's password hash, e.g. after the hash method changed"""
+    with span("dynamodb"):
+        users_table.update_item(
+            Key={"email": user["email"]},
+            UpdateExpression="SET password = :password",
+            ExpressionAttributeValues={":password": hashed_password},
+        )
+    user_cache.put(user["email"], {**user, "password": hashed_password})
+    logger.info(f"Rehashed the password of {user['email']}")
 
 
 # Sign-up route
-@app.route("/auth/signup", methods=["POST"])
+@api.route("/auth/signup", methods=["POST"])
 def signup():
     try:
         data = request.json
@@ -99,29 +277,31 @@ def signup():
         username = data.get("name")
         email = data.get("email")
         password = data.get("password")
-        # Check if the user already exists
-        response = users_table.get_item(Key={"email": email})
-        if "Item" in response:
+        # Known users are turned away before paying for a hash; otherwise the
+        # conditional put below is the existence check
+        cached, user = user_cache.get(email)
+        if cached and user is not None:
             logger.warning(f"User with email {email} already exists")
             return jsonify({"message": "User already exists"}), 400
 
-        # Hash the password
-        hashed_password = generate_password_hash(password, method="pbkdf2:sha256")
+        with span("password_hash"):
+            hashed_password = password_hashing.hash(password)
 
-        # Store the user in DynamoDB
-        users_table.put_item(
-            Item={"user_id": username, "email": email, "password": hashed_password}
-        )
+        if not create_user(username, email, hashed_password):
+            logger.warning(f"User with email {email} already exists")
+            return jsonify({"message": "User already exists"}), 400
         token = generate_token(email)
         logger.info(f"User {email} registered successfully")
         return jsonify({"message": "User registered successfully", "token": token}), 201
+    except (HashingBusy, UpstreamUnavailable):
+        raise
     except Exception as e:
         logger.error(f"Error during sign-up: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 # Sign in route
-@app.route("/auth/signin", methods=["POST"])
+@api.route("/auth/signin", methods=["POST"])
 def signin():
     try:
         data = request.json
@@ -129,17 +309,18 @@ def signin():
         email = data.get("email")
         password = data.get("password")
 
-        # Retrieve the user from DynamoDB
-        response = users_table.get_item(Key={"email": email})
-        user = response.get("Item")
-        logger.info("this is uder info", user)
+        user = find_user(email)
         if not user:
             logger.warning(f"User with email {email} not found")
             return jsonify({"message": "User not found"}), 404
 
-        if not check_password_hash(user["password"], password):
+        with span("password_hash"):
+            valid, new_hash = password_hashing.verify(user["password"], password)
+        if not valid:
             logger.warning(f"Invalid credentials for email: {email}")
             return jsonify({"message": "Invalid credentials"}), 403
+        if new_hash is not None:
+            store_password_hash(user, new_hash)
 
         # Generate JWT token
         token = generate_token(user["email"])
@@ -147,40 +328,191 @@ def signin():
             jsonify({"token": token, "userName": user.get("user_id", email)}),
             200,
         )  # Include userName in response
+    except (HashingBusy, UpstreamUnavailable):
+        raise
     except Exception as e:
         logger.error(f"Error during sign-in: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-# Function to create chat prompts
-def create_prompt(system_instructions, user_message):
-    return [
-        {"role": "system", "content": system_instructions},
-        {"role": "user", "content": user_message},
-    ]
+def build_chat_messages(current_user, user_message, portfolio=None):
+    """Builds the prompt: instructions, portfolio data, history, question.
+
+    The layout keeps the longest possible prefix identical between turns,
+    see prompts.py. Must run before the question itself is saved, or it
+    would appear twice.
+    """
+    with span("summarize"):
+        summary, rows = load_portfolio_prompt(current_user, user_message, portfolio)
+    with span("history"):
+        history = conversation_memory.history_messages(current_user)
+    return prompts.build_messages(user_message, summary, history, rows)
+
+
+def get_prepared_workbook(file_path, version):
+    """Per-sheet index, profits and charts of a workbook, built once per version.
+
+    The parsing and aggregation run in the spreadsheet process pool, which
+    raises SpreadsheetBusy instead of queueing without limit.
+    """
+    return workbook_cache.get_or_load(
+        file_path,
+        version,
+        "prepared",
+        lambda: prepare_changed_sheets(
+            file_path, workbook_cache.latest(file_path, "prepared"), version=version
+        ),
+    )
 
 
-def summarize_file(file_path):
-    """Summarizes the Excel file contents"""
-    try:
-        logger.info(f"Reading file from path: {file_path}")
-        sheets = pd.read_excel(file_path, sheet_name=None, engine="openpyxl")
+def prepare_changed_sheets(file_path, previous=None, block=False, version=None):
+    """Runs prepare_workbook, reusing `previous` results for unchanged sheets.
+
+    `previous` is the prepared result of an earlier version of the same
+    workbook; sheets whose content hash it already covers are neither
+    re-normalized nor re-aggregated. Requests for the same `version` share
+    one task while it runs, even after a caller gave up waiting on it.
+    """
+    reusable = {}
+    if previous is not None:
+        reusable = {sheet["hash"]: sheet for sheet in previous["sheets"]}
+    key = None
+    if version is not None:
+        key = (os.path.abspath(file_path), version, frozenset(reusable))
+    prepared = run_spreadsheet_task(
+        prepare_workbook, file_path, set(reusable), block=block, key=key
+    )
+    reused = 0
+    for sheet in prepared["sheets"]:
+        if "index" not in sheet:
+            # The hash covers the sheet name, so the earlier entry matches
+            sheet.update(reusable[sheet["hash"]])
+            reused += 1
+    if reused:
+        logger.info(f"Reused {reused} unchanged sheets of {file_path}")
+    return prepared
 
-        summary = ""
-        for sheet_name, sheet_data in sheets.items():
-            summary += f"\nSheet: {sheet_name}\n"
-            summary += sheet_data.to_string()
 
-        return summary
-    except Exception as e:
-        logger.error(f"Error reading file: {str(e)}")
-        return str(e)
+def run_spreadsheet_task(func, *args, block=False, key=None):
+    with span("spreadsheet"):
+        return spreadsheet_pool.run(func, *args, block=block, key=key)
+
+
+def portfolio_path(current_user):
+    """Workbook cache key of a user's combined portfolio"""
+    return f"portfolio-{hashlib.md5(current_user.encode('utf-8')).hexdigest()}"
+
+
+def portfolio_signature(portfolio):
+    return tuple(
+        (workbook["file_id"], workbook["version"]) for workbook in portfolio["files"]
+    )
+
+
+def get_portfolio_view(current_user, portfolio):
+    """Index, metrics and charts of all of a user's workbooks together.
+
+    Returns None when a workbook could not be downloaded. A workbook that
+    can't be parsed is left out and named in the view's "unreadable" list;
+    only when none can be parsed does this raise. The combined view is
+    cached until any workbook of the portfolio changes.
+    """
+    local_files = []
+    for workbook in portfolio["files"]:
+        try:
+            local_file_path = file_cache.get(workbook["key"], workbook["version"])
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error downloading file: {e}")
+            return None
+        local_files.append((workbook, local_file_path))
+
+    def combine():
+        workbooks = []
+        unreadable = []
+        for workbook, path in local_files:
+            try:
+                prepared = get_prepared_workbook(path, workbook["version"])
+            except (SpreadsheetBusy, UpstreamUnavailable):
+                raise
+            except Exception as e:
+                logger.error(f"Skipping unreadable workbook {workbook['key']}: {e}")
+                unreadable.append(workbook["name"])
+                continue
+            workbooks.append((workbook["name"], prepared))
+        if not workbooks:
+            raise ValueError("None of the uploaded workbooks could be read")
+        return {**combine_workbooks(workbooks), "unreadable": unreadable}
+
+    return workbook_cache.get_or_load(
+        portfolio_path(current_user), portfolio_signature(portfolio), "view", combine
+    )
+
+
+def get_portfolio_summary(current_user, portfolio, view):
+    """The per-version portfolio block of the prompt, built once per version.
+
+    Holds the metrics and sheet overview, plus every row when they all fit
+    in the context budget; `rows_budget` is what is left for rows picked
+    per question otherwise.
+    """
+
+    def build():
+        metrics = portfolio_metrics.render_metrics(view["metrics"])
+        overview = view["index"].overview()
+        rows_budget = (
+            CONTEXT_TOKEN_BUDGET - count_tokens(metrics) - count_tokens(overview)
+        )
+        rows, complete = view["index"].select_rows("", rows_budget)
+        parts = [metrics, overview, rows if complete else ""]
+        if view["unreadable"]:
+            parts.insert(
+                0,
+                "These workbooks could not be read and are not included: "
+                + ", ".join(view["unreadable"]),
+            )
+        return {
+            "summary": "\n\n".join(part for part in parts if part),
+            "rows_budget": rows_budget,
+            "complete": complete,
+        }
+
+    return workbook_cache.get_or_load(
+        portfolio_path(current_user), portfolio_signature(portfolio), "summary", build
+    )
 
 
-@app.route("/api/upload", methods=["POST"])
+def save_upload(file, path):
+    """Streams an uploaded file to disk and returns its SHA-256 hex digest"""
+    digest = hashlib.sha256()
+    with open(path, "wb") as target:
+        while chunk := file.stream.read(UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+            target.write(chunk)
+    telemetry.file_bytes.observe(os.path.getsize(path), direction="upload")
+    return digest.hexdigest()
+
+
+def workbook_id(filename):
+    """Stable id of a workbook in a portfolio: re-uploads of a name replace it"""
+    return hashlib.md5(filename.lower().encode("utf-8")).hexdigest()[:12]
+
+
+def new_version():
+    """Version stamp of an upload, fine enough that quick re-uploads differ"""
+    return time.time_ns() // 1000
+
+
+@api.route("/api/upload", methods=["POST"])
 @jwt_required()
 def upload_file():
-    """Uploads file to S3 and stores reference in DynamoDB"""
+    """Uploads file to S3 and stores reference in DynamoDB.
+
+    A file named like one already in the user's portfolio replaces that
+    workbook and any other name adds one; the `replace` form field set to
+    "true" replaces the whole portfolio with this file.
+    """
     logger.info("Received file upload request from user")
 
     if "file" not in request.files:
@@ -199,400 +531,1033 @@ def upload_file():
         )
 
     current_user = get_jwt_identity()
+    name = os.path.basename(file.filename)
+    file_id = workbook_id(name)
+    replace = request.form.get("replace", "").lower() in ("1", "true")
     filename_hashed = (
-        hashlib.md5(current_user.encode("utf-8")).hexdigest() + file_extension
+        hashlib.md5(current_user.encode("utf-8")).hexdigest()
+        + f"-{file_id}{file_extension}"
     )
     s3_file_path = f"filestorage/{filename_hashed}"
 
     try:
-        s3_client.upload_fileobj(file, bucket_name, s3_file_path)
-        file_summaries_table.put_item(
-            Item={
-                "email": current_user,
-                "summary": s3_file_path,
-                "timestamp": int(time.time()),
-            }
+        # Written aside and renamed into the file cache by the upload job
+        upload_path = os.path.join(
+            UPLOAD_FOLDER, f"{filename_hashed}.upload-{uuid.uuid4().hex}"
+        )
+        content_hash = save_upload(file, upload_path)
+
+        current = get_file_item(current_user)
+        files = portfolio_files(current) if current is not None else {}
+        same = [
+            workbook
+            for workbook in files.values()
+            if workbook.get("content_hash") == content_hash
+        ]
+        if same and not (replace and len(files) > 1):
+            # Same bytes as a stored workbook: nothing to store or re-ingest
+            os.remove(upload_path)
+            s3_file_path = same[0]["key"]
+            job = upload_jobs.create(
+                current_user, s3_file_path, status="done", unchanged=True
+            )
+            logger.info(f"Upload unchanged, skipping S3 write: {s3_file_path}")
+            return (
+                jsonify(
+                    {
+                        "message": "File unchanged",
+                        "file_path": s3_file_path,
+                        "job_id": job["job_id"],
+                        "status": job["status"],
+                    }
+                ),
+                200,
+            )
+
+        job = upload_jobs.create(current_user, s3_file_path)
+        upload_jobs.submit(
+            job["job_id"],
+            process_upload,
+            job["job_id"],
+            current_user,
+            upload_path,
+            s3_file_path,
+            content_hash,
+            file_id,
+            name,
+            replace,
         )
-
-        logger.info(f"File uploaded successfully to S3: {bucket_name}/{s3_file_path}")
         return (
             jsonify(
-                {"message": "File uploaded successfully", "file_path": s3_file_path}
+                {
+                    "message": "File received, processing",
+                    "file_path": s3_file_path,
+                    "file_id": file_id,
+                    "job_id": job["job_id"],
+                    "status": job["status"],
+                }
             ),
-            200,
+            202,
         )
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error uploading file: {e}")
         return jsonify({"error": f"Failed to upload file: {str(e)}"}), 500
 
 
-# Flask route for chatting with GPT
-
+def process_upload(
+    job_id,
+    current_user,
+    upload_path,
+    s3_file_path,
+    content_hash,
+    file_id,
+    name,
+    replace=False,
+):
+    """Ingests, stores and precomputes an uploaded workbook (upload job body)"""
+    import ingest
+
+    file_version = new_version()
+    upload_jobs.update(job_id, status="ingesting")
+    local_file_path = file_cache.path_for(s3_file_path)
+    # What the previous version derived from sheets that didn't change
+    previous = workbook_cache.latest(local_file_path, "prepared")
+    file_cache.add(upload_path, s3_file_path, file_version)
+    workbook_cache.invalidate(local_file_path)
 
-def download_file_to_local(s3_file_path, local_path):
-    """Downloads file from S3 to local storage"""
     try:
-        logger.info(f"Downloading file from S3: {s3_file_path} to {local_path}")
+        try:
+            # Uploads wait for a free spreadsheet worker instead of failing
+            prepared = prepare_changed_sheets(
+                local_file_path, previous, block=True, version=file_version
+            )
+        except (ingest.WorkbookTooLarge, SpreadsheetBusy, OSError):
+            # Not a problem with the file itself
+            raise
+        except Exception as e:
+            logger.error(f"Error ingesting workbook {local_file_path}: {e}")
+            raise ValueError("The file could not be read as an Excel workbook") from e
+
+        upload_jobs.update(job_id, status="uploading")
+        with span("s3_upload"):
+            s3_client.upload_file(
+                local_file_path, bucket_name, s3_file_path, Config=s3_transfer_config()
+            )
+        workbook = {
+            "key": s3_file_path,
+            "name": name,
+            "version": file_version,
+            "content_hash": content_hash,
+        }
+        dropped = store_workbook(current_user, file_id, workbook, job_id, replace)
+    except Exception:
+        # Drop the rejected copy; the previous upload is re-fetched from S3.
+        # Requests made meanwhile may have cached what they read from it
+        file_cache.remove(s3_file_path)
+        workbook_cache.invalidate(portfolio_path(current_user))
+        response_cache.invalidate(current_user)
+        raise
+
+    for old_workbook in dropped:
+        if old_workbook["key"] != s3_file_path:
+            remove_workbook_file(old_workbook["key"])
+    response_cache.invalidate(current_user)
+    workbook_cache.invalidate(portfolio_path(current_user))
+
+    workbook_cache.put(local_file_path, file_version, "prepared", prepared)
+    for sheet in prepared["sheets"]:
+        if sheet["charts_error"]:
+            logger.warning(f"{sheet['name']}: {sheet['charts_error']}")
+
+    upload_jobs.update(job_id, status="done", version=file_version)
+    logger.info(f"File uploaded successfully to S3: {bucket_name}/{s3_file_path}")
+
+
+def store_workbook(current_user, file_id, workbook, job_id, replace=False):
+    """Records a workbook in the user's `Files` item and bumps its version.
+
+    Adds or updates the workbook in the portfolio, or makes it the only one
+    when `replace` is set. The item also keeps pointing `summary` at the
+    latest upload. Returns the workbooks the write dropped from the item.
+    """
+    latest = {
+        "summary": workbook["key"],
+        "timestamp": workbook["version"],
+        "content_hash": workbook["content_hash"],
+        "upload_job": job_id,
+    }
+    item = {"email": current_user, "files": {file_id: workbook}, **latest}
+    conditional_failed = (
+        file_summaries_table.meta.client.exceptions.ConditionalCheckFailedException
+    )
 
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with span("dynamodb"):
+        if replace:
+            old = file_summaries_table.put_item(Item=item, ReturnValues="ALL_OLD")
+            return list(portfolio_files(old.get("Attributes", {})).values())
+
+        # An upload racing this one may create the item in between: retry once
+        for _ in range(2):
+            try:
+                file_summaries_table.update_item(
+                    Key={"email": current_user},
+                    UpdateExpression="SET #files.#file = :workbook, "
+                    + ", ".join(f"#{name} = :{name}" for name in latest),
+                    ConditionExpression="attribute_exists(#files)",
+                    ExpressionAttributeNames={
+                        "#files": "files",
+                        "#file": file_id,
+                        **{f"#{name}": name for name in latest},
+                    },
+                    ExpressionAttributeValues={
+                        ":workbook": workbook,
+                        **{f":{name}": value for name, value in latest.items()},
+                    },
+                )
+                return []
+            except conditional_failed:
+                pass
+            try:
+                # No portfolio yet, or one written before portfolios existed
+                old = file_summaries_table.put_item(
+                    Item=item,
+                    ConditionExpression="attribute_not_exists(#files)",
+                    ExpressionAttributeNames={"#files": "files"},
+                    ReturnValues="ALL_OLD",
+                )
+                return list(portfolio_files(old.get("Attributes", {})).values())
+            except conditional_failed:
+                pass
+    raise RuntimeError("The portfolio changed during the upload, please retry")
+
+
+def remove_workbook_file(s3_file_path):
+    """Deletes a workbook that left the portfolio from S3 and the local cache"""
+    try:
+        with span("s3_delete"):
+            s3_client.delete_object(Bucket=bucket_name, Key=s3_file_path)
+    except Exception as e:
+        logger.error(f"Error deleting {s3_file_path} from S3: {e}")
+    file_cache.remove(s3_file_path)
 
-        # Download from S3
-        with open(local_path, "wb") as file:
-            s3_client.download_fileobj(bucket_name, s3_file_path, file)
 
-        logger.info(f"File downloaded successfully: {local_path}")
-        return local_path
+@api.route("/api/files", methods=["GET"])
+@jwt_required()
+def list_files():
+    """Lists the workbooks in the user's portfolio"""
+    try:
+        portfolio = get_portfolio(get_jwt_identity())
+        if portfolio is None:
+            return jsonify({"version": None, "files": []}), 200
+
+        def version(value):
+            # DynamoDB numbers come back as Decimal
+            return None if value is None else int(value)
+
+        files = [
+            {
+                "file_id": workbook["file_id"],
+                "name": workbook["name"],
+                "version": version(workbook["version"]),
+            }
+            for workbook in portfolio["files"]
+        ]
+        return jsonify({"version": version(portfolio["version"]), "files": files}), 200
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
-        logger.error(f"Error downloading file: {e}")
-        return None
+        logger.error(f"Error listing files: {e}")
+        return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/chat", methods=["POST"])
+@api.route("/api/files/<file_id>", methods=["DELETE"])
 @jwt_required()
-def chat_with_gpt():
-    """Handles chat requests, retrieves file if needed"""
+def delete_file(file_id):
+    """Removes one workbook from the user's portfolio"""
+    current_user = get_jwt_identity()
     try:
-        data = request.json
-        user_message = data.get("message", "")
-        current_user = get_jwt_identity()
+        item = get_file_item(current_user)
+        files = portfolio_files(item) if item is not None else {}
+        if file_id not in files:
+            return jsonify({"error": "Unknown file"}), 404
+
+        with span("dynamodb"):
+            if "files" not in item:
+                file_summaries_table.delete_item(Key={"email": current_user})
+            else:
+                file_summaries_table.update_item(
+                    Key={"email": current_user},
+                    UpdateExpression="REMOVE #files.#file SET #timestamp = :version",
+                    ConditionExpression="attribute_exists(#files.#file)",
+                    ExpressionAttributeNames={
+                        "#files": "files",
+                        "#file": file_id,
+                        "#timestamp": "timestamp",
+                    },
+                    ExpressionAttributeValues={":version": new_version()},
+                )
+        remove_workbook_file(files[file_id]["key"])
+        response_cache.invalidate(current_user)
+        workbook_cache.invalidate(portfolio_path(current_user))
+        return jsonify({"message": "File deleted", "file_id": file_id}), 200
+    except file_summaries_table.meta.client.exceptions.ConditionalCheckFailedException:
+        return jsonify({"error": "Unknown file"}), 404
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting file: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        chat_item = {
-            "email": current_user,
-            "timestamp": int(time.time()),
-            "role": "user",
-            "message": user_message,
+
+@api.route("/api/upload/<job_id>", methods=["GET"])
+@jwt_required()
+def get_upload_status(job_id):
+    """Reports the progress of an upload job"""
+    current_user = get_jwt_identity()
+    job = upload_jobs.get(job_id)
+    if job is None or job["email"] != current_user:
+        # Without the jobs table only the process running a job knows it;
+        # another worker can still confirm a finished one from the Files record
+        item = get_file_item(current_user)
+        if item is None or item.get("upload_job") != job_id:
+            return jsonify({"error": "Unknown upload job"}), 404
+        job = {"job_id": job_id, "status": "done", "file_path": item["summary"]}
+
+    return jsonify(
+        {
+            key: job.get(key)
+            for key in ("job_id", "status", "file_path", "error", "unchanged")
+            if job.get(key) is not None
         }
-        file_response = file_summaries_table.get_item(Key={"email": current_user})
+    )
 
-        if "Item" in file_response:
-            file_name = file_response["Item"]["summary"]
-            local_file_path = os.path.join(UPLOAD_FOLDER, os.path.basename(file_name))
 
-            if not os.path.exists(local_file_path):
-                logger.info(f"File not found locally. Downloading from S3: {file_name}")
-                download_file_to_local(file_name, local_file_path)
+# Flask route for chatting with GPT
 
-            if os.path.exists(local_file_path):
-                logger.info(f"Processing file for summary: {local_file_path}")
-                file_summary = summarize_file(local_file_path)
 
-                logger.debug(f"File summary generated: {file_summary}")
-            else:
-                logger.error(f"File still not found after download: {local_file_path}")
-                file_summary = "Error: File could not be retrieved."
+def get_file_item(current_user):
+    with span("dynamodb"):
+        return file_summaries_table.get_item(Key={"email": current_user}).get("Item")
 
+
+# Id of the single workbook of `Files` items written before portfolios
+LEGACY_FILE_ID = "default"
+
+
+def portfolio_files(item):
+    """The workbooks of a `Files` item: {file_id: {key, name, version, content_hash}}"""
+    if "files" in item:
+        return item["files"]
+    if "summary" not in item:
+        return {}
+    return {
+        LEGACY_FILE_ID: {
+            "key": item["summary"],
+            "name": os.path.basename(item["summary"]),
+            "version": item.get("timestamp"),
+            "content_hash": item.get("content_hash"),
+        }
+    }
+
+
+def get_portfolio(current_user):
+    """Returns the version and workbooks of the user's portfolio, or None.
+
+    The version changes with every upload or deletion; workbooks are
+    listed by name, each with its file_id, S3 key and own version.
+    """
+    item = get_file_item(current_user)
+    if item is None:
+        return None
+    files = portfolio_files(item)
+    if not files:
+        return None
+    return {
+        "version": item.get("timestamp"),
+        "files": sorted(
+            ({"file_id": file_id, **workbook} for file_id, workbook in files.items()),
+            key=lambda workbook: (workbook["name"], workbook["file_id"]),
+        ),
+    }
+
+
+def load_portfolio_prompt(current_user, user_message="", portfolio=None):
+    """Looks up the user's workbooks and returns their prompt data.
+
+    Returns (summary, rows): the per-version portfolio block and the rows
+    picked for this message, "" when the summary already has every row.
+    """
+    if portfolio is None:
+        portfolio = get_portfolio(current_user)
+    if portfolio is None:
+        return "No uploaded file found.", ""
+
+    try:
+        view = get_portfolio_view(current_user, portfolio)
+        if view is None:
+            logger.error(f"Portfolio files could not be downloaded: {current_user}")
+            return "Error: File could not be retrieved.", ""
+        summary = get_portfolio_summary(current_user, portfolio, view)
+        rows = ""
+        if not summary["complete"]:
+            rows, _ = view["index"].select_rows(user_message, summary["rows_budget"])
+    except (SpreadsheetBusy, UpstreamUnavailable):
+        raise
+    except Exception as e:
+        logger.error(f"Error reading file: {str(e)}")
+        return "Error: The uploaded workbooks could not be read.", ""
+
+    logger.debug(
+        f"Portfolio prompt: {len(summary['summary'])} chars, {len(rows)} chars of rows"
+    )
+    return summary["summary"], rows
+
+
+def save_chat_message(email, role, message):
+    """Saves one chat turn to DynamoDB, through the write-behind queue if enabled"""
+    item = {
+        "email": email,
+        "timestamp": int(time.time()),
+        "role": role,
+        "message": message,
+    }
+    with span("chat_save"):
+        if chat_writer is None:
+            chats_table.put_item(Item=item)
         else:
-            file_summary = "No uploaded file found."
+            item = chat_writer.put(item)
+    conversation_memory.record(email, role, message, int(item["timestamp"]))
+    return item
 
-        chats_table.put_item(Item=chat_item)
-        if not user_message:
-            return jsonify({"error": "No message provided"}), 400
 
-        # System instructions
-        system_instructions = """You are a real estate advisor.
-
-                Your primary task is to analyze property data and provide investment advice to users based on the following key metrics:
-
-                Loan-to-Value (LTV)
-                Projected Cash Flow
-                Rehab Costs
-                Loan Type
-                To ensure a thorough and accurate analysis, please ask users to upload their spreadsheet portfolio. Having a complete view of their property data allows you to provide more precise and personalized investment advice. Without the spreadsheet, analysis may be limited, and assumptions will need to be made.
-
-                For each question asked:
-
-                Request users to upload a spreadsheet of their real estate portfolio for a comprehensive assessment.
-                If the spreadsheet is not available, consider the provided data and prompt users for any missing key information (such as LTV, projected cash flow, rehab costs, or loan type).
-                If essential data is still missing, make reasonable assumptions based on typical real estate investment practices, and clearly inform the user about these assumptions (e.g., assuming an average LTV of 70% or average rehab costs). Let the user know that assumptions can limit the accuracy of the advice.
-                Structure your response as follows:
-
-                Summarize the property details provided, including any assumptions made.
-                Conclusion: Determine whether the property is a good investment or not, based on the data and assumptions.
-                Explanation: Offer a brief explanation of the recommendation, highlighting potential risk factors or advantages (e.g., high LTV, low cash flow, or favorable loan type).
-                If applicable, recommend further action or advice (e.g., suggestions for reducing risk or ways to improve investment potential).
-                To get the most accurate and detailed advice, uploading your spreadsheet is highly recommended. This allows for better understanding and eliminates the need for assumptions, ultimately improving the quality of the investment guidance provided."""
-        if file_summary != "":
-            system_instructions = f"""
-                You are a real estate investment advisor. The user has uploaded a portfolio of properties in an Excel (.xlsx) file. This file contains key financial and property data, such as:
-
-                1. **Property Information**:
-                - Property addresses (current and past).
-                - City, state, and neighborhood for each property.
-                
-                2. **Financial Details**:
-                - Purchase prices, sale prices, and market values.
-                - Total investment costs including purchase, holding, rehab, and sale-related costs.
-                - Projected cash flows, debt levels, and income streams.
-
-                3. **Mortgage and Debt Details**:
-                - Mortgage balances, Loan-to-Value (LTV) ratios.
-                - Loan types and financing information.
-                - Rehab costs and associated expenditures.
-
-                ### Key Rules for Response Generation
-
-                #### 1. **Data-Driven and Factually Accurate Responses**:
-                - Always base your answers on the **specific data provided** in the user's uploaded portfolio file.
-                - Do **not invent or guess financial figures**. Only use the provided numbers unless explicitly requested by the user to make estimates.
-                - When it comes to properties included in the uploaded portfolio, provide specific advice that is **tailored to the actual data**.
-                
-                #### 2. **Profit and Loss Clarity**:
-                - **Profit vs. Loss**: If a property is showing a **loss**, be explicit about this. Do not mention "profit" if the numbers show a loss.
-                - If calculating profit/loss:
-                    - The formula to use is: **Net Profit or Loss = Property Sale Price - (Total Investment Cost + Sale Costs)**.
-                    - If there is a column named "**Net Profit or Loss**", use that value directly instead of recalculating.
-                - **Communicate Clearly**: If a property is showing negative profitability, use terms like **“incurring a loss”** or **“loss of $X”** to be direct.
-
-                #### 3. **Handling Data from the Portfolio**:
-                - For any response involving **financial values**, always check if the specific data already exists in the uploaded file.
-                - For each property, include the context: **purchase price**, **sale price**, **rehab costs**, **debt**, etc.
-                - **Cross-Validation**: If multiple related properties exist, use that information to provide richer insights (e.g., comparing similar properties in different cities).
-
-                #### 4. **Portfolio Comparison and Analysis**:
-                - If the user asks about a property that already exists in their portfolio, compare it to the uploaded data.
-                - **Highlight Risks or Opportunities**: Identify any **similarities or deviations** between the property in question and the user’s current investments.
-                - If the user asks about a **new property**, use their current finances to determine if the purchase is viable. Identify potential risks or benefits based on **current financial health**.
-
-                #### 5. **Queries Outside of Portfolio Scope**:
-                - If the user is asking about a property or scenario that is not included in their uploaded file, take into account their **financial status and capacity** as indicated by the uploaded data.
-                - Provide clear statements when the data needed to answer a question is **missing or incomplete**. Offer to help based on available information.
-                
-                #### 6. **Answering Questions About the Property Portfolio**:
-                - Always consider **contextual memory** and remember the details from the uploaded file throughout the conversation.
-                - Be explicit: **Reference specific properties**, addresses, or financial values provided in the file when answering questions.
-                - **Avoid Guessing or Ambiguity**: If the answer is not in the provided data, ask clarifying questions rather than making unsupported statements.
-
-                #### 7. **Handling City-Based Questions**:
-                - When users ask questions about **city-specific profitability**, focus only on the properties that have clear city labels.
-                - Avoid including properties with **unknown or missing city names** in these calculations. If there are properties without city names, explicitly mention that you can't include them because their location is **not specified**.
-                - Sort cities based on the **total profit/loss** from the properties in that city:
-                    - If there is a **profit** from a city, explicitly state that this city is **profitable**.
-                    - If a city has **only loss-making properties**, indicate clearly that this city is currently showing a **negative return** overall.
-                
-                ### 8. **Most Profitable or Loss Making Property Consistency**:
-                - When identifying the **most profitable property**, ensure that the calculation always uses the **Net Profit or Loss** column from the uploaded portfolio and return the highest value for most profit making and check for the lowest value for most Loss Making.
-                - If asked repeatedly, **always provide the same property** as the most profitable based on the data.
-                - If multiple properties have similar profit values, explicitly mention this to the user, and avoid changing the answer in subsequent responses unless explicitly asked for further analysis.
-                
-                #### 9. **Extracted Data Summary**:
-                Below is the extracted data summary for reference: 
-                {file_summary}
-
-                Use this summary to provide responses, ensuring all financial advice, calculations, and insights are fully backed by data within the uploaded file.
-
-                #### 9. **Consistency and Transparency**:
-                - Be consistent in how you represent financial numbers:
-                    - Use **commas** for thousands separators.
-                    - Use **two decimal places** for currency figures.
-                - **Detail Financial Figures** in every response, even if it was mentioned earlier in the conversation, to ensure complete transparency.
-                
-                #### 10. **Detailed Clarification**:
-                - When providing advice, always provide **detailed reasoning** behind your answers. Include:
-                    - **Purchase price, sale price**, and **net profit or loss** for every property referenced.
-                    - Any **assumptions** or **additional context**.
-                - Clearly state if **additional information** is required to complete an analysis.
-
-                ### Example Behavior for Common User Questions
-
-                #### **Profitability of Cities**:
-                - If a user asks for the **most profitable city** based on their portfolio, only consider properties with **city labels**.
-                - Provide a list sorted by profitability:
-                    - Clearly indicate if any cities show **only loss-making properties**.
-                    - Use clear statements such as **“City X is the most profitable, with an average profit of $Y”** or **“City Y has shown overall losses with a total loss of $Z”**.
-
-                #### **IMPORTANT** 
-                # **Overall Property Profit**:
-                - If a user asks for **overall profit** on a property:
-                    - If the **Net Profit or Loss (Auto Calculated)** value is available in the data, use it.
-                    - If the **property has a loss**, be very explicit: say **“The property at X has incurred a loss of $Y”**.
-                    - Avoid using profit terms if the calculation results in a loss. Use direct loss-related language.
-
-                ### Goal
-                Your primary goal is to help users make well-informed, data-driven investment decisions based on the properties and financial data they have uploaded. Always refer to the provided data, provide specific numbers, avoid making unsupported calculations, and make sure that all advice is grounded in the actual data available. Transparency and accuracy are key — any figures or statements must be backed by the user's portfolio details.
-                    
-                """
-
-        messages = create_prompt(system_instructions, user_message)
-        logger.debug("Sending request to OpenAI API")
-        # Make the API call to OpenAI
+def summarize_conversation(previous_summary, turns):
+    """Folds older chat turns into the rolling conversation summary"""
+    transcript = "\n".join(f"{turn['role']}: {turn['message']}" for turn in turns)
+    with openai_breaker:
         response = client.chat.completions.create(
-            model="chatgpt-4o-latest",  # Use gpt-4 or another model you have access to
-            # model="gpt-4o-mini",
-            # model="gpt-4o-mini-2024-07-18",
-            messages=messages,
-            temperature=1,
-            max_tokens=1000,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0,
+            model=SUMMARY_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You maintain a running summary of a conversation "
+                    "between a real estate investor and their advisor. Update the "
+                    "summary with the new turns. Keep property addresses, figures, "
+                    "decisions and open questions; stay under 200 words.",
+                },
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{previous_summary or '(none)'}\n\n"
+                    f"New turns:\n{transcript}",
+                },
+            ],
+            temperature=0,
+            max_tokens=400,
         )
+    return response.choices[0].message.content
 
-        reply = response.choices[0].message.content
 
-        logger.info("Chat response received from OpenAI")
-        # Save chat to DynamoDB
-        chat_item = {
-            "email": current_user,
-            "timestamp": int(time.time()),  # Save the current timestamp
-            "role": "assistant",
-            "message": reply,
-        }
+def portfolio_version(portfolio):
+    return None if portfolio is None else portfolio["version"]
+
+
+def cached_reply(current_user, user_message, portfolio, context=""):
+    """Returns a cached answer to the question for this upload and conversation"""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    reply = response_cache.get(
+        current_user, portfolio_version(portfolio), user_message, context
+    )
+    if reply is not None:
+        logger.info("Chat reply served from the response cache")
+    return reply
+
+
+def cache_reply(current_user, user_message, portfolio, reply, context=""):
+    """Caches a reply under the context plan_reply took"""
+    if RESPONSE_CACHE_ENABLED:
+        response_cache.put(
+            current_user, portfolio_version(portfolio), user_message, reply, context
+        )
+
+
+def load_recent_turns(email):
+    return load_chat_history(email, limit=HISTORY_LOAD_LIMIT)["chats"]
+
+
+def load_turns_since(email, since):
+    return load_chat_history(email, limit=HISTORY_LOAD_LIMIT, since=since)["chats"]
+
+
+conversation_memory = ConversationMemory(
+    load_recent=load_recent_turns,
+    summarize=summarize_conversation,
+    load_since=load_turns_since,
+)
+
+
+def route_question(current_user, user_message, portfolio):
+    """Picks how to answer a question, see model_router.
+
+    The router sees the portfolio metrics so it can answer from them
+    directly; they come from the same cached view the prompt is built from.
+    """
+    metrics = None
+    if portfolio is not None:
+        try:
+            view = get_portfolio_view(current_user, portfolio)
+            # Figures that leave out an unreadable workbook aren't direct answers
+            if view is not None and not view["unreadable"]:
+                metrics = view["metrics"]
+        except (SpreadsheetBusy, UpstreamUnavailable):
+            raise
+        except Exception as e:
+            logger.error(f"Could not load metrics for routing: {e}")
+    route = chat_router.route(user_message, metrics)
+    logger.info(f"Chat question routed to {route['route']}")
+    return route
+
+
+def plan_reply(current_user, user_message):
+    """Returns (portfolio, reply, route) for a question.
+
+    `reply` is a cached or directly computed answer, or None when the
+    model has to be called; `route` then says which one, and its "context"
+    is what to cache the model's reply under: the conversation fingerprint
+    for follow-ups, "" for questions that stand on their own.
+    """
+    portfolio = get_portfolio(current_user)
+    context = ""
+    if RESPONSE_CACHE_ENABLED and depends_on_conversation(user_message):
+        context = conversation_memory.fingerprint(current_user)
+    reply = cached_reply(current_user, user_message, portfolio, context)
+    if reply is not None:
+        return portfolio, reply, None
+    route = {
+        **route_question(current_user, user_message, portfolio),
+        "context": context,
+    }
+    if route["reply"] is not None:
+        cache_reply(current_user, user_message, portfolio, route["reply"], context)
+    return portfolio, route["reply"], route
+
+
+def chat_completion_kwargs(messages, stream=False, route=None):
+    """Arguments for the OpenAI chat completions API with the app's settings.
+
+    `route` (from route_question) picks the model and reply length; without
+    one the large model is used.
+    """
+    route = route or chat_router.routes["large"]
+    return dict(
+        model=route["model"],
+        messages=messages,
+        temperature=1,
+        max_tokens=route["max_tokens"],
+        top_p=1,
+        frequency_penalty=0,
+        presence_penalty=0,
+        stream=stream,
+        # Streams report token usage in a final chunk without choices
+        **({"stream_options": {"include_usage": True}} if stream else {}),
+    )
+
+
+def create_chat_completion(messages, stream=False, route=None):
+    """Calls the OpenAI chat completions API with the app's settings"""
+    with span("openai"), openai_breaker:
+        return client.chat.completions.create(
+            **chat_completion_kwargs(messages, stream, route)
+        )
+
+
+def record_token_usage(messages, reply, usage=None):
+    """Records prompt/completion token counts, estimated when not reported.
+
+    Also records how many prompt tokens the provider served from its prefix
+    cache, which is only known from a reported usage.
+    """
+    if usage is not None:
+        prompt, completion = usage.prompt_tokens, usage.completion_tokens
+        cached = prompts.cached_prompt_tokens(usage)
+        telemetry.cached_prompt_tokens.observe(cached)
+        telemetry.uncached_prompt_tokens.observe(prompt - cached)
+        logger.info(f"Prompt tokens: {prompt} ({cached} cached)")
+    else:
+        prompt = sum(count_tokens(message["content"]) + 4 for message in messages)
+        completion = count_tokens(reply)
+    telemetry.prompt_tokens.observe(prompt)
+    telemetry.completion_tokens.observe(completion)
+
+
+@api.route("/api/chat", methods=["POST"])
+@jwt_required()
+def chat_with_gpt():
+    """Handles chat requests, retrieves file if needed"""
+    try:
+        data = request.json
+        user_message = data.get("message", "")
+        current_user = get_jwt_identity()
+
+        portfolio, reply, route = plan_reply(current_user, user_message)
+        if reply is None:
+            messages = build_chat_messages(current_user, user_message, portfolio)
+
+        save_chat_message(current_user, "user", user_message)
+        if not user_message:
+            return jsonify({"error": "No message provided"}), 400
 
-        chats_table.put_item(Item=chat_item)
+        if reply is None:
+            logger.debug("Sending request to OpenAI API")
+            # Make the API call to OpenAI
+            response = create_chat_completion(messages, route=route)
+
+            reply = response.choices[0].message.content
+
+            logger.info("Chat response received from OpenAI")
+            record_token_usage(messages, reply, response.usage)
+            cache_reply(current_user, user_message, portfolio, reply, route["context"])
+        # Save chat to DynamoDB
+        save_chat_message(current_user, "assistant", reply)
         # Return the chatbot's response
         return jsonify({"reply": reply})
 
+    except (SpreadsheetBusy, UpstreamUnavailable):
+        raise
     except Exception as e:
         logger.error(f"Error during chat handling: {e}")
         print(f"Error occurred: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/chats", methods=["GET"])
+def sse_event(data, event=None):
+    """Formats one Server-Sent Event"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+@api.route("/api/chat/stream", methods=["POST"])
+@jwt_required()
+def stream_chat_with_gpt():
+    """Same as /api/chat but streams reply tokens as Server-Sent Events.
+
+    Emits `data: {"token": ...}` events while the model generates, then a
+    final `done` event carrying the full reply once it has been saved.
+    """
+    data = request.json
+    user_message = data.get("message", "")
+    current_user = get_jwt_identity()
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
+
+    try:
+        portfolio, reply, route = plan_reply(current_user, user_message)
+        if reply is None:
+            messages = build_chat_messages(current_user, user_message, portfolio)
+        save_chat_message(current_user, "user", user_message)
+        if reply is None:
+            logger.debug("Sending streaming request to OpenAI API")
+            requested = time.perf_counter()
+            stream = create_chat_completion(messages, stream=True, route=route)
+    except (SpreadsheetBusy, UpstreamUnavailable):
+        raise
+    except Exception as e:
+        logger.error(f"Error during chat handling: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    def replay():
+        save_chat_message(current_user, "assistant", reply)
+        yield sse_event({"token": reply})
+        yield sse_event({"reply": reply}, event="done")
+
+    def generate():
+        parts = []
+        usage = None
+        started = time.perf_counter()
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    if not parts:
+                        telemetry.record(
+                            "openai_first_token", time.perf_counter() - requested
+                        )
+                    parts.append(token)
+                    yield sse_event({"token": token})
+
+            reply = "".join(parts)
+            logger.info("Chat stream completed from OpenAI")
+            telemetry.record("openai_stream", time.perf_counter() - started)
+            record_token_usage(messages, reply, usage)
+            save_chat_message(current_user, "assistant", reply)
+            cache_reply(current_user, user_message, portfolio, reply, route["context"])
+            yield sse_event({"reply": reply}, event="done")
+        except Exception as e:
+            logger.error(f"Error during chat streaming: {e}")
+            openai_breaker.record_error(e)
+            yield sse_event({"error": str(e)}, event="error")
+        finally:
+            stream.close()
+
+    return Response(
+        stream_with_context(generate() if reply is None else replay()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "50"))
+CHAT_PAGE_MAX = 200
+CHAT_FIELDS = ("timestamp", "role", "message")
+
+
+def parse_history_args(args):
+    """Validates the /api/chats query string; raises ValueError if invalid"""
+
+    def integer(name):
+        value = args.get(name)
+        if value in (None, ""):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"'{name}' must be an integer timestamp")
+
+    limit = integer("limit")
+    if limit is None:
+        limit = CHAT_PAGE_SIZE
+    if not 1 <= limit <= CHAT_PAGE_MAX:
+        raise ValueError(f"'limit' must be between 1 and {CHAT_PAGE_MAX}")
+
+    before = integer("before")
+    since = integer("since")
+    if since is None:
+        since = integer("after")
+    if before is not None and since is not None:
+        raise ValueError("Use either 'before' or 'since'/'after', not both")
+
+    fields = CHAT_FIELDS
+    if args.get("fields"):
+        fields = tuple(f.strip() for f in args["fields"].split(",") if f.strip())
+        unknown = [f for f in fields if f not in CHAT_FIELDS]
+        if unknown or "timestamp" not in fields:
+            allowed = ", ".join(CHAT_FIELDS)
+            raise ValueError(f"'fields' must include timestamp and only use: {allowed}")
+
+    return {"limit": limit, "before": before, "since": since, "fields": fields}
+
+
+def load_chat_history(
+    current_user, limit=CHAT_PAGE_SIZE, before=None, since=None, fields=CHAT_FIELDS
+):
+    """Returns one page of the user's chat history, sorted by timestamp.
+
+    Without a cursor this is the latest `limit` messages. `before` pages
+    backwards from a timestamp, and `since` returns only messages newer
+    than a timestamp so clients can poll incrementally. Every mode reads
+    at most `limit` items, following LastEvaluatedKey across DynamoDB's
+    1 MB pages, so the cost doesn't grow with the size of the history.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    key_condition = Key("email").eq(current_user)
+    if before is not None:
+        key_condition = key_condition & Key("timestamp").lt(before)
+    elif since is not None:
+        key_condition = key_condition & Key("timestamp").gt(since)
+
+    query = {
+        "KeyConditionExpression": key_condition,
+        # Walk forwards for incremental polling, backwards for latest/older pages
+        "ScanIndexForward": since is not None,
+        "ProjectionExpression": ", ".join(f"#{field}" for field in fields),
+        "ExpressionAttributeNames": {f"#{field}": field for field in fields},
+    }
+
+    items = []
+    has_more = False
+    while True:
+        query["Limit"] = limit - len(items)
+        with span("dynamodb"):
+            response = chats_table.query(**query)
+        items.extend(response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+        if last_key is None:
+            break
+        if len(items) >= limit:
+            has_more = True
+            break
+        query["ExclusiveStartKey"] = last_key
+
+    if since is None:
+        items.reverse()
+
+    timestamps = [int(item["timestamp"]) for item in items]
+    return {
+        "chats": items,
+        "hasMore": has_more,
+        "cursor": {
+            "before": timestamps[0] if timestamps else before,
+            "since": timestamps[-1] if timestamps else since,
+        },
+    }
+
+
+@api.route("/api/chats", methods=["GET"])
 @jwt_required()
 def get_chats():
     try:
         current_user = get_jwt_identity()
-        # Query DynamoDB for user's chat history, sorted by timestamp
-        response = chats_table.query(
-            KeyConditionExpression=Key("email").eq(current_user),
-            ScanIndexForward=True,  # Sort by timestamp ascending
-        )
-        items = response.get("Items", [])
-        return jsonify({"chats": items}), 200
+        try:
+            history_args = parse_history_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify(load_chat_history(current_user, **history_args)), 200
 
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/dashboard", methods=["GET"])
+@api.route("/dashboard", methods=["GET"])
 @jwt_required()
 def dashboard(current_user):
     return jsonify({"message": f"Welcome {current_user}!"}), 200
 
 
-@app.route("/api/chartdata", methods=["GET"])
+def get_chart_payloads(current_user, portfolio):
+    """Returns every chart payload of a portfolio, built once per version.
+
+    Returns None when a workbook could not be downloaded.
+    """
+    view = get_portfolio_view(current_user, portfolio)
+    if view is None:
+        return None
+    if view["charts"] is None:
+        raise ValueError(view["charts_error"])
+    return view["charts"]
+
+
+def load_chart_data(current_user, selection=None, if_none_match=None):
+    """Builds the dashboard chart payloads.
+
+    Returns (payload, status, etag). When `if_none_match` already names the
+    current ETag the status is 304 and the workbooks are not touched.
+    """
+
+    # 🔹 Retrieve the workbooks from DynamoDB instead of assuming a local path
+    portfolio = get_portfolio(current_user)
+    if portfolio is None:
+        logger.error("No file found for user in DynamoDB.")
+        return {"error": "No uploaded file found."}, 404, None
+
+    etag = chart_etag(current_user, portfolio_signature(portfolio), selection)
+    if etag_matches(if_none_match, etag):
+        return None, 304, etag
+
+    logger.info(f"Extracting charts from {len(portfolio['files'])} workbooks")
+
+    try:
+        # Load the charts computed from the ingested sheets (once per upload);
+        # workbooks without a current local copy are downloaded from S3
+        charts = get_chart_payloads(current_user, portfolio)
+        if charts is None:
+            return {"error": "Error downloading file from S3."}, 500, None
+        return select_charts(charts, selection), 200, etag
+
+    except (SpreadsheetBusy, UpstreamUnavailable):
+        raise
+    except Exception as e:
+        logger.error(f"Error processing chart data: {e}")
+        return {"error": "Error extracting data from Excel file."}, 500, None
+
+
+@api.route("/api/chartdata", methods=["GET"])
 @jwt_required()
 def get_chart_data():
     current_user = get_jwt_identity()
     logger.info(f"CHARTS DATA REQUEST")
+    try:
+        selection = parse_selection(request.args.get("charts"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # 🔹 Retrieve file path from DynamoDB instead of assuming a local path
-    file_response = file_summaries_table.get_item(Key={"email": current_user})
+    response_data, status, etag = load_chart_data(
+        current_user, selection, request.headers.get("If-None-Match")
+    )
+    if status == 304:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(response_data)
+        response.status_code = status
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@api.route("/api/portfolio/metrics", methods=["GET"])
+@jwt_required()
+def get_metrics():
+    """Returns the precomputed profit/loss aggregates of all the user's workbooks"""
+    try:
+        current_user = get_jwt_identity()
+        portfolio = get_portfolio(current_user)
+        if portfolio is None:
+            return jsonify({"error": "No uploaded file found."}), 404
 
-    if "Item" not in file_response:
-        logger.error("No file found for user in DynamoDB.")
-        return jsonify({"error": "No uploaded file found."}), 404
+        view = get_portfolio_view(current_user, portfolio)
+        if view is None:
+            return jsonify({"error": "Error downloading file from S3."}), 500
 
-    s3_file_path = file_response["Item"]["summary"]  # 🔹 Retrieve S3 path
-    local_folder = os.path.join(
-        os.getcwd(), "filestorage"
-    )  # ✅ Store in backend/filestorage
-    local_file_path = os.path.join(local_folder, os.path.basename(s3_file_path))
+        return jsonify({**view["metrics"], "unreadable": view["unreadable"]}), 200
+    except (SpreadsheetBusy, UpstreamUnavailable):
+        raise
+    except Exception as e:
+        logger.error(f"Error computing portfolio metrics: {e}")
+        return jsonify({"error": str(e)}), 500
 
-    logger.info(f"Extracting file for charts from {s3_file_path}")
 
-    # 🔹 Ensure filestorage folder exists
-    if not os.path.exists(local_folder):
-        os.makedirs(local_folder, exist_ok=True)
+@api.before_app_request
+def start_request_trace():
+    telemetry.start_trace()
 
-    # 🔹 Check if file exists locally; if not, download from S3
-    if not os.path.exists(local_file_path):
-        logger.info(f"Downloading file from S3: {s3_file_path} → {local_file_path}")
-        try:
-            s3_client.download_file(bucket_name, s3_file_path, local_file_path)
-            logger.info(f"File downloaded successfully: {local_file_path}")
-        except Exception as e:
-            logger.error(f"Failed to download file from S3: {e}")
-            return jsonify({"error": "Error downloading file from S3."}), 500
 
-    try:
-        # Load the Excel file from the downloaded local file
-        logger.info("Loading Excel file")
-        sold_flips_sheet = pd.read_excel(
-            local_file_path, sheet_name="Sold Flips", header=1
-        )
+@api.after_app_request
+def add_server_timing(response):
+    """Adds the Server-Timing header and records the request latency"""
+    trace = telemetry.current_trace()
+    if trace is None:
+        return response
+    header, total = telemetry.server_timing(trace)
+    response.headers["Server-Timing"] = header
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    telemetry.request_seconds.observe(
+        total, method=request.method, route=rule, status=response.status_code
+    )
+    return response
 
-        # 📊 History Chart Data (Sold Flips)
-        logger.info("Extracting History Chart Data")
-        history_data = sold_flips_sheet[["Sold Date", "Property Sale Price"]].dropna()
-        history_data["Property Sale Price"] = (
-            history_data["Property Sale Price"]
-            .replace(r"[\(\)\$,]", "", regex=True)
-            .astype(float)
-        )
-        history_chart = {
-            "labels": history_data["Sold Date"].dt.strftime("%Y-%m-%d").tolist(),
-            "data": history_data["Property Sale Price"].tolist(),
-        }
 
-        # 📊 Scatter Chart Data (Inventory vs Price)
-        logger.info("Extracting Scatter Chart Data")
-        inventory_data = sold_flips_sheet[
-            ["Property Address", "Property Purchase Price"]
-        ].dropna()
-        scatter_chart = {
-            "labels": inventory_data["Property Address"].tolist(),
-            "data": inventory_data["Property Purchase Price"]
-            .replace(r"[\(\)\$,]", "", regex=True)
-            .astype(float)
-            .tolist(),
-        }
+def cache_stats():
+    stats = [
+        ("workbook", workbook_cache.stats()),
+        ("response", response_cache.stats()),
+        ("file", file_cache.stats()),
+        ("user", user_cache.stats()),
+    ]
+    for cache, values in stats:
+        for name, value in values.items():
+            yield (("cache", cache), ("stat", name)), value
 
-        # 📊 Cash Flow Chart Data (Kiavi Loans)
-        logger.info("Extracting Cash Flow Chart Data")
-        kiavi_loans_sheet = pd.read_excel(
-            local_file_path, sheet_name="Kiavi Loans", header=2
-        )
-        kiavi_loans_sheet = kiavi_loans_sheet.loc[
-            :, ~kiavi_loans_sheet.columns.str.contains("^Unnamed")
-        ]
-        cash_flow_data = kiavi_loans_sheet[["Address", "Total"]].dropna()
-        cash_flow_data["Total"] = (
-            cash_flow_data["Total"].replace(r"[\(\)\$,]", "", regex=True).astype(float)
-        )
-        cash_flow_chart = {
-            "labels": cash_flow_data["Address"].tolist(),
-            "data": cash_flow_data["Total"].tolist(),
-        }
 
-        # 📊 Lead Channel Chart Data (Flip Inventory Sheet)
-        logger.info("Extracting Lead Channel Chart Data")
-        flip_inventory_sheet = pd.read_excel(
-            local_file_path, sheet_name="Flip Inventory Sheet", header=1
-        )
-        lead_channel_data = flip_inventory_sheet[["Address", "Lead"]].dropna()
-        lead_channel_data = lead_channel_data[
-            pd.to_numeric(lead_channel_data["Lead"], errors="coerce").isna()
-        ]
-        lead_counts = lead_channel_data["Lead"].value_counts()
-        lead_channel_chart = {
-            "labels": lead_counts.index.tolist(),
-            "data": lead_counts.tolist(),
-        }
+def worker_stats():
+    yield (("pool", "spreadsheet"), ("stat", "rejected")), spreadsheet_pool.rejected
+    yield (("pool", "spreadsheet"), ("stat", "timeouts")), spreadsheet_pool.timeouts
+    yield (("pool", "password"), ("stat", "rejected")), password_hashing.rejected
+    yield (("pool", "password"), ("stat", "rehashed")), password_hashing.rehashed
+    if chat_writer is not None:
+        yield (("pool", "chat_writer"), ("stat", "written")), chat_writer.written
+        yield (("pool", "chat_writer"), ("stat", "dropped")), chat_writer.dropped
 
-        # ✅ Combine all chart data into one response
-        response_data = {
-            "historyChart": history_chart,
-            "scatterChart": scatter_chart,
-            "cashFlowChart": cash_flow_chart,
-            "leadChannelChart": lead_channel_chart,
-        }
 
-        return jsonify(response_data), 200
+telemetry.registry.gauges(
+    "rentwise_cache", "Cache sizes and hit/miss counters", cache_stats
+)
+telemetry.registry.gauges(
+    "rentwise_workers", "Background worker counters", worker_stats
+)
+telemetry.registry.gauges(
+    "rentwise_upstream_circuit",
+    "Circuit breaker state (open=1) and counters per upstream",
+    lambda: (
+        ((("upstream", breaker.name), ("stat", name)), value)
+        for breaker in (openai_breaker, dynamodb_breaker, s3_breaker)
+        for name, value in breaker.stats().items()
+    ),
+)
+telemetry.registry.gauges(
+    "rentwise_chat_routes_total",
+    "Chat questions per route (direct, small or large model)",
+    lambda: (
+        ((("route", route),), count) for route, count in chat_router.stats().items()
+    ),
+    kind="counter",
+)
 
-    except Exception as e:
-        logger.error(f"Error processing chart data: {e}")
-        return jsonify({"error": "Error extracting data from Excel file."}), 500
+
+@api.route("/metrics")
+def metrics():
+    """Prometheus metrics"""
+    return (
+        telemetry.registry.render(),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
 
 
 # Run the app
-@app.route("/health")
+@api.route("/health")
 def health():
     return "OK", 200
 
 
+def create_app():
+    """Builds the Flask app; cheap, and safe to call before forking workers"""
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
+    jwt.init_app(app)
+    CORS(app)
+    app.register_blueprint(api)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    return app
+
+
+# Recently used local workbooks whose prepared results warm_up() precomputes
+WARM_UP_WORKBOOKS = int(os.getenv("WARM_UP_WORKBOOKS", "8"))
+
+
+def build_clients():
+    """Creates this process's outbound clients ahead of its first request"""
+    for lazy_client in (client, dynamodb, users_table, chats_table, s3_client):
+        lazy_client.get()
+
+
+def warm_up():
+    """Pays the first-request costs up front: imports, clients and hot workbooks.
+
+    Run it once before serving; in a preloading master the results are
+    shared with every forked worker. Workbooks are prepared inline rather
+    than in the spreadsheet pool so that no processes start before a fork.
+    """
+    started = time.perf_counter()
+    import_spreadsheet_modules()
+    count_tokens("warm up")
+    build_clients()
+
+    prepared = 0
+    for path, version in file_cache.recent(WARM_UP_WORKBOOKS):
+        if version is None or workbook_cache.get(path, version, "prepared"):
+            continue
+        try:
+            workbook_cache.put(path, version, "prepared", prepare_workbook(path))
+            prepared += 1
+        except Exception as e:
+            logger.warning(f"Could not warm up {path}: {e}")
+    logger.info(
+        f"Warmed up in {time.perf_counter() - started:.2f}s, "
+        f"{prepared} workbooks prepared"
+    )
+
+
 if __name__ == "__main__":
     logger.info("Starting Flask server in debug mode")
+    app = create_app()
+    warm_up()
+    spreadsheet_pool.start()
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,418 @@
+"""Asyncio serving path for the backend.
+
+The chat, chat history, chart and sign-in/sign-up endpoints are handled
+natively on the event loop: OpenAI is called with the async client, the
+blocking boto3 and spreadsheet work runs on a bounded thread pool and
+password hashing on its own pool, so a request waiting on I/O no longer
+pins a worker thread. Every other route falls through to the
+Flask app. Run with:
+
+    hypercorn --config hypercorn.toml asgi:app
+"""
+
+import asyncio
+import contextvars
+import json
+import time
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs
+
+from flask_jwt_extended import decode_token
+from hypercorn.middleware import AsyncioWSGIMiddleware
+
+import app as backend
+import outbound
+import telemetry
+from telemetry import span
+from charts import parse_selection
+from outbound import PerProcess, UpstreamUnavailable
+from passwords import HashingBusy
+from spreadsheet_pool import SpreadsheetBusy
+
+logger = logging.getLogger(__name__)
+
+flask_app = backend.create_app()
+io_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ASGI_IO_THREADS", "64")),
+    thread_name_prefix="asgi-io",
+)
+async_client = PerProcess(
+    lambda: outbound.async_openai_client(
+        api_key=backend.API_KEY,
+        organization=backend.ORGANIZATION,
+        project=backend.PROJECT_ID,
+    )
+)
+wsgi_app = AsyncioWSGIMiddleware(
+    flask_app, max_body_size=int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, payload):
+        super().__init__(payload)
+        self.status = status
+        self.payload = payload
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.body = body
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        self.args = {
+            key: values[-1]
+            for key, values in parse_qs(scope.get("query_string", b"").decode()).items()
+        }
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, {"error": "Invalid JSON body"})
+
+    def identity(self):
+        """Returns the JWT identity, mirroring @jwt_required()"""
+        authorization = self.headers.get("authorization", "")
+        if not authorization.startswith("Bearer "):
+            raise HTTPError(401, {"msg": "Missing Authorization Header"})
+        try:
+            with flask_app.app_context():
+                return decode_token(authorization[len("Bearer ") :])["sub"]
+        except Exception as e:
+            raise HTTPError(401, {"msg": str(e)})
+
+
+async def run_io(func, *args):
+    """Runs blocking boto3/pandas work on the bounded I/O pool"""
+    # Carry the request's trace over so spans in the thread are counted
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        io_executor, partial(context.run, func, *args)
+    )
+
+
+def response_headers(content_type):
+    return [
+        (b"content-type", content_type.encode("latin-1")),
+        (b"access-control-allow-origin", b"*"),
+    ]
+
+
+async def send_json(send, payload, status=200, extra_headers=()):
+    body = flask_app.json.dumps(payload).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": response_headers("application/json") + list(extra_headers),
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def run_hashing(submit, *args):
+    """Awaits password hashing on its own pool without holding an I/O thread"""
+    with span("password_hash"):
+        future = submit(*args)
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), backend.password_hashing.timeout
+            )
+        except asyncio.TimeoutError:
+            raise HashingBusy("Password hashing is overloaded, try again shortly")
+
+
+def issue_token(email):
+    with flask_app.app_context():
+        return backend.generate_token(email)
+
+
+async def signup(request, send):
+    data = request.json()
+    logger.info(f"Received sign-up request for email: {data.get('email')}")
+    username = data.get("name")
+    email = data.get("email")
+    password = data.get("password")
+    cached, user = backend.user_cache.get(email)
+    if cached and user is not None:
+        logger.warning(f"User with email {email} already exists")
+        raise HTTPError(400, {"message": "User already exists"})
+
+    hashed_password = await run_hashing(backend.password_hashing.submit_hash, password)
+    if not await run_io(backend.create_user, username, email, hashed_password):
+        logger.warning(f"User with email {email} already exists")
+        raise HTTPError(400, {"message": "User already exists"})
+    logger.info(f"User {email} registered successfully")
+    await send_json(
+        send,
+        {"message": "User registered successfully", "token": issue_token(email)},
+        201,
+    )
+
+
+async def signin(request, send):
+    data = request.json()
+    logger.info(f"Received sign-in request for email: {data.get('email')}")
+    email = data.get("email")
+    password = data.get("password")
+
+    user = await run_io(backend.find_user, email)
+    if not user:
+        logger.warning(f"User with email {email} not found")
+        raise HTTPError(404, {"message": "User not found"})
+
+    valid, new_hash = await run_hashing(
+        backend.password_hashing.submit_verify, user["password"], password
+    )
+    if not valid:
+        logger.warning(f"Invalid credentials for email: {email}")
+        raise HTTPError(403, {"message": "Invalid credentials"})
+    if new_hash is not None:
+        await run_io(backend.store_password_hash, user, new_hash)
+
+    await send_json(
+        send,
+        {"token": issue_token(user["email"]), "userName": user.get("user_id", email)},
+    )
+
+
+async def chat_with_gpt(request, send):
+    data = request.json()
+    user_message = data.get("message", "")
+    current_user = request.identity()
+
+    portfolio, reply, route = await run_io(
+        backend.plan_reply, current_user, user_message
+    )
+    if reply is None:
+        messages = await run_io(
+            backend.build_chat_messages, current_user, user_message, portfolio
+        )
+    await run_io(backend.save_chat_message, current_user, "user", user_message)
+    if not user_message:
+        raise HTTPError(400, {"error": "No message provided"})
+
+    if reply is None:
+        with span("openai"), backend.openai_breaker:
+            response = await async_client.chat.completions.create(
+                **backend.chat_completion_kwargs(messages, route=route)
+            )
+        reply = response.choices[0].message.content
+
+        logger.info("Chat response received from OpenAI")
+        backend.record_token_usage(messages, reply, response.usage)
+        backend.cache_reply(
+            current_user, user_message, portfolio, reply, route["context"]
+        )
+    await run_io(backend.save_chat_message, current_user, "assistant", reply)
+    await send_json(send, {"reply": reply})
+
+
+async def stream_chat_with_gpt(request, send):
+    data = request.json()
+    user_message = data.get("message", "")
+    current_user = request.identity()
+    if not user_message:
+        raise HTTPError(400, {"error": "No message provided"})
+
+    portfolio, reply, route = await run_io(
+        backend.plan_reply, current_user, user_message
+    )
+    if reply is None:
+        messages = await run_io(
+            backend.build_chat_messages, current_user, user_message, portfolio
+        )
+    await run_io(backend.save_chat_message, current_user, "user", user_message)
+    if reply is None:
+        requested = time.perf_counter()
+        with span("openai"), backend.openai_breaker:
+            stream = await async_client.chat.completions.create(
+                **backend.chat_completion_kwargs(messages, stream=True, route=route)
+            )
+
+    headers = response_headers("text/event-stream")
+    headers.append((b"cache-control", b"no-cache"))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+    async def send_event(data, event=None):
+        body = backend.sse_event(data, event).encode("utf-8")
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    if reply is not None:
+        await run_io(backend.save_chat_message, current_user, "assistant", reply)
+        await send_event({"token": reply})
+        await send_event({"reply": reply}, event="done")
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    parts = []
+    usage = None
+    started = time.perf_counter()
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                if not parts:
+                    telemetry.record(
+                        "openai_first_token", time.perf_counter() - requested
+                    )
+                parts.append(token)
+                await send_event({"token": token})
+
+        reply = "".join(parts)
+        logger.info("Chat stream completed from OpenAI")
+        telemetry.record("openai_stream", time.perf_counter() - started)
+        backend.record_token_usage(messages, reply, usage)
+        await run_io(backend.save_chat_message, current_user, "assistant", reply)
+        backend.cache_reply(
+            current_user, user_message, portfolio, reply, route["context"]
+        )
+        await send_event({"reply": reply}, event="done")
+    except Exception as e:
+        logger.error(f"Error during chat streaming: {e}")
+        backend.openai_breaker.record_error(e)
+        await send_event({"error": str(e)}, event="error")
+    finally:
+        await stream.close()
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def get_chats(request, send):
+    current_user = request.identity()
+    try:
+        history_args = backend.parse_history_args(request.args)
+    except ValueError as e:
+        raise HTTPError(400, {"error": str(e)})
+
+    payload = await run_io(
+        partial(backend.load_chat_history, current_user, **history_args)
+    )
+    await send_json(send, payload)
+
+
+async def get_chart_data(request, send):
+    current_user = request.identity()
+    logger.info("CHARTS DATA REQUEST")
+    try:
+        selection = parse_selection(request.args.get("charts"))
+    except ValueError as e:
+        raise HTTPError(400, {"error": str(e)})
+
+    payload, status, etag = await run_io(
+        backend.load_chart_data,
+        current_user,
+        selection,
+        request.headers.get("if-none-match"),
+    )
+    headers = []
+    if etag:
+        headers.append((b"etag", etag.encode("latin-1")))
+        headers.append((b"cache-control", b"private, no-cache"))
+    if status == 304:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 304,
+                "headers": response_headers("application/json")[1:] + headers,
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+        return
+    await send_json(send, payload, status, headers)
+
+
+ROUTES = {
+    ("POST", "/auth/signup"): signup,
+    ("POST", "/auth/signin"): signin,
+    ("POST", "/api/chat"): chat_with_gpt,
+    ("POST", "/api/chat/stream"): stream_chat_with_gpt,
+    ("GET", "/api/chats"): get_chats,
+    ("GET", "/api/chartdata"): get_chart_data,
+}
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get("body", b""))
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.get_running_loop().run_in_executor(
+                io_executor, backend.warm_up
+            )
+            async_client.get()
+            backend.spreadsheet_pool.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_client.close()
+            io_executor.shutdown(wait=False)
+            backend.spreadsheet_pool.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def traced_send(send, scope):
+    """Wraps `send` to add Server-Timing and record the request latency"""
+    trace = telemetry.start_trace()
+
+    async def send_with_timing(message):
+        if message["type"] == "http.response.start":
+            header, total = telemetry.server_timing(trace)
+            message = {
+                **message,
+                "headers": list(message.get("headers", []))
+                + [(b"server-timing", header.encode("latin-1"))],
+            }
+            telemetry.request_seconds.observe(
+                total,
+                method=scope["method"],
+                route=scope["path"],
+                status=message["status"],
+            )
+        await send(message)
+
+    return send_with_timing
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    handler = None
+    if scope["type"] == "http":
+        handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    request = Request(scope, await read_body(receive))
+    send = traced_send(send, scope)
+    try:
+        await handler(request, send)
+    except HTTPError as e:
+        await send_json(send, e.payload, e.status)
+    except (SpreadsheetBusy, HashingBusy, UpstreamUnavailable) as e:
+        logger.warning(f"Rejecting request: {e}")
+        retry_after = str(getattr(e, "retry_after", 1)).encode("latin-1")
+        await send_json(send, {"error": str(e)}, 503, [(b"retry-after", retry_after)])
+    except Exception as e:
+        logger.error(f"Error handling {scope['path']}: {e}")
+        await send_json(send, {"error": str(e)}, 500)
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Query-string name of each chart -> key of its payload in the response
+CHART_KEYS = {
+    "history": "historyChart",
+    "scatter": "scatterChart",
+    "cashflow": "cashFlowChart",
+    "leadchannel": "leadChannelChart",
+}
+
+
+def history_chart(sold_flips_sheet):
+    # 📊 History Chart Data (Sold Flips)
+    # Currency columns are already normalized to floats at ingestion time
+    logger.info("Extracting History Chart Data")
+    history_data = sold_flips_sheet[["Sold Date", "Property Sale Price"]].dropna()
+    return {
+        "labels": history_data["Sold Date"].dt.strftime("%Y-%m-%d").tolist(),
+        "data": history_data["Property Sale Price"].astype(float).tolist(),
+    }
+
+
+def scatter_chart(sold_flips_sheet):
+    # 📊 Scatter Chart Data (Inventory vs Price)
+    logger.info("Extracting Scatter Chart Data")
+    inventory_data = sold_flips_sheet[
+        ["Property Address", "Property Purchase Price"]
+    ].dropna()
+    return {
+        "labels": inventory_data["Property Address"].tolist(),
+        "data": inventory_data["Property Purchase Price"].astype(float).tolist(),
+    }
+
+
+def cash_flow_chart(kiavi_loans_sheet):
+    # 📊 Cash Flow Chart Data (Kiavi Loans)
+    logger.info("Extracting Cash Flow Chart Data")
+    kiavi_loans_sheet = kiavi_loans_sheet.loc[
+        :, ~kiavi_loans_sheet.columns.str.contains("^Unnamed")
+    ]
+    cash_flow_data = kiavi_loans_sheet[["Address", "Total"]].dropna()
+    return {
+        "labels": cash_flow_data["Address"].tolist(),
+        "data": cash_flow_data["Total"].astype(float).tolist(),
+    }
+
+
+def lead_channel_chart(flip_inventory_sheet):
+    # 📊 Lead Channel Chart Data (Flip Inventory Sheet)
+    import pandas as pd
+
+    logger.info("Extracting Lead Channel Chart Data")
+    lead_channel_data = flip_inventory_sheet[["Address", "Lead"]].dropna()
+    lead_channel_data = lead_channel_data[
+        pd.to_numeric(lead_channel_data["Lead"], errors="coerce").isna()
+    ]
+    lead_counts = lead_channel_data["Lead"].value_counts()
+    return {
+        "labels": lead_counts.index.tolist(),
+        "data": lead_counts.tolist(),
+    }
+
+
+# Payload key -> (sheet it is built from, builder)
+CHART_SOURCES = {
+    "historyChart": ("Sold Flips", history_chart),
+    "scatterChart": ("Sold Flips", scatter_chart),
+    "cashFlowChart": ("Kiavi Loans", cash_flow_chart),
+    "leadChannelChart": ("Flip Inventory Sheet", lead_channel_chart),
+}
+
+
+def sheet_charts(sheet_name, frame):
+    """The chart payloads built from one sheet, {} for sheets no chart uses"""
+    return {
+        key: builder(frame)
+        for key, (source, builder) in CHART_SOURCES.items()
+        if source == sheet_name
+    }
+
+
+def merge_lead_counts(charts):
+    counts = {}
+    for chart in charts:
+        for label, count in zip(chart["labels"], chart["data"]):
+            counts[label] = counts.get(label, 0) + count
+    ranked = sorted(counts.items(), key=lambda item: -item[1])
+    return {
+        "labels": [label for label, _ in ranked],
+        "data": [count for _, count in ranked],
+    }
+
+
+def merge_charts(parts):
+    """Combines the sheet_charts of several sheets, in order, into every payload.
+
+    Series are concatenated and lead channel counts summed. Raises KeyError
+    naming the source sheet of a chart that no part provides.
+    """
+    charts = {}
+    for key, (source, _) in CHART_SOURCES.items():
+        found = [part[key] for part in parts if key in part]
+        if not found:
+            raise KeyError(source)
+        if len(found) == 1:
+            charts[key] = found[0]
+        elif key == "leadChannelChart":
+            charts[key] = merge_lead_counts(found)
+        else:
+            charts[key] = {
+                "labels": [label for chart in found for label in chart["labels"]],
+                "data": [value for chart in found for value in chart["data"]],
+            }
+    return charts
+
+
+def parse_selection(charts_arg):
+    """Turns `?charts=history,scatter` into payload keys; None means all.
+
+    Raises ValueError naming any chart that doesn't exist.
+    """
+    if not charts_arg:
+        return None
+    names = [name.strip().lower() for name in charts_arg.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CHART_KEYS]
+    if unknown:
+        raise ValueError(
+            f"Unknown chart(s): {', '.join(unknown)}. "
+            f"Available: {', '.join(CHART_KEYS)}"
+        )
+    return sorted({CHART_KEYS[name] for name in names})
+
+
+def select_charts(charts, selection):
+    if selection is None:
+        return charts
+    return {key: charts[key] for key in selection}
+
+
+def chart_etag(portfolio_id, version, selection):
+    """Strong ETag of a chart response, derived from the portfolio version only"""
+    parts = [str(portfolio_id), str(version), ",".join(selection or ["all"])]
+    return '"' + hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches `etag`"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
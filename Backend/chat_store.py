@@ -0,0 +1,158 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.5"))
+MAX_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "10000"))
+MAX_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", "5"))
+BATCH_SIZE = 25  # BatchWriteItem limit
+# Seconds after which a user's last timestamp can't collide with a new one
+TIMESTAMP_WINDOW = 60
+
+
+class ChatWriteBehind:
+    """Write-behind queue that persists chat items off the request path.
+
+    `put` only enqueues. A background thread drains the queue every
+    `flush_interval` seconds (or as soon as a full batch of 25 is waiting)
+    and writes it with `batch_writer`, retrying failed batches with
+    jittered exponential backoff. Pending items are flushed on shutdown.
+
+    The table is injected, so the queue works the same against DynamoDB,
+    DynamoDB Local or moto.
+    """
+
+    def __init__(
+        self,
+        table,
+        flush_interval=FLUSH_INTERVAL,
+        max_queue_size=MAX_QUEUE_SIZE,
+        max_retries=MAX_RETRIES,
+        base_backoff=0.2,
+    ):
+        self.table = table
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopped = threading.Event()
+        self._last_timestamps = {}
+        self._timestamp_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="chat-write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def unique_timestamp(self, email, timestamp):
+        """Bumps `timestamp` so no two queued items of a user share a key.
+
+        Chats are keyed by (email, timestamp) in seconds, and a batch may
+        not contain the same key twice; a question and a fast reply in the
+        same second would otherwise overwrite each other.
+        """
+        with self._timestamp_lock:
+            last = self._last_timestamps.get(email)
+            if last is not None and timestamp <= last:
+                timestamp = last + 1
+            self._last_timestamps[email] = timestamp
+            return timestamp
+
+    def _forget_old_timestamps(self):
+        """Drops last timestamps that new items can no longer collide with"""
+        cutoff = time.time() - TIMESTAMP_WINDOW
+        with self._timestamp_lock:
+            self._last_timestamps = {
+                email: last
+                for email, last in self._last_timestamps.items()
+                if last >= cutoff
+            }
+
+    def put(self, item):
+        """Queues an item for writing; writes inline if the queue is full"""
+        item = {
+            **item,
+            "timestamp": self.unique_timestamp(item["email"], item["timestamp"]),
+        }
+        if self._stopped.is_set():
+            self._write_batch([item])
+            return item
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.warning("Chat write queue full, writing inline")
+            self._write_batch([item])
+        return item
+
+    def _next_batch(self):
+        """Collects up to one batch, waiting at most `flush_interval`"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._write_batch(batch)
+                self._forget_old_timestamps()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.table.batch_writer(
+                    overwrite_by_pkeys=["email", "timestamp"]
+                ) as writer:
+                    for item in batch:
+                        writer.put_item(Item=item)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    logger.error(
+                        f"Dropping {len(batch)} chat items after "
+                        f"{attempt + 1} attempts: {e}"
+                    )
+                    return
+                delay = self.base_backoff * (2**attempt)
+                delay = random.uniform(delay / 2, delay)
+                logger.warning(
+                    f"Chat batch write failed ({e}), retrying in {delay:.2f}s"
+                )
+                time.sleep(delay)
+
+    def flush(self):
+        """Blocks until every queued item has been written"""
+        self._queue.join()
+
+    def close(self):
+        """Stops accepting background work and flushes what is pending"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join(timeout=self.flush_interval + 30)
+        logger.info(
+            f"Chat write-behind stopped: {self.written} written, {self.dropped} dropped"
+        )
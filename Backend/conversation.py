@@ -0,0 +1,243 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+HISTORY_LOAD_LIMIT = int(os.getenv("HISTORY_LOAD_LIMIT", "20"))
+MAX_CACHED_USERS = int(os.getenv("CONVERSATION_CACHE_USERS", "1000"))
+IDLE_TTL = int(os.getenv("CONVERSATION_CACHE_TTL", "1800"))
+# Seconds between checks for turns other processes saved
+SYNC_INTERVAL = float(os.getenv("CONVERSATION_SYNC_INTERVAL", "1"))
+SUMMARY_PREVIEW_CHARS = 200
+SUMMARY_MAX_CHARS = 2000
+
+
+def extractive_summary(previous_summary, turns):
+    """Fallback summary: the previous one plus the start of each turn"""
+    lines = [previous_summary] if previous_summary else []
+    for turn in turns:
+        text = " ".join(turn["message"].split())
+        if len(text) > SUMMARY_PREVIEW_CHARS:
+            text = text[:SUMMARY_PREVIEW_CHARS] + "..."
+        lines.append(f"{turn['role']}: {text}")
+    # Keep the most recent part when the summary outgrows its cap
+    return "\n".join(lines)[-SUMMARY_MAX_CHARS:]
+
+
+def make_turn(role, message, timestamp=None):
+    return {
+        "role": role,
+        "message": message,
+        "timestamp": timestamp,
+        "tokens": count_tokens(message) + 4,
+    }
+
+
+def chat_turns(items):
+    """Turns of the Chats items that belong in the conversation"""
+    return [
+        make_turn(item["role"], item.get("message", ""), int(item["timestamp"]))
+        for item in items
+        if item.get("role") in ("user", "assistant")
+    ]
+
+
+class Conversation:
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.last_timestamp = max(
+            (turn["timestamp"] for turn in self.turns), default=None
+        )
+        self.synced = time.monotonic()
+        self.summary = ""
+        self.unsummarized = []
+        self.in_flight = []
+        self.summarizing = False
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class ConversationMemory:
+    """Bounded conversation context for the prompt, cached per user.
+
+    The recent turns of each user are loaded once from the Chats table and
+    then kept up to date in-process as messages are saved. Other processes
+    serve the same user too, so before the conversation is used, turns
+    saved after the last one known here are fetched with
+    `load_since(email, timestamp)` (at most every SYNC_INTERVAL seconds).
+    Turns that no
+    longer fit in the token budget are folded into a rolling summary by
+    `summarize(previous_summary, turns)`, which runs in the background so
+    the request path never waits on it. Until it finishes (or if it fails)
+    an extractive summary of those turns is used instead.
+    """
+
+    def __init__(
+        self,
+        load_recent,
+        summarize=None,
+        load_since=None,
+        token_budget=HISTORY_TOKEN_BUDGET,
+        max_users=MAX_CACHED_USERS,
+        idle_ttl=IDLE_TTL,
+    ):
+        self.load_recent = load_recent
+        self.summarize = summarize
+        self.load_since = load_since
+        self.token_budget = token_budget
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._summarizer = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="conversation-summary"
+        )
+
+    def _get(self, email, create=True):
+        with self._lock:
+            conversation = self._users.get(email)
+            now = time.monotonic()
+            if (
+                conversation is not None
+                and now - conversation.last_used > self.idle_ttl
+            ):
+                del self._users[email]
+                conversation = None
+            if conversation is not None:
+                self._users.move_to_end(email)
+                conversation.last_used = now
+                return conversation
+        if not create:
+            return None
+
+        conversation = Conversation(chat_turns(self.load_recent(email)))
+        with self._lock:
+            conversation = self._users.setdefault(email, conversation)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return conversation
+
+    def record(self, email, role, message, timestamp=None):
+        """Appends a saved turn to the user's cached conversation, if any"""
+        conversation = self._get(email, create=False)
+        if conversation is None:
+            return
+        with conversation.lock:
+            conversation.turns.append(make_turn(role, message, timestamp))
+            if timestamp is not None:
+                conversation.last_timestamp = max(
+                    timestamp, conversation.last_timestamp or timestamp
+                )
+
+    def _sync(self, email, conversation):
+        """Appends the turns other processes saved since the last known one"""
+        if self.load_since is None:
+            return
+        with conversation.lock:
+            if time.monotonic() - conversation.synced < SYNC_INTERVAL:
+                return
+            conversation.synced = time.monotonic()
+            since = conversation.last_timestamp or 0
+        try:
+            turns = chat_turns(self.load_since(email, since))
+        except Exception as e:
+            logger.warning(f"Could not load new chat turns: {e}")
+            return
+        with conversation.lock:
+            for turn in turns:
+                # Another request may have synced or recorded them meanwhile
+                if turn["timestamp"] > (conversation.last_timestamp or 0):
+                    conversation.turns.append(turn)
+                    conversation.last_timestamp = turn["timestamp"]
+
+    def fingerprint(self, email):
+        """Identifies the conversation so far; "" before the user's first turn"""
+        conversation = self._get(email)
+        self._sync(email, conversation)
+        with conversation.lock:
+            turns = conversation.in_flight + conversation.unsummarized
+            turns = turns + conversation.turns
+            if not turns and not conversation.summary:
+                return ""
+            digest = hashlib.sha256(conversation.summary.encode("utf-8"))
+            for turn in turns:
+                digest.update(f"\0{turn['role']}\0{turn['message']}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def history_messages(self, email, token_budget=None):
+        """Chat messages for the prior conversation, within the token budget"""
+        budget = self.token_budget if token_budget is None else token_budget
+        conversation = self._get(email)
+        self._sync(email, conversation)
+        with conversation.lock:
+            used = count_tokens(conversation.summary)
+            window = []
+            for turn in reversed(conversation.turns):
+                if used + turn["tokens"] > budget:
+                    break
+                window.append(turn)
+                used += turn["tokens"]
+            window.reverse()
+
+            evicted = conversation.turns[: len(conversation.turns) - len(window)]
+            if evicted:
+                conversation.turns = conversation.turns[len(evicted) :]
+                conversation.unsummarized.extend(evicted)
+                self._schedule_summary(conversation)
+
+            summary = conversation.summary
+            pending = conversation.in_flight + conversation.unsummarized
+            if pending:
+                summary = extractive_summary(summary, pending)
+
+        messages = []
+        if summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{summary}",
+                }
+            )
+        messages.extend(
+            {"role": turn["role"], "content": turn["message"]} for turn in window
+        )
+        return messages
+
+    def _schedule_summary(self, conversation):
+        """Folds unsummarized turns into the rolling summary in the background"""
+        if conversation.summarizing:
+            return
+        conversation.summarizing = True
+        self._summarizer.submit(self._refresh_summary, conversation)
+
+    def _refresh_summary(self, conversation):
+        while True:
+            with conversation.lock:
+                turns = conversation.unsummarized
+                previous = conversation.summary
+                if not turns:
+                    conversation.summarizing = False
+                    return
+                conversation.unsummarized = []
+                conversation.in_flight = turns
+
+            summary = None
+            if self.summarize is not None:
+                try:
+                    summary = self.summarize(previous, turns)
+                except Exception as e:
+                    logger.warning(f"Conversation summary failed: {e}")
+            if not summary:
+                summary = extractive_summary(previous, turns)
+
+            with conversation.lock:
+                conversation.summary = summary
+                conversation.in_flight = []
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+META_SUFFIX = ".meta.json"
+
+
+def path_size(path):
+    """Size in bytes of a file or of everything under a directory"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+class LocalFileCache:
+    """Local copies of S3 objects under one directory, bounded by disk usage.
+
+    Every cached file has a `<name>.meta.json` sidecar recording the version
+    it was fetched for (the `Files` table timestamp) or, for records without
+    one, the S3 ETag. `get` returns the local path only once it is fresh:
+    downloads go to a temporary file that is renamed into place, so readers
+    never see a partial file, and concurrent requests for the same key share
+    one download. When the directory grows past `max_bytes` the least
+    recently used files are evicted together with their `companions`
+    (derived artifacts such as the ingested sheets).
+    """
+
+    def __init__(
+        self,
+        root,
+        download,
+        head_etag=None,
+        max_bytes=DEFAULT_MAX_BYTES,
+        companions=None,
+        on_evict=None,
+    ):
+        self.root = root
+        self.download = download
+        self.head_etag = head_etag
+        self.max_bytes = max_bytes
+        self.companions = companions or (lambda path: [])
+        self.on_evict = on_evict
+        self.downloads = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._last_used = {}
+
+    def path_for(self, key):
+        return os.path.join(self.root, os.path.basename(key))
+
+    def _read_meta(self, path):
+        try:
+            with open(path + META_SUFFIX) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, path, meta):
+        temporary = f"{path}{META_SUFFIX}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(temporary, "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(temporary, path + META_SUFFIX)
+
+    def _is_fresh(self, path, key, version):
+        if not os.path.exists(path):
+            return False
+        meta = self._read_meta(path)
+        if meta is None or meta.get("key") != key:
+            return False
+        if version is not None:
+            # A newer local copy is an upload whose record isn't written yet
+            return meta.get("version") is not None and meta["version"] >= version
+        if self.head_etag is None:
+            return True
+        return meta.get("etag") == self.head_etag(key)
+
+    def _key_lock(self, path):
+        with self._lock:
+            return self._key_locks.setdefault(path, threading.Lock())
+
+    def get(self, key, version=None):
+        """Returns the local path of a fresh copy of `key`, downloading it if needed.
+
+        Raises whatever the download raises when no fresh copy can be had.
+        """
+        path = self.path_for(key)
+        if not self._is_fresh(path, key, version):
+            with self._key_lock(path):
+                # Another request may have refreshed it while we waited
+                if not self._is_fresh(path, key, version):
+                    self._fetch(key, version, path)
+        self._touch(path)
+        return path
+
+    def _fetch(self, key, version, path):
+        logger.info(f"Downloading file from S3: {key} to {path}")
+        etag = self.head_etag(key) if version is None and self.head_etag else None
+        temporary = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            self.download(key, temporary)
+            self._install(temporary, path, key, version, etag)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        self.downloads += 1
+        logger.info(f"File downloaded successfully: {path}")
+        self.evict(keep=path)
+
+    def _install(self, source, path, key, version, etag=None):
+        # Drop the old sidecar first so a crash never pairs new metadata
+        # with the old file or the other way round
+        try:
+            os.remove(path + META_SUFFIX)
+        except FileNotFoundError:
+            pass
+        # Companions stay: they check the file they were built from and
+        # may reuse what didn't change between versions
+        os.replace(source, path)
+        if version is not None:
+            version = int(version)
+        self._write_meta(path, {"key": key, "version": version, "etag": etag})
+
+    def add(self, source, key, version):
+        """Moves a freshly uploaded file into the cache as `key` at `version`"""
+        path = self.path_for(key)
+        with self._key_lock(path):
+            self._install(source, path, key, version)
+        self._touch(path)
+        self.evict(keep=path)
+        return path
+
+    def remove(self, key):
+        path = self.path_for(key)
+        with self._key_lock(path):
+            self._remove_path(path)
+
+    def _remove_path(self, path):
+        for leftover in (path, path + META_SUFFIX):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+        for companion in self.companions(path):
+            shutil.rmtree(companion, ignore_errors=True)
+        with self._lock:
+            self._last_used.pop(path, None)
+        if self.on_evict is not None:
+            self.on_evict(path)
+
+    def _touch(self, path):
+        with self._lock:
+            self._last_used[path] = time.time()
+
+    def _entries(self):
+        """(last used, size, path) of every cached file"""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for name in os.listdir(self.root):
+            if not name.endswith(META_SUFFIX):
+                continue
+            path = os.path.join(self.root, name[: -len(META_SUFFIX)])
+            if not os.path.exists(path):
+                continue
+            size = path_size(path) + sum(
+                path_size(companion)
+                for companion in self.companions(path)
+                if os.path.exists(companion)
+            )
+            with self._lock:
+                # Files used before a restart fall back to their sidecar's mtime
+                last_used = self._last_used.get(path)
+            if last_used is None:
+                last_used = os.path.getmtime(path + META_SUFFIX)
+            entries.append((last_used, size, path))
+        return entries
+
+    def recent(self, limit):
+        """(path, version) of up to `limit` cached files, most recently used first"""
+        cached = []
+        for _, _, path in sorted(self._entries(), reverse=True)[:limit]:
+            meta = self._read_meta(path) or {}
+            cached.append((path, meta.get("version")))
+        return cached
+
+    def evict(self, keep=None):
+        """Removes least recently used files until usage fits `max_bytes`"""
+        entries = sorted(self._entries())
+        usage = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if usage <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            lock = self._key_lock(path)
+            if not lock.acquire(blocking=False):
+                continue  # being downloaded or replaced right now
+            try:
+                self._remove_path(path)
+            finally:
+                lock.release()
+            usage -= size
+            self.evictions += 1
+            logger.info(f"Evicted {path} from the local file cache")
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "files": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "downloads": self.downloads,
+            "evictions": self.evictions,
+        }
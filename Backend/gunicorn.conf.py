@@ -0,0 +1,35 @@
+"""Gunicorn settings for the Flask app. Run from Backend/ with:
+
+    gunicorn
+
+With GUNICORN_PRELOAD=1 (the default) the master imports and warms up the
+app once and forks ready workers from it; each worker still opens its own
+AWS and OpenAI connections and starts its own spreadsheet pool.
+"""
+
+import os
+
+wsgi_app = "app:create_app()"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+
+def on_starting(server):
+    if preload_app:
+        import app
+
+        app.warm_up()
+
+
+def post_worker_init(worker):
+    import app
+
+    if preload_app:
+        # Clients built in the master were dropped at the fork
+        app.build_clients()
+    else:
+        app.warm_up()
+    app.spreadsheet_pool.start()
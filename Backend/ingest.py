@@ -0,0 +1,465 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import python_calamine
+except ImportError:  # optional faster reader
+    python_calamine = None
+
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
+
+logger = logging.getLogger(__name__)
+
+# Per-sheet row limit and workbook-wide limit on the size of the cell data
+MAX_ROWS = int(os.getenv("INGEST_MAX_ROWS", "100000"))
+MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Cell texts read_excel treats as missing (pandas' default na_values)
+NA_STRINGS = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+
+# Header row (0-based) of the sheets whose layout the dashboard relies on.
+# Other sheets get their header row detected from the first few rows.
+KNOWN_HEADER_ROWS = {
+    "Sold Flips": 1,
+    "Kiavi Loans": 2,
+    "Flip Inventory Sheet": 1,
+}
+HEADER_SEARCH_ROWS = 10
+
+CURRENCY_PATTERN = re.compile(r"^\(?-?\$?-?[\d,]*\.?\d+\)?$")
+CURRENCY_CHARS = r"[\(\)\$,]"
+
+ARTIFACT_SUFFIX = ".sheets"
+MANIFEST_NAME = "manifest.json"
+# Sheet files a newer manifest no longer lists are kept this long for
+# readers still loading the previous version
+STALE_FILE_SECONDS = int(os.getenv("INGEST_STALE_FILE_SECONDS", "600"))
+
+
+def artifact_dir(file_path):
+    """Directory holding the columnar artifact of a workbook"""
+    return os.path.splitext(file_path)[0] + ARTIFACT_SUFFIX
+
+
+def detect_header_row(sheet_name, raw_sheet):
+    """Picks the row holding column names: the one with the most text cells"""
+    known_row = KNOWN_HEADER_ROWS.get(sheet_name)
+    if known_row is not None and len(raw_sheet) > known_row:
+        return known_row
+
+    best_row, best_count = 0, -1
+    for row in range(min(HEADER_SEARCH_ROWS, len(raw_sheet))):
+        count = sum(isinstance(value, str) for value in raw_sheet.iloc[row])
+        if count > best_count:
+            best_row, best_count = row, count
+    return best_row
+
+
+class WorkbookTooLarge(ValueError):
+    pass
+
+
+def frame_with_header(raw_sheet, header_row):
+    """Builds a frame from a raw sheet the way read_excel(header=...) would.
+
+    Unnamed columns are numbered by their position in the worksheet, which
+    is kept in the raw sheet's column labels when empty columns are dropped.
+    """
+    columns = []
+    seen = {}
+    for position, name in zip(raw_sheet.columns, raw_sheet.iloc[header_row]):
+        name = f"Unnamed: {position}" if pd.isna(name) else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+
+    frame = raw_sheet.iloc[header_row + 1 :].reset_index(drop=True)
+    frame.columns = columns
+    return frame.infer_objects()
+
+
+def is_number_like(value):
+    return pd.api.types.is_number(value) and not isinstance(value, bool)
+
+
+def normalize_column(column):
+    """Converts currency text to floats and makes mixed columns homogeneous"""
+    if column.dtype != object:
+        return column
+
+    values = column.dropna()
+    if values.empty:
+        return column
+
+    is_number = values.map(is_number_like)
+    is_currency = values.map(
+        lambda v: isinstance(v, str) and bool(CURRENCY_PATTERN.match(v.strip()))
+    )
+    if (is_number | is_currency).all():
+        return column.replace(CURRENCY_CHARS, "", regex=True).astype(float)
+
+    # Parquet needs one type per column; keep mixed columns as text
+    if values.map(type).nunique() > 1:
+        return column.where(column.isna(), column.astype(str))
+    return column
+
+
+def normalize_sheet(sheet_name, raw_sheet):
+    """Turns a raw cell grid into a typed frame plus its preamble rows"""
+    if raw_sheet.empty:
+        return pd.DataFrame(), []
+
+    header_row = detect_header_row(sheet_name, raw_sheet)
+    preamble = [
+        [str(value) for value in raw_sheet.iloc[row].dropna()]
+        for row in range(header_row)
+    ]
+    frame = frame_with_header(raw_sheet, header_row)
+    frame = frame.apply(normalize_column)
+    frame.attrs["preamble"] = [row for row in preamble if row]
+    frame.attrs["header_row"] = header_row
+    return frame, frame.attrs["preamble"]
+
+
+def convert_cell(value):
+    """Maps a cell value to what read_excel would produce for it"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return None if value in NA_STRINGS else value
+    if isinstance(value, float):
+        if np.isnan(value):
+            return None
+        return int(value) if value.is_integer() else value
+    if isinstance(value, datetime.datetime):
+        return pd.Timestamp(value)
+    if isinstance(value, datetime.date):
+        return pd.Timestamp(value)
+    return value
+
+
+def cell_bytes(value):
+    return len(value) if isinstance(value, str) else 8
+
+
+def openpyxl_rows(file_path):
+    """Yields (sheet name, rows) reading the workbook in read-only mode"""
+    # Only needed without calamine, so imported on first use
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = (
+                [None if cell.data_type == "e" else cell.value for cell in row]
+                for row in worksheet.iter_rows()
+            )
+            yield worksheet.title, rows
+    finally:
+        workbook.close()
+
+
+def calamine_rows(file_path):
+    workbook = python_calamine.CalamineWorkbook.from_path(file_path)
+    for sheet_name in workbook.sheet_names:
+        sheet = workbook.get_sheet_by_name(sheet_name)
+        # iter_rows starts at the first used cell; keep column positions
+        padding = [None] * sheet.start[1]
+        yield sheet_name, (padding + row for row in sheet.iter_rows())
+
+
+def xlrd_rows(file_path):
+    """Yields (sheet name, rows) of a legacy .xls workbook, one sheet at a time"""
+    workbook = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        for sheet_name in workbook.sheet_names():
+            sheet = workbook.sheet_by_name(sheet_name)
+            yield sheet_name, (
+                [xlrd_value(cell, workbook.datemode) for cell in sheet.row(index)]
+                for index in range(sheet.nrows)
+            )
+            workbook.unload_sheet(sheet_name)
+    finally:
+        workbook.release_resources()
+
+
+def xlrd_value(cell, datemode):
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+        return None
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate.xldate_as_datetime(cell.value, datemode)
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    return cell.value
+
+
+def workbook_rows(file_path):
+    """Picks a row reader: calamine if installed, else openpyxl or xlrd"""
+    if python_calamine is not None:
+        return calamine_rows(file_path)
+    if os.path.splitext(file_path)[1].lower() == ".xls":
+        if xlrd is None:
+            raise ValueError("Reading .xls workbooks requires xlrd")
+        return xlrd_rows(file_path)
+    return openpyxl_rows(file_path)
+
+
+def read_sheet(sheet_name, rows, budget):
+    """Collects the rows of one sheet into a raw cell grid.
+
+    Trailing empty rows and fully empty columns are dropped, so formatted
+    but unused areas of a worksheet cost nothing. `budget` is the remaining
+    cell data allowance in bytes; the amount used is returned with the grid.
+    """
+    grid = []
+    empty_rows = 0
+    width = 0
+    used = 0
+    for row in rows:
+        values = [convert_cell(value) for value in row]
+        while values and values[-1] is None:
+            values.pop()
+        if not values:
+            empty_rows += 1
+            continue
+        grid.extend([] for _ in range(empty_rows))
+        empty_rows = 0
+        if len(grid) >= MAX_ROWS:
+            raise WorkbookTooLarge(
+                f"Sheet '{sheet_name}' has more than {MAX_ROWS} rows"
+            )
+        used += sum(cell_bytes(value) for value in values if value is not None)
+        if used > budget:
+            raise WorkbookTooLarge(
+                f"Workbook data exceeds the limit of {MAX_BYTES:,} bytes "
+                f"(reached in sheet '{sheet_name}')"
+            )
+        width = max(width, len(values))
+        grid.append(values)
+
+    raw_sheet = pd.DataFrame.from_records(grid, columns=range(width))
+    raw_sheet = raw_sheet.dropna(axis=1, how="all").fillna(np.nan)
+    return raw_sheet, used
+
+
+def read_workbook(file_path):
+    """Parses every sheet of the Excel file as a raw cell grid, row by row.
+
+    Sheets are streamed one at a time so only the kept cells are held in
+    memory; WorkbookTooLarge is raised as soon as a sheet passes MAX_ROWS
+    rows or the workbook passes MAX_BYTES of cell data.
+    """
+    logger.info(f"Parsing workbook: {file_path}")
+    raw_sheets = {}
+    budget = MAX_BYTES
+    for sheet_name, rows in workbook_rows(file_path):
+        raw_sheet, used = read_sheet(sheet_name, rows, budget)
+        raw_sheets[sheet_name] = raw_sheet
+        budget -= used
+    return raw_sheets
+
+
+def source_signature(file_path):
+    stat = os.stat(file_path)
+    return {"source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def sheet_hash(sheet_name, raw_sheet):
+    """Content hash of a raw sheet, to tell which sheets changed between uploads"""
+    digest = hashlib.sha256(sheet_name.encode("utf-8"))
+    digest.update(repr(raw_sheet.shape).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(raw_sheet, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+
+def read_sheet_file(directory, sheet):
+    frame = pd.read_parquet(os.path.join(directory, sheet["file"]))
+    frame.attrs["preamble"] = sheet["preamble"]
+    frame.attrs["header_row"] = sheet["header_row"]
+    return frame
+
+
+def write_atomically(path, write):
+    """Calls write(temporary path), then moves the result into place"""
+    temporary = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def remove_stale_files(directory, manifest):
+    """Drops sheet files and leftovers that the manifest no longer lists"""
+    current = {sheet["file"] for sheet in manifest["sheets"]} | {MANIFEST_NAME}
+    cutoff = time.time() - STALE_FILE_SECONDS
+    for entry in os.scandir(directory):
+        try:
+            if entry.name not in current and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass  # already removed by another process
+
+
+def ingest_workbook(file_path, known=()):
+    """Parses the workbook and writes its sheets as Parquet files.
+
+    The artifact is a directory next to the workbook with one Parquet file
+    per sheet, named after the sheet's content hash, and a manifest
+    recording sheet order, hashes, header rows and the size/mtime of the
+    source it was built from. Sheets whose hash matches a file left by the
+    previous version of the workbook keep that file instead of being
+    normalized again.
+
+    Every file is written under a unique temporary name and renamed into
+    place, the manifest last, so processes ingesting the same workbook at
+    once never see each other's partial files and readers always see a
+    complete version. Sheet files are immutable (same name, same content);
+    those no longer listed are removed once STALE_FILE_SECONDS old.
+
+    Returns {sheet name: (content hash, frame)}; the frame is None for
+    sheets whose hash is in `known` and that didn't need normalizing.
+    """
+    raw_sheets = read_workbook(file_path)
+    target = artifact_dir(file_path)
+    previous = {
+        sheet["file"]: sheet
+        for sheet in (read_manifest(target) or {}).get("sheets", [])
+        if "hash" in sheet
+    }
+    os.makedirs(target, exist_ok=True)
+
+    sheets = {}
+    reused = 0
+    manifest = {**source_signature(file_path), "sheets": []}
+    for sheet_name, raw_sheet in raw_sheets.items():
+        content_hash = sheet_hash(sheet_name, raw_sheet)
+        sheet_file = f"sheet-{content_hash[:32]}.parquet"
+        sheet = previous.get(sheet_file)
+        frame = None
+        if sheet is not None:
+            try:
+                # Keeps the file from being removed as stale
+                os.utime(os.path.join(target, sheet_file))
+                if content_hash not in known:
+                    frame = read_sheet_file(target, sheet)
+                reused += 1
+            except FileNotFoundError:
+                sheet = None
+        if sheet is None:
+            frame, preamble = normalize_sheet(sheet_name, raw_sheet)
+            write_atomically(
+                os.path.join(target, sheet_file),
+                lambda path: frame.to_parquet(path, index=False),
+            )
+            sheet = {"header_row": frame.attrs.get("header_row"), "preamble": preamble}
+        manifest["sheets"].append(
+            {
+                "name": sheet_name,
+                "file": sheet_file,
+                "hash": content_hash,
+                "header_row": sheet["header_row"],
+                "preamble": sheet["preamble"],
+            }
+        )
+        sheets[sheet_name] = (content_hash, frame)
+
+    def write_manifest(path):
+        with open(path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+
+    write_atomically(os.path.join(target, MANIFEST_NAME), write_manifest)
+    remove_stale_files(target, manifest)
+    logger.info(
+        f"Ingested {len(sheets)} sheets from {file_path} into {target} "
+        f"({reused} unchanged)"
+    )
+    return sheets
+
+
+def load_artifact(file_path, known=()):
+    """Loads the Parquet artifact, or None if it is missing or stale.
+
+    Returns the same shape as ingest_workbook, skipping the Parquet files
+    of sheets whose hash is in `known`.
+    """
+    directory = artifact_dir(file_path)
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+
+    signature = source_signature(file_path)
+    if any(manifest.get(key) != value for key, value in signature.items()) or any(
+        "hash" not in sheet for sheet in manifest["sheets"]
+    ):
+        logger.info(f"Artifact for {file_path} is stale")
+        return None
+
+    sheets = {}
+    for sheet in manifest["sheets"]:
+        frame = None
+        if sheet["hash"] not in known:
+            try:
+                frame = read_sheet_file(directory, sheet)
+            except FileNotFoundError:
+                logger.info(f"Artifact for {file_path} is incomplete")
+                return None
+        sheets[sheet["name"]] = (sheet["hash"], frame)
+    return sheets
+
+
+def load_workbook_sheets(file_path, known=()):
+    """{sheet name: (content hash, typed frame)} of a workbook, ingesting it if needed.
+
+    Frames of sheets whose content hash is in `known` may be None: the
+    caller already has everything derived from them.
+    """
+    sheets = load_artifact(file_path, known)
+    if sheets is None:
+        sheets = ingest_workbook(file_path, known)
+    return sheets
@@ -0,0 +1,335 @@
+"""Routes each chat question to the cheapest way of answering it well.
+
+- "direct": questions the precomputed portfolio metrics answer exactly
+  (most profitable property, total net profit...) get a reply rendered
+  from those metrics, with no model call at all;
+- "small": lookups of a figure or a row go to a small, fast model;
+- "large": analysis, advice and anything unrecognized go to the large
+  model, as every question used to.
+
+The route comes from a local classifier, any callable taking the message
+and the portfolio metrics (None without a portfolio) and returning a route
+name. The default one below uses keyword cues; CHAT_ROUTER_CLASSIFIER set
+to "module:function" swaps in another without code changes.
+"""
+
+import importlib
+import logging
+import os
+import re
+import threading
+
+from portfolio_metrics import money
+
+logger = logging.getLogger(__name__)
+
+ROUTING_ENABLED = os.getenv("CHAT_ROUTING", "1") != "0"
+DIRECT_ANSWERS = os.getenv("CHAT_DIRECT_ANSWERS", "1") != "0"
+CLASSIFIER = os.getenv("CHAT_ROUTER_CLASSIFIER", "")
+
+# Model and reply length per route
+ROUTES = {
+    "small": {
+        "model": os.getenv("CHAT_SMALL_MODEL", "gpt-4o-mini"),
+        "max_tokens": int(os.getenv("CHAT_SMALL_MAX_TOKENS", "400")),
+    },
+    "large": {
+        "model": os.getenv("CHAT_LARGE_MODEL", "chatgpt-4o-latest"),
+        "max_tokens": int(os.getenv("CHAT_LARGE_MAX_TOKENS", "1000")),
+    },
+}
+
+# Longer questions usually carry conditions a lookup can't honour
+SMALL_MAX_WORDS = 25
+
+ANALYSIS_CUES = re.compile(
+    r"\b(should|would|could|why|how (can|do|should)|recommend\w*|advi[cs]e\w*|"
+    r"compar\w*|versus|vs|analy\w*|strateg\w*|risk\w*|improve\w*|predict\w*|"
+    r"forecast\w*|worth|buy|sell|refinanc\w*|what if|explain\w*|plan\w*|"
+    r"opportunit\w*|trend\w*|better|worse|think|opinion|suggest\w*|evaluat\w*|"
+    r"assess\w*|good|bad|summar\w*|overview|insight\w*|diversif\w*|invest(ing)?)\b"
+)
+LOOKUP_CUES = re.compile(
+    r"^(what|which|when|where|who|how (much|many|long)|list|show|give|tell|find)\b|"
+    r"\b(address|price|cost|date|lender|loan|balance|rate|payment|status|city|"
+    r"total|profit|loss|sold|purchased?)\b"
+)
+
+# Questions that refer back to earlier turns ("and Austin?", "what about it?")
+FOLLOW_UP_CUES = re.compile(
+    r"^(and|but|so|also|then|what about|how about)\b|"
+    r"\b(it|its|that|this|these|those|they|them|their|one|ones|else|again|"
+    r"same|previous|above|earlier|instead|other|another)\b"
+)
+# Fewer words than this can't say on their own what they ask about
+FOLLOW_UP_MAX_WORDS = 3
+
+TOP_PROPERTY = re.compile(
+    r"\b(most profitable|highest[- ]profit\w*|biggest profit|largest profit|"
+    r"most profit)\b.*\b(property|flip|house|deal)\b|"
+    r"\b(property|flip|house|deal)\b.*\b(most profitable|highest profit|most profit)\b"
+)
+BOTTOM_PROPERTY = re.compile(
+    r"\b(most loss[- ]making|biggest loss|largest loss|highest loss|worst|"
+    r"least profitable)\b.*\b(property|flip|house|deal)\b|"
+    r"\b(property|flip|house|deal)\b.*\b(most loss[- ]making|biggest loss|"
+    r"largest loss|least profitable)\b"
+)
+TOP_CITY = re.compile(
+    r"\b(most profitable|best|top)\b.*\bcit(y|ies)\b|"
+    r"\bcit(y|ies)\b.*\b(most profitable|best)\b"
+)
+TOTAL_PROFIT = re.compile(
+    r"\b(total|overall|combined|entire|whole)\b.*\b(net )?(profit|loss|p&l)\b"
+)
+
+# Every word a portfolio-wide question may use. Anything else, such as a
+# street, a city or "invest", narrows or changes the question, so the
+# precomputed metrics don't answer it
+DIRECT_VOCABULARY = set("""
+    a all an and are across as been did do does far for has have i in is it
+    me my of on our overall right s so the to us was we were what which
+    portfolio portfolios total combined entire whole
+    property properties flip flips house houses deal deals city cities
+    most highest high biggest largest best top worst least lowest
+    profitable profit profits loss losses net p&l making made make
+    """.split())
+
+
+def normalize(message):
+    return " ".join(message.lower().split())
+
+
+def is_self_contained(message):
+    """One short question that asks for no analysis or advice"""
+    return (
+        len(message.split()) <= SMALL_MAX_WORDS
+        and message.count("?") <= 1
+        and not ANALYSIS_CUES.search(message)
+    )
+
+
+def depends_on_conversation(message):
+    """True when the question may mean something else after other turns"""
+    message = normalize(message)
+    return (
+        not is_self_contained(message)
+        or len(message.split()) <= FOLLOW_UP_MAX_WORDS
+        or bool(FOLLOW_UP_CUES.search(message))
+    )
+
+
+def only_portfolio_words(message):
+    """True when the message names no property, place or other subject"""
+    return all(word in DIRECT_VOCABULARY for word in re.findall(r"[a-z&]+", message))
+
+
+def describe_property(record):
+    lines = [
+        (
+            f"- Sale price: {money(record['sale_price'])}"
+            if record["sale_price"] is not None
+            else "- Sale price: not recorded"
+        ),
+        (
+            f"- Total investment cost: {money(record['total_cost'])}"
+            if record["total_cost"] is not None
+            else "- Total investment cost: not recorded"
+        ),
+        f"- Net profit or loss: {money(record['net_profit'])}",
+    ]
+    if record["source"] == "reported":
+        lines.append("(from the Net Profit or Loss column of your workbook)")
+    else:
+        lines.append(
+            "(calculated as Property Sale Price - (Total Investment Cost + Sale Costs))"
+        )
+    return "\n".join(lines)
+
+
+def property_label(record):
+    return (
+        f"{record['address']} ({record['city'] or 'no city listed'}, {record['sheet']})"
+    )
+
+
+def tie_note(records):
+    tied = [r for r in records[1:] if r["net_profit"] == records[0]["net_profit"]]
+    if not tied:
+        return ""
+    others = ", ".join(record["address"] for record in tied)
+    return f"\n\nNote: {others} shows the same net result."
+
+
+def answer_top_property(metrics):
+    record = metrics["top"][0]
+    if record["net_profit"] < 0:
+        return (
+            "None of your properties with a sale result made a profit. The smallest "
+            f"loss is at **{property_label(record)}**, which has incurred a loss of "
+            f"{money(-record['net_profit'])}.\n\n{describe_property(record)}"
+        )
+    return (
+        f"Your most profitable property is **{property_label(record)}**, with a net "
+        f"profit of {money(record['net_profit'])}.\n\n{describe_property(record)}"
+        + tie_note(metrics["top"])
+    )
+
+
+def answer_bottom_property(metrics):
+    # Losses among the top properties aren't repeated in "bottom"
+    losses = metrics["bottom"] or [
+        record for record in reversed(metrics["top"]) if record["net_profit"] < 0
+    ]
+    if not losses:
+        return "None of your properties with a sale result has incurred a loss."
+    record = losses[0]
+    return (
+        f"Your most loss-making property is **{property_label(record)}**, which has "
+        f"incurred a loss of {money(-record['net_profit'])}.\n\n"
+        f"{describe_property(record)}" + tie_note(losses)
+    )
+
+
+def answer_top_city(metrics):
+    cities = metrics["cities"]
+    if not cities:
+        return None
+    best = cities[0]
+    if best["total_net_profit"] > 0:
+        lines = [
+            f"{best['city']} is the most profitable city, with a total net profit of "
+            f"{money(best['total_net_profit'])} over {best['properties']} properties "
+            f"(an average of {money(best['average_net_profit'])})."
+        ]
+    else:
+        lines = ["None of your cities shows an overall profit."]
+    lines.append("\nCities by total net profit or loss:")
+    for city in cities:
+        if city["only_losses"]:
+            status = "only loss-making properties, a negative return overall"
+        elif city["total_net_profit"] > 0:
+            status = "profitable"
+        else:
+            status = "an overall loss"
+        lines.append(
+            f"- {city['city']}: {money(city['total_net_profit'])} over "
+            f"{city['properties']} properties ({status})"
+        )
+    if metrics["unlabeled_city_properties"]:
+        lines.append(
+            f"\n{metrics['unlabeled_city_properties']} properties have no city and "
+            "can't be included because their location is not specified."
+        )
+    return "\n".join(lines)
+
+
+def answer_total_profit(metrics):
+    total = metrics["total_net_profit"]
+    result = (
+        f"a total net profit of {money(total)}"
+        if total >= 0
+        else f"a total loss of {money(-total)}"
+    )
+    return (
+        f"Across the {metrics['properties']} properties with a sale result "
+        f"(sheets: {', '.join(metrics['sheets'])}), your portfolio shows {result}: "
+        f"{metrics['profitable_properties']} profitable and "
+        f"{metrics['loss_making_properties']} loss-making."
+    )
+
+
+# Checked in order; the first matching pattern answers
+DIRECT_ANSWERS_BY_PATTERN = [
+    (BOTTOM_PROPERTY, answer_bottom_property),
+    (TOP_PROPERTY, answer_top_property),
+    (TOP_CITY, answer_top_city),
+    (TOTAL_PROFIT, answer_total_profit),
+]
+
+
+def direct_answer(message, metrics):
+    """A reply rendered from the portfolio metrics, or None if they can't answer"""
+    if not metrics or not metrics.get("properties"):
+        return None
+    message = normalize(message)
+    if not is_self_contained(message) or re.search(r"\d", message):
+        return None
+    if not only_portfolio_words(message):
+        return None
+    for pattern, answer in DIRECT_ANSWERS_BY_PATTERN:
+        if pattern.search(message):
+            return answer(metrics)
+    return None
+
+
+def keyword_classifier(message, metrics=None):
+    """Default classifier: direct when the metrics answer it, small for lookups"""
+    message = normalize(message)
+    if direct_answer(message, metrics) is not None:
+        return "direct"
+    if is_self_contained(message) and LOOKUP_CUES.search(message):
+        return "small"
+    return "large"
+
+
+def load_classifier(spec):
+    """Imports a classifier given as "module:function" """
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        classifier=None,
+        routes=None,
+        enabled=ROUTING_ENABLED,
+        direct_answers=DIRECT_ANSWERS,
+    ):
+        if classifier is None:
+            classifier = (
+                load_classifier(CLASSIFIER) if CLASSIFIER else keyword_classifier
+            )
+        self.classifier = classifier
+        self.routes = routes or ROUTES
+        self.enabled = enabled
+        self.direct_answers = direct_answers
+        self.counts = {"direct": 0, **{name: 0 for name in self.routes}}
+        self._lock = threading.Lock()
+
+    def route(self, message, metrics=None):
+        """How to answer `message`: {"route", "model", "max_tokens", "reply"}.
+
+        `reply` is set for direct routes only. Classifier errors and unknown
+        route names fall back to the large model.
+        """
+        name = "large"
+        if self.enabled:
+            try:
+                name = self.classifier(message, metrics)
+            except Exception as e:
+                logger.error(f"Chat router classifier failed: {e}")
+
+        reply = None
+        if name == "direct":
+            reply = direct_answer(message, metrics) if self.direct_answers else None
+            if reply is None:
+                name = "small"
+        if name != "direct" and name not in self.routes:
+            logger.warning(f"Unknown chat route {name!r}, using the large model")
+            name = "large"
+
+        with self._lock:
+            self.counts[name] += 1
+        route = self.routes.get(name, {})
+        return {
+            "route": name,
+            "model": route.get("model"),
+            "max_tokens": route.get("max_tokens"),
+            "reply": reply,
+        }
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
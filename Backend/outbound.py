@@ -0,0 +1,310 @@
+"""Outbound clients for OpenAI, DynamoDB and S3.
+
+Every client gets a connection pool sized to the threads that can call out
+at once (OUTBOUND_POOL_CONNECTIONS, by default the ASGI I/O pool size),
+connect and read deadlines on every attempt, and retries with jittered
+exponential backoff: botocore's "standard" retry mode for AWS and the
+OpenAI SDK's own retries, which back off the same way.
+
+Each upstream also sits behind a CircuitBreaker. Once most recent calls
+failed (timeouts, connection errors, 5xx or throttling) further calls fail
+fast with UpstreamUnavailable, which the routes turn into a 503, instead of
+holding request threads until their deadlines run out.
+
+The SDKs are imported by the factories, and clients are wrapped in
+PerProcess so they're built on first use: importing the app stays cheap,
+and workers forked from a preloaded master each open their own connections
+instead of sharing the master's sockets.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+POOL_CONNECTIONS = int(
+    os.getenv("OUTBOUND_POOL_CONNECTIONS", os.getenv("ASGI_IO_THREADS", "64"))
+)
+
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+# Longest wait for the next bytes of a reply, including the first token
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "3"))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "10"))
+# Attempts per call including the first one, as botocore counts them
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "3"))
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "standard")
+
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+AWS_THROTTLING_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "ProvisionedThroughputExceededException",
+    "TooManyRequestsException",
+    "SlowDown",
+}
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream's circuit is open; `retry_after` is in seconds"""
+
+    def __init__(self, upstream, retry_after=1):
+        super().__init__(f"{upstream} is unavailable, try again shortly")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class PerProcess:
+    """A client built on first use in each process.
+
+    Attribute access is forwarded to the client, so it stands in for one.
+    After a fork the child starts without an instance and builds its own.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class CircuitBreaker:
+    """Fails calls to an upstream fast while most recent ones failed.
+
+    Closed, it keeps the outcomes of the last `window` calls and opens once
+    at least `min_calls` are known and `failure_rate` of them failed. Open,
+    it rejects calls with UpstreamUnavailable for `reset_timeout` seconds,
+    then lets one call through to probe the upstream: a success closes the
+    circuit, a failure keeps it open for another `reset_timeout`.
+
+    Use it as a context manager around a call, with `is_failure` telling
+    upstream failures from other errors, or report outcomes with `allow`
+    and `record`.
+    """
+
+    def __init__(
+        self,
+        name,
+        is_failure=None,
+        window=CIRCUIT_WINDOW,
+        min_calls=CIRCUIT_MIN_CALLS,
+        failure_rate=CIRCUIT_FAILURE_RATE,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.is_failure = is_failure or (lambda error: True)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._open_until = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raises UpstreamUnavailable while the circuit is open"""
+        with self._lock:
+            if self._open_until is None:
+                return
+            now = time.monotonic()
+            if now < self._open_until:
+                self.rejected += 1
+                raise UpstreamUnavailable(self.name, math.ceil(self._open_until - now))
+            # This call probes the upstream; others wait for its outcome
+            self._open_until = now + self.reset_timeout
+
+    def record(self, failed):
+        with self._lock:
+            if failed:
+                self.failures += 1
+            if self._open_until is not None:
+                if failed:
+                    self._open_until = time.monotonic() + self.reset_timeout
+                else:
+                    self._open_until = None
+                    self._outcomes.clear()
+                    logger.info(f"{self.name} recovered, closing its circuit")
+                return
+            self._outcomes.append(failed)
+            calls = len(self._outcomes)
+            if (
+                calls >= self.min_calls
+                and sum(self._outcomes) >= self.failure_rate * calls
+            ):
+                self._open_until = time.monotonic() + self.reset_timeout
+                self.opened += 1
+                logger.warning(
+                    f"{self.name} failed {sum(self._outcomes)} of the last {calls} "
+                    f"calls, failing fast for {self.reset_timeout:g}s"
+                )
+
+    def record_error(self, error):
+        self.record(self.is_failure(error))
+
+    def is_open(self):
+        with self._lock:
+            return self._open_until is not None
+
+    def stats(self):
+        return {
+            "open": int(self.is_open()),
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+    def __enter__(self):
+        self.allow()
+        return self
+
+    def __exit__(self, exc_type, error, traceback):
+        if error is None:
+            self.record(False)
+        elif not isinstance(error, UpstreamUnavailable):
+            self.record_error(error)
+        return False
+
+
+def openai_failure(error):
+    """Timeouts, connection errors, rate limits and 5xx count against OpenAI"""
+    import httpx
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    # Raised as is when a stream breaks off after the response started
+    return isinstance(error, httpx.TransportError)
+
+
+def aws_failure(http_response, parsed):
+    code = parsed.get("Error", {}).get("Code")
+    return (
+        http_response.status_code >= 500
+        or http_response.status_code == 429
+        or code in AWS_THROTTLING_CODES
+    )
+
+
+def guard_aws_client(client, breaker):
+    """Passes every call of a botocore client through `breaker`.
+
+    The outcome is recorded once per call, after botocore's retries.
+    """
+
+    def before_call(**kwargs):
+        breaker.allow()
+
+    def after_call(http_response, parsed, **kwargs):
+        breaker.record(aws_failure(http_response, parsed))
+
+    def after_call_error(exception, **kwargs):
+        breaker.record(True)
+
+    events = client.meta.events
+    events.register("before-call", before_call)
+    events.register("after-call", after_call)
+    events.register("after-call-error", after_call_error)
+    return client
+
+
+def aws_config():
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=POOL_CONNECTIONS,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={"mode": AWS_RETRY_MODE, "total_max_attempts": AWS_MAX_ATTEMPTS},
+        tcp_keepalive=True,
+    )
+
+
+def aws_client(service, breaker, **kwargs):
+    import boto3
+
+    return guard_aws_client(
+        boto3.client(service, config=aws_config(), **kwargs), breaker
+    )
+
+
+def aws_resource(service, breaker, **kwargs):
+    import boto3
+
+    resource = boto3.resource(service, config=aws_config(), **kwargs)
+    guard_aws_client(resource.meta.client, breaker)
+    return resource
+
+
+def openai_timeout():
+    import httpx
+
+    return httpx.Timeout(
+        OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT, pool=OPENAI_CONNECT_TIMEOUT
+    )
+
+
+def openai_limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=POOL_CONNECTIONS, max_keepalive_connections=POOL_CONNECTIONS
+    )
+
+
+def openai_client(**kwargs):
+    """OpenAI client on one sized httpx pool, with deadlines and retries"""
+    import openai
+
+    return openai.OpenAI(
+        http_client=openai.DefaultHttpxClient(
+            limits=openai_limits(), timeout=openai_timeout()
+        ),
+        timeout=openai_timeout(),
+        max_retries=OPENAI_MAX_RETRIES,
+        **kwargs,
+    )
+
+
+def async_openai_client(**kwargs):
+    import openai
+
+    return openai.AsyncOpenAI(
+        http_client=openai.DefaultAsyncHttpxClient(
+            limits=openai_limits(), timeout=openai_timeout()
+        ),
+        timeout=openai_timeout(),
+        max_retries=OPENAI_MAX_RETRIES,
+        **kwargs,
+    )
@@ -0,0 +1,135 @@
+"""Password hashing off the request threads.
+
+Hashing is deliberately expensive, so sign-up and sign-in hand it to a
+small thread pool sized to the CPUs (hashlib releases the GIL while it
+works) with a bounded queue in front: a login storm gets fast 503s instead
+of every request thread burning CPU at once. The hash method comes from
+PASSWORD_HASH_METHOD; it can be any Werkzeug method ("pbkdf2:sha256:600000",
+"scrypt:32768:8:1"...) or "argon2" when argon2-cffi is installed. Hashes
+made with another method or cost still verify, and `verify` returns a fresh
+hash for them so the caller can store it.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+try:
+    import argon2
+except ImportError:  # optional, only needed for PASSWORD_HASH_METHOD=argon2
+    argon2 = None
+
+logger = logging.getLogger(__name__)
+
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256")
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", str(WORKERS * 16)))
+TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+ARGON2_PREFIX = "$argon2"
+
+
+class HashingBusy(Exception):
+    """Too many passwords are waiting to be hashed or verified"""
+
+
+def normalize_method(method):
+    """Spells out the default cost of a Werkzeug method, as stored in its hashes"""
+    name, *params = method.split(":")
+    if name == "pbkdf2":
+        digest = params[0] if params else "sha256"
+        iterations = params[1] if len(params) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{digest}:{iterations}"
+    if name == "scrypt":
+        n, r, p = params + ["32768", "8", "1"][len(params) :]
+        return f"scrypt:{n}:{r}:{p}"
+    return method
+
+
+class PasswordHashing:
+    def __init__(
+        self,
+        method=HASH_METHOD,
+        workers=WORKERS,
+        queue_size=QUEUE_SIZE,
+        timeout=TIMEOUT,
+    ):
+        if method == "argon2" and argon2 is None:
+            logger.warning("argon2-cffi is not installed, hashing with pbkdf2:sha256")
+            method = "pbkdf2:sha256"
+        self.method = normalize_method(method)
+        self.argon2 = argon2.PasswordHasher() if argon2 is not None else None
+        self.timeout = timeout
+        self.rejected = 0
+        self.rehashed = 0
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+
+    def _hash(self, password):
+        if self.method == "argon2":
+            return self.argon2.hash(password)
+        return generate_password_hash(password, method=self.method)
+
+    def _needs_rehash(self, stored):
+        if stored.startswith(ARGON2_PREFIX):
+            return self.method != "argon2" or self.argon2.check_needs_rehash(stored)
+        return stored.split("$", 1)[0] != self.method
+
+    def _verify(self, stored, password):
+        """(whether the password matches, a new hash to store or None)"""
+        if stored.startswith(ARGON2_PREFIX):
+            if self.argon2 is None:
+                logger.error("Found an argon2 hash but argon2-cffi is not installed")
+                return False, None
+            try:
+                self.argon2.verify(stored, password)
+            except argon2.exceptions.Argon2Error:
+                return False, None
+        elif not check_password_hash(stored, password):
+            return False, None
+
+        if not self._needs_rehash(stored):
+            return True, None
+        self.rehashed += 1
+        return True, self._hash(password)
+
+    def submit(self, func, *args):
+        """Queues `func(*args)` on the hashing pool and returns its future"""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy("Too many passwords to check at once, try again shortly")
+        try:
+            future = self._executor.submit(func, *args)
+        except RuntimeError:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit_hash(self, password):
+        return self.submit(self._hash, password)
+
+    def submit_verify(self, stored, password):
+        return self.submit(self._verify, stored, password)
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusy("Password hashing is overloaded, try again shortly")
+
+    def hash(self, password):
+        return self._result(self.submit_hash(password))
+
+    def verify(self, stored, password):
+        """(whether the password matches, a new hash to store or None)"""
+        return self._result(self.submit_verify(stored, password))
@@ -0,0 +1,177 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOP_N = 5
+
+# Candidate column names, in order of preference, across the sheet layouts
+ADDRESS_COLUMNS = ["Property Address", "Address"]
+CITY_COLUMNS = ["City", "Town", "Twp"]
+NET_PROFIT_COLUMNS = [
+    "Net Profit or Loss (Auto Calculated)",
+    "Net Profit or Loss",
+    "Profit",
+]
+SALE_PRICE_COLUMNS = ["Property Sale Price", "Sale Price"]
+TOTAL_COST_COLUMNS = [
+    "Total Investment Cost (including Purchase, Holding, Rehab etc)",
+    "Total Invested",
+]
+SALE_COST_COLUMNS = ["Total Sale Related Expenditure", "Sale Costs"]
+
+
+def first_column(frame, candidates):
+    for column in candidates:
+        if column in frame.columns:
+            return column
+    return None
+
+
+def numeric(frame, column):
+    import numpy as np
+    import pandas as pd
+
+    if column is None:
+        return pd.Series(np.nan, index=frame.index)
+    return pd.to_numeric(frame[column], errors="coerce")
+
+
+def sheet_profits(sheet_name, frame):
+    """Per-property net profit or loss of one sheet, or None if it has none.
+
+    Uses the sheet's own net profit column when present and falls back to
+    sale price - (total investment cost + sale costs) row by row.
+    """
+    import numpy as np
+    import pandas as pd
+
+    address_column = first_column(frame, ADDRESS_COLUMNS)
+    net_column = first_column(frame, NET_PROFIT_COLUMNS)
+    sale_column = first_column(frame, SALE_PRICE_COLUMNS)
+    cost_column = first_column(frame, TOTAL_COST_COLUMNS)
+    if address_column is None or (net_column is None and sale_column is None):
+        return None
+
+    reported = numeric(frame, net_column)
+    calculated = numeric(frame, sale_column) - (
+        numeric(frame, cost_column)
+        + numeric(frame, first_column(frame, SALE_COST_COLUMNS)).fillna(0)
+    )
+    net = reported.where(reported.notna(), calculated)
+
+    city_column = first_column(frame, CITY_COLUMNS)
+    if city_column is None:
+        city = pd.Series(None, index=frame.index, dtype=object)
+    else:
+        city = frame[city_column].astype("string").str.strip()
+        city = city.where(city.notna() & (city != ""), None).astype(object)
+
+    profits = pd.DataFrame(
+        {
+            "sheet": sheet_name,
+            "address": frame[address_column].astype("string").str.strip(),
+            "city": city,
+            "sale_price": numeric(frame, sale_column),
+            "total_cost": numeric(frame, cost_column),
+            "net_profit": net,
+            "source": np.where(reported.notna(), "reported", "calculated"),
+        }
+    )
+    return profits[profits["address"].notna() & profits["net_profit"].notna()]
+
+
+def summarize_profits(frames, top_n=TOP_N):
+    """Aggregates sheet_profits frames (None for sheets without any) into metrics"""
+    import pandas as pd
+
+    frames = [frame for frame in frames if frame is not None]
+    if not frames or all(frame.empty for frame in frames):
+        return {"properties": 0, "sheets": [], "cities": [], "top": [], "bottom": []}
+
+    properties = pd.concat(frames, ignore_index=True)
+    money_columns = ["sale_price", "total_cost", "net_profit"]
+    properties[money_columns] = properties[money_columns].round(2)
+
+    labeled = properties[properties["city"].notna()]
+    cities = (
+        labeled.groupby("city")["net_profit"]
+        .agg(total="sum", count="count", average="mean", best="max")
+        .sort_values("total", ascending=False)
+    )
+    ranked = properties.sort_values("net_profit", ascending=False, kind="stable")
+    # Loss-making properties that aren't already listed among the top ones
+    rest = ranked.iloc[top_n:]
+    losses = rest[rest["net_profit"] < 0]
+
+    def records(frame):
+        columns = ["sheet", "address", "city", "sale_price", "total_cost"]
+        columns += ["net_profit", "source"]
+        frame = frame[columns].astype(object)
+        return frame.where(frame.notna(), None).to_dict("records")
+
+    return {
+        "properties": int(len(properties)),
+        "sheets": sorted(properties["sheet"].unique().tolist()),
+        "total_net_profit": round(float(properties["net_profit"].sum()), 2),
+        "profitable_properties": int((properties["net_profit"] > 0).sum()),
+        "loss_making_properties": int((properties["net_profit"] < 0).sum()),
+        "unlabeled_city_properties": int(properties["city"].isna().sum()),
+        "cities": [
+            {
+                "city": city,
+                "total_net_profit": round(float(row["total"]), 2),
+                "properties": int(row["count"]),
+                "average_net_profit": round(float(row["average"]), 2),
+                "only_losses": bool(row["best"] < 0),
+            }
+            for city, row in cities.iterrows()
+        ],
+        "top": records(ranked.head(top_n)),
+        "bottom": records(losses.tail(top_n).iloc[::-1]),
+    }
+
+
+def money(value):
+    return f"${value:,.2f}" if value >= 0 else f"-${-value:,.2f}"
+
+
+def render_metrics(metrics):
+    """Compact text table of the aggregates for the system prompt"""
+    if not metrics["properties"]:
+        return ""
+
+    lines = [
+        "Precomputed portfolio metrics (authoritative, use these figures):",
+        f"Properties with a sale result: {metrics['properties']} "
+        f"(sheets: {', '.join(metrics['sheets'])})",
+        f"Total net profit or loss: {money(metrics['total_net_profit'])}; "
+        f"{metrics['profitable_properties']} profitable, "
+        f"{metrics['loss_making_properties']} loss-making",
+        "Cities by total net profit or loss:",
+    ]
+    for city in metrics["cities"]:
+        status = (
+            "only losses"
+            if city["only_losses"]
+            else ("profitable" if city["total_net_profit"] > 0 else "net loss")
+        )
+        lines.append(
+            f"- {city['city']}: {money(city['total_net_profit'])} over "
+            f"{city['properties']} properties, average "
+            f"{money(city['average_net_profit'])} ({status})"
+        )
+    if metrics["unlabeled_city_properties"]:
+        lines.append(
+            f"({metrics['unlabeled_city_properties']} properties have no city "
+            "and are excluded from city totals)"
+        )
+    for title, key in (("Most profitable", "top"), ("Most loss-making", "bottom")):
+        if not metrics[key]:
+            continue
+        lines.append(f"{title} properties:")
+        for record in metrics[key]:
+            lines.append(
+                f"- {record['address']} ({record['city'] or 'no city'}, "
+                f"{record['sheet']}): {money(record['net_profit'])}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Minimum similarity for a near-duplicate hit; 1 keeps exact matches only
+SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.9"))
+
+
+def normalize_question(question):
+    """Lowercase content words of a question, without punctuation or stopwords"""
+    return " ".join(tokenize(question))
+
+
+def question_features(normalized):
+    """Word and character trigram counts used for near-duplicate matching"""
+    features = Counter()
+    for word in normalized.split():
+        features[word] += 1
+        padded = f" {word} "
+        for start in range(len(padded) - 2):
+            features[padded[start : start + 3]] += 1
+    return features
+
+
+def cosine(left, right):
+    dot = sum(count * right[feature] for feature, count in left.items())
+    if not dot:
+        return 0.0
+    norm = math.sqrt(sum(c * c for c in left.values()))
+    norm *= math.sqrt(sum(c * c for c in right.values()))
+    return dot / norm
+
+
+class ResponseCache:
+    """LRU + TTL cache of chat replies keyed by (user, file version, context,
+    question).
+
+    `context` identifies the conversation a follow-up such as "why?" was
+    asked in (see ConversationMemory.fingerprint), so it is only answered
+    from a reply given after the same turns; questions that stand on their
+    own are cached with an empty context and hit across turns. Questions are
+    normalized (case, punctuation and stopwords dropped) so trivially
+    different phrasings share an entry. With `similarity` below 1 a miss
+    falls back to the most similar cached question of the same user, file
+    version and context, by cosine over word and character trigram counts.
+    Near-duplicates must use the same content words, only in another order
+    or repeated: "Maple Avenue" never matches "Maple Drive", nor 12 match 21.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, similarity=SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, entry, now):
+        return now - entry["created"] > self.ttl
+
+    def get(self, email, version, question, context=""):
+        """Returns the cached reply for a question, or None"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        key = (email, version, context, normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is None and self.similarity < 1:
+                key, entry = self._nearest(email, version, context, normalized, now)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if key[3] == normalized:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+                logger.debug(f"Near-duplicate cache hit: {normalized!r} ~ {key[3]!r}")
+            self._entries.move_to_end(key)
+            return entry["reply"]
+
+    def _nearest(self, email, version, context, normalized, now):
+        features = question_features(normalized)
+        words = frozenset(normalized.split())
+        best_key, best_entry, best_score = None, None, self.similarity
+        for key, entry in self._entries.items():
+            if key[:3] != (email, version, context) or self._expired(entry, now):
+                continue
+            if entry["words"] != words:
+                continue
+            score = cosine(features, entry["features"])
+            if score >= best_score:
+                best_key, best_entry, best_score = key, entry, score
+        return best_key, best_entry
+
+    def put(self, email, version, question, reply, context=""):
+        normalized = normalize_question(question)
+        if not normalized or not reply:
+            return
+        entry = {
+            "reply": reply,
+            "created": time.monotonic(),
+            "features": question_features(normalized),
+            "words": frozenset(normalized.split()),
+        }
+        key = (email, version, context, normalized)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email):
+        """Drops every cached reply of a user, e.g. after a new upload"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == email]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached replies for {email}")
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,218 @@
+import logging
+import math
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKENS", "6000"))
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Sizes of the small objects behind the index, for memory_size(): an int,
+# and a (row, count) posting whose row number is an int of its own
+INT_BYTES = sys.getsizeof(2**20)
+POSTING_BYTES = sys.getsizeof((0, 0)) + INT_BYTES
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = set(
+    """a about all an and any are as at be by can do does for from give how i
+    in is it list me much my of on or show tell that the this to was what
+    which who with you your""".split()
+)
+
+
+def tokenize(text):
+    words = WORD_PATTERN.findall(str(text).lower())
+    return [word for word in words if word not in STOPWORDS]
+
+
+def format_value(value):
+    import pandas as pd
+
+    if isinstance(value, float):
+        return f"{value:.2f}".rstrip("0").rstrip(".")
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+def render_row(sheet_name, row):
+    import pandas as pd
+
+    cells = [
+        f"{column}: {format_value(value)}"
+        for column, value in row.items()
+        if pd.notna(value)
+    ]
+    return f"[{sheet_name}] " + "; ".join(cells)
+
+
+def sheet_statistics(sheet_name, frame):
+    """Compact per-sheet overview: size, columns and numeric aggregates"""
+    import pandas as pd
+
+    lines = [f"Sheet: {sheet_name} ({len(frame)} rows)"]
+    columns = [c for c in frame.columns if not str(c).startswith("Unnamed")]
+    if columns:
+        lines.append("Columns: " + ", ".join(str(c) for c in columns))
+    for column in columns:
+        values = frame[column]
+        if pd.api.types.is_numeric_dtype(values) and values.notna().any():
+            lines.append(
+                f"- {column}: total {format_value(float(values.sum()))}, "
+                f"mean {format_value(float(values.mean()))}, "
+                f"min {format_value(float(values.min()))}, "
+                f"max {format_value(float(values.max()))}"
+            )
+    return "\n".join(lines)
+
+
+class PortfolioIndex:
+    """BM25 index over the rows of every sheet of a workbook.
+
+    Each non-empty row becomes one document made of its cell values and
+    column names, so questions naming an address, a city, a lender or a
+    column ("rehab", "sale price") pull in the rows that mention them.
+    """
+
+    def __init__(self, sheets):
+        self.rows = []
+        self.statistics = []
+        self.lengths = []
+        self.row_tokens = []
+        self.postings = defaultdict(list)
+
+        for sheet_name, frame in sheets.items():
+            if frame.empty:
+                continue
+            frame = frame.dropna(how="all")
+            self.statistics.append(sheet_statistics(sheet_name, frame))
+            for _, row in frame.iterrows():
+                text = render_row(sheet_name, row)
+                terms = Counter(tokenize(text))
+                for term, count in terms.items():
+                    self.postings[term].append((len(self.rows), count))
+                self.rows.append(text)
+                self.lengths.append(sum(terms.values()))
+                self.row_tokens.append(count_tokens(text) + 1)
+
+        self.average_length = (
+            sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        )
+
+    @classmethod
+    def merge(cls, indexes, labels=None):
+        """One index over the rows of several, in order.
+
+        With `labels` (one per index, e.g. the workbook names) each row and
+        sheet overview is prefixed with its label so sheets of the same name
+        in different workbooks stay apart.
+        """
+        merged = cls({})
+        for position, index in enumerate(indexes):
+            offset = len(merged.rows)
+            rows, statistics, row_tokens = (
+                index.rows,
+                index.statistics,
+                index.row_tokens,
+            )
+            if labels is not None:
+                label = labels[position]
+                extra = count_tokens(f"{label} / ")
+                rows = [f"[{label} / {row[1:]}" for row in rows]
+                statistics = [f"Workbook: {label}\n{text}" for text in statistics]
+                row_tokens = [tokens + extra for tokens in row_tokens]
+            for term, postings in index.postings.items():
+                merged.postings[term].extend(
+                    (offset + row, count) for row, count in postings
+                )
+            merged.rows.extend(rows)
+            merged.statistics.extend(statistics)
+            merged.lengths.extend(index.lengths)
+            merged.row_tokens.extend(row_tokens)
+        merged.average_length = (
+            sum(merged.lengths) / len(merged.lengths) if merged.lengths else 0
+        )
+        return merged
+
+    def memory_size(self):
+        """Approximate bytes the index holds, for the workbook cache's accounting"""
+        size = sum(sys.getsizeof(text) for text in self.rows)
+        size += sum(sys.getsizeof(text) for text in self.statistics)
+        for values in (self.rows, self.statistics, self.lengths, self.row_tokens):
+            size += sys.getsizeof(values)
+        # An int object per length and token count
+        size += INT_BYTES * (len(self.lengths) + len(self.row_tokens))
+        size += sys.getsizeof(self.postings)
+        for term, postings in self.postings.items():
+            size += sys.getsizeof(term) + sys.getsizeof(postings)
+            size += POSTING_BYTES * len(postings)
+        return size
+
+    def score(self, query):
+        """BM25 score of every row for `query`"""
+        terms = set(tokenize(query))
+        total = len(self.rows)
+        scores = [0.0] * total
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            frequency = len(postings)
+            idf = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for position, count in postings:
+                length_ratio = self.lengths[position] / self.average_length
+                norm = K1 * (1 - B + B * length_ratio)
+                scores[position] += idf * count * (K1 + 1) / (count + norm)
+        return scores
+
+    def overview(self):
+        """Per-sheet statistics; depends only on the workbooks, not the question"""
+        return "\n\n".join(self.statistics)
+
+    def select_rows(self, query, token_budget):
+        """Rows for the prompt that fit in `token_budget`, as (text, all rows fit).
+
+        Rows matching the question come first in relevance order, and any
+        budget left is filled with the remaining rows in sheet order, so
+        small workbooks are sent whole. When every row fits the text is the
+        same for any question.
+        """
+        used = 0
+        scores = self.score(query)
+        matched = sorted(
+            (position for position, score in enumerate(scores) if score > 0),
+            key=lambda position: -scores[position],
+        )
+        matched_set = set(matched)
+        unmatched = [p for p in range(len(self.rows)) if p not in matched_set]
+        order = matched + unmatched
+
+        selected = []
+        for position in order:
+            row_tokens = self.row_tokens[position]
+            if used + row_tokens > token_budget:
+                if position in matched_set:
+                    continue
+                break
+            selected.append(position)
+            used += row_tokens
+
+        logger.info(
+            f"Selected {len(selected)} of {len(self.rows)} rows "
+            f"({len(matched)} matched) for a {token_budget}-token context"
+        )
+        omitted = len(self.rows) - len(selected)
+        if not selected:
+            return "", omitted == 0
+
+        # Keep the workbook's own order so related rows stay together
+        rows = "\n".join(self.rows[position] for position in sorted(selected))
+        note = f"\n({omitted} less relevant rows omitted)" if omitted else ""
+        return f"Rows:\n{rows}{note}", omitted == 0
@@ -0,0 +1,339 @@
+"""Process pool for the CPU-bound spreadsheet work.
+
+Parsing a workbook and deriving its index, metrics and charts is pure
+pandas/openpyxl work that holds the GIL for as long as it runs. Doing it in
+separate processes keeps request threads responsive, and the bounded queue
+in front of the pool turns overload into fast 503s instead of unbounded
+latency. Workers are forked from a forkserver that has pandas and the
+spreadsheet modules preloaded, so they start warm and never re-import
+`app`; this module must not import it either.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import (
+    CancelledError,
+    Future,
+    ProcessPoolExecutor,
+    TimeoutError,
+)
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("SPREADSHEET_WORKERS", str(min(4, os.cpu_count() or 1))))
+QUEUE_SIZE = int(os.getenv("SPREADSHEET_QUEUE_SIZE", str(max(WORKERS, 1) * 4)))
+TASK_TIMEOUT = float(os.getenv("SPREADSHEET_TASK_TIMEOUT", "60"))
+
+
+class SpreadsheetBusy(Exception):
+    """The pool's queue is full or a task did not finish in time"""
+
+
+class SpreadsheetTimeout(SpreadsheetBusy):
+    pass
+
+
+def prepare_sheet(sheet_name, frame):
+    """Row index, profit/loss rows and chart payloads derived from one sheet"""
+    import portfolio_metrics
+    from charts import sheet_charts
+    from retrieval import PortfolioIndex
+
+    prepared = {
+        "index": PortfolioIndex({sheet_name: frame}),
+        "profits": portfolio_metrics.sheet_profits(sheet_name, frame),
+        "charts": None,
+        "charts_error": None,
+    }
+    try:
+        prepared["charts"] = sheet_charts(sheet_name, frame)
+    except Exception as e:
+        # Workbooks without the dashboard columns still work for chat
+        prepared["charts_error"] = f"Could not build charts: {e}"
+    return prepared
+
+
+def prepare_workbook(file_path, known=()):
+    """Ingests a workbook and derives everything served from it, sheet by sheet.
+
+    Returns {"sheets": [...]} with the name, content hash and prepare_sheet
+    results of every sheet in workbook order. Sheets whose hash is in
+    `known` only carry their name and hash: the caller already holds what
+    was derived from them. The sheets themselves stay in the worker; only
+    these results travel back.
+    """
+    import ingest
+
+    sheets = []
+    for sheet_name, (content_hash, frame) in ingest.load_workbook_sheets(
+        file_path, known
+    ).items():
+        sheet = {"name": sheet_name, "hash": content_hash}
+        if frame is not None:
+            sheet.update(prepare_sheet(sheet_name, frame))
+        sheets.append(sheet)
+    return {"sheets": sheets}
+
+
+def combine_workbooks(workbooks):
+    """Index, metrics and charts of a portfolio from its prepared workbooks.
+
+    `workbooks` is a list of (name, prepare_workbook result) in portfolio
+    order. With more than one workbook, sheet labels in the prompt context
+    and the metrics are prefixed with the workbook name. This only
+    concatenates per-sheet results, so it runs in the calling process.
+    """
+    import portfolio_metrics
+    from charts import merge_charts
+    from retrieval import PortfolioIndex
+
+    labeled = len(workbooks) > 1
+    sheets = [
+        (name if labeled else None, sheet)
+        for name, prepared in workbooks
+        for sheet in prepared["sheets"]
+    ]
+
+    profits = []
+    for label, sheet in sheets:
+        frame = sheet["profits"]
+        if frame is not None and label is not None:
+            frame = frame.assign(sheet=f"{label} / " + frame["sheet"])
+        profits.append(frame)
+
+    combined = {
+        "index": PortfolioIndex.merge(
+            [sheet["index"] for _, sheet in sheets],
+            [label for label, _ in sheets] if labeled else None,
+        ),
+        "metrics": portfolio_metrics.summarize_profits(profits),
+        "charts": None,
+        "charts_error": next(
+            (sheet["charts_error"] for _, sheet in sheets if sheet["charts_error"]),
+            None,
+        ),
+    }
+    if combined["charts_error"] is None:
+        try:
+            combined["charts"] = merge_charts([sheet["charts"] for _, sheet in sheets])
+        except Exception as e:
+            combined["charts_error"] = f"Could not build charts: {e}"
+    return combined
+
+
+PRELOAD_MODULES = [
+    "spreadsheet_pool",
+    "ingest",
+    "portfolio_metrics",
+    "retrieval",
+    "charts",
+]
+
+
+def warm_up():
+    """Worker initializer: make sure the heavy modules are imported"""
+    for module in PRELOAD_MODULES:
+        __import__(module)
+
+
+def pool_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class InFlightTask:
+    """The task submitted for a key, once `submitted` is set"""
+
+    def __init__(self):
+        self.submitted = threading.Event()
+        self.future = None
+        self.executor = None
+
+
+class SpreadsheetPool:
+    """Bounded process pool with per-task timeouts and backpressure.
+
+    At most `workers + queue_size` tasks are admitted at once; `run` raises
+    SpreadsheetBusy straight away when that many are pending (unless asked
+    to block), and SpreadsheetTimeout when a task takes longer than
+    `timeout`. Calls given the same `key` while a task for it is in flight
+    wait on that task instead of submitting it again.
+
+    A task still running at its deadline can't be cancelled, so the pool's
+    processes are recycled: they are terminated and a new pool takes the
+    next tasks. Other tasks killed with them are resubmitted once. With
+    `workers=0` tasks run in-process on a thread of their own, under the
+    same timeout; a timed-out one keeps its slot until it really finishes,
+    so runaway work still counts against the limit.
+
+    Daemonic processes can't have children, so a pool created in one runs
+    its tasks in-process too. Hypercorn's workers are daemonic unless
+    `daemon = false` is set, as Backend/hypercorn.toml does.
+    """
+
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, timeout=TASK_TIMEOUT):
+        if workers > 0 and multiprocessing.current_process().daemon:
+            logger.warning(
+                "Running spreadsheet tasks in-process: this process is daemonic "
+                "(for hypercorn, run with --config hypercorn.toml)"
+            )
+            workers = 0
+        self.workers = workers
+        self.timeout = timeout
+        self.rejected = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._in_flight = {}
+
+    def start(self):
+        """Spawns the workers now instead of on the first task"""
+        if self.workers <= 0:
+            return
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(warm_up)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=pool_context(),
+                    initializer=warm_up,
+                )
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _recycle(self, executor):
+        """Terminates the processes of a pool with a task past its deadline"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.recycled += 1
+        logger.warning("Spreadsheet task ran past its deadline, recycling the pool")
+        # The executor has no public way to stop a running task
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def run(self, func, *args, block=False, key=None):
+        """Runs `func(*args)` in a worker process and returns its result"""
+        for attempt in range(2):
+            future, executor = self._submit(func, args, block, key)
+            try:
+                return self._wait(future, executor)
+            except CancelledError:
+                # Waited on a queued task dropped at its caller's deadline
+                raise self._timeout_error()
+            except BrokenProcessPool:
+                if getattr(future, "timed_out", False):
+                    # Waited on a task that was stopped at its deadline
+                    raise self._timeout_error()
+                if attempt == 0 and executor is not self._get_executor():
+                    # Terminated along with another task past its deadline
+                    continue
+                logger.error("Spreadsheet worker died, restarting the pool")
+                self._reset(executor)
+                raise
+
+    def _submit(self, func, args, block, key):
+        """(future, executor) of a new task, or of the one in flight for `key`"""
+        if key is None:
+            return self._start(func, args, block)
+        while True:
+            with self._lock:
+                task = self._in_flight.get(key)
+                if task is None:
+                    task = self._in_flight[key] = InFlightTask()
+                    break
+            task.submitted.wait()
+            if task.future is not None:
+                return task.future, task.executor
+            # Its submission failed; try again
+
+        try:
+            task.future, task.executor = self._start(func, args, block)
+        except BaseException:
+            self._forget(key, task)
+            raise
+        finally:
+            task.submitted.set()
+        task.future.add_done_callback(lambda _: self._forget(key, task))
+        return task.future, task.executor
+
+    def _start(self, func, args, block):
+        if not self._slots.acquire(blocking=block):
+            self.rejected += 1
+            raise SpreadsheetBusy("Spreadsheet workers are busy, try again shortly")
+        if self.workers <= 0:
+            return self._run_inline(func, args), None
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset(executor)
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future, executor
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+
+    def _run_inline(self, func, args):
+        """Runs `func(*args)` on a thread that releases the slot when done"""
+        future = Future()
+        # A running future can't be cancelled, so a timeout leaves it to finish
+        future.set_running_or_notify_cancel()
+
+        def target():
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._slots.release()
+
+        threading.Thread(target=target, name="spreadsheet-task", daemon=True).start()
+        return future
+
+    def _wait(self, future, executor):
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            # Tasks still queued are simply dropped; a running one is stopped
+            if not future.cancel() and executor is not None:
+                future.timed_out = True
+                self._recycle(executor)
+            raise self._timeout_error()
+
+    def _timeout_error(self):
+        return SpreadsheetTimeout(
+            f"Spreadsheet task did not finish within {self.timeout:g}s"
+        )
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
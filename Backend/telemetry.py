@@ -0,0 +1,195 @@
+"""Request timing and Prometheus metrics.
+
+`span(stage)` times one stage of a request (a DynamoDB call, an S3
+download, the OpenAI call...). Every span feeds the stage latency
+histogram, and spans inside a request started with `start_trace` are also
+summed per stage for that request's Server-Timing header. `registry`
+renders everything in the Prometheus text format for `/metrics`.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1000, 2000, 4000, 8000, 16000, 32000)
+SIZE_BUCKETS = tuple(2**power * 1024 for power in range(4, 17, 2))  # 16 KB - 64 MB
+
+
+def format_number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][position] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, (counts, count, total) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = format_labels(self.labels + ("le",), key + (f"{bound:g}",))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = format_labels(self.labels + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauges:
+    """Values read at scrape time, e.g. the counters of a cache's stats()"""
+
+    def __init__(self, name, documentation, collect, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for labels, value in self.collect():
+            rendered = format_labels(
+                tuple(name for name, _ in labels), tuple(label for _, label in labels)
+            )
+            lines.append(f"{self.name}{rendered} {format_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def gauges(self, *args, **kwargs):
+        metric = Gauges(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+request_seconds = registry.histogram(
+    "rentwise_request_seconds",
+    "Time to produce the response headers, by route",
+    labels=("method", "route", "status"),
+)
+stage_seconds = registry.histogram(
+    "rentwise_stage_seconds",
+    "Time spent per request stage",
+    labels=("stage",),
+)
+prompt_tokens = registry.histogram(
+    "rentwise_prompt_tokens", "Prompt tokens per chat completion", buckets=TOKEN_BUCKETS
+)
+cached_prompt_tokens = registry.histogram(
+    "rentwise_cached_prompt_tokens",
+    "Prompt tokens served from the provider's prefix cache per chat completion",
+    buckets=TOKEN_BUCKETS,
+)
+uncached_prompt_tokens = registry.histogram(
+    "rentwise_uncached_prompt_tokens",
+    "Prompt tokens processed from scratch per chat completion",
+    buckets=TOKEN_BUCKETS,
+)
+completion_tokens = registry.histogram(
+    "rentwise_completion_tokens",
+    "Completion tokens per chat completion",
+    buckets=TOKEN_BUCKETS,
+)
+file_bytes = registry.histogram(
+    "rentwise_file_bytes",
+    "Size of workbooks moved, by direction",
+    labels=("direction",),
+    buckets=SIZE_BUCKETS,
+)
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace():
+    """Starts collecting spans for the current request"""
+    trace = {"started": time.perf_counter(), "stages": {}}
+    _trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def record(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace["stages"][stage] = trace["stages"].get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def server_timing(trace):
+    """Server-Timing header value: each stage plus the total so far"""
+    total = time.perf_counter() - trace["started"]
+    parts = [
+        f"{stage};dur={seconds * 1000:.1f}"
+        for stage, seconds in trace["stages"].items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts), total
@@ -0,0 +1,114 @@
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import chat_store
+from chat_store import ChatWriteBehind
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    with mock_aws():
+        yield boto3.resource("dynamodb", region_name="us-east-1").create_table(
+            TableName="Chats",
+            KeySchema=[
+                {"AttributeName": "email", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "email", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "N"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+
+class CountingTable:
+    """Passes writes through to `table`, failing the first `failures` batches"""
+
+    def __init__(self, table, failures=0):
+        self.table = table
+        self.failures = failures
+        self.batches = 0
+
+    def batch_writer(self, **kwargs):
+        self.batches += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("throttled")
+        return self.table.batch_writer(**kwargs)
+
+
+def chat(email, timestamp, message="hello"):
+    return {"email": email, "timestamp": timestamp, "role": "user", "message": message}
+
+
+def stored(table):
+    return sorted(
+        (item["email"], int(item["timestamp"]), item["message"])
+        for item in table.scan()["Items"]
+    )
+
+
+def test_items_are_written_in_batches(table):
+    counting = CountingTable(table)
+    writer = ChatWriteBehind(counting, flush_interval=1)
+    now = int(time.time())
+    for number in range(30):
+        writer.put(chat("a@b.c", now, f"message {number}"))
+    writer.flush()
+    writer.close()
+    assert writer.written == 30
+    assert counting.batches == 2
+    timestamps = [timestamp for _, timestamp, _ in stored(table)]
+    assert timestamps == list(range(now, now + 30))
+
+
+def test_failed_batches_are_retried(table):
+    counting = CountingTable(table, failures=2)
+    writer = ChatWriteBehind(counting, flush_interval=0.05, base_backoff=0.01)
+    writer.put(chat("a@b.c", 100))
+    writer.flush()
+    writer.close()
+    assert counting.batches == 3
+    assert writer.written == 1
+    assert writer.dropped == 0
+    assert stored(table) == [("a@b.c", 100, "hello")]
+
+
+def test_batches_are_dropped_after_the_last_retry(table):
+    counting = CountingTable(table, failures=10)
+    writer = ChatWriteBehind(
+        counting, flush_interval=0.05, max_retries=1, base_backoff=0.01
+    )
+    writer.put(chat("a@b.c", 100))
+    writer.flush()
+    writer.close()
+    assert writer.dropped == 1
+    assert stored(table) == []
+
+
+def test_pending_items_are_flushed_on_shutdown(table):
+    writer = ChatWriteBehind(table, flush_interval=1)
+    writer.put(chat("a@b.c", 100, "question"))
+    writer.put(chat("a@b.c", 100, "reply"))
+    writer.close()
+    assert stored(table) == [("a@b.c", 100, "question"), ("a@b.c", 101, "reply")]
+    # Writes after shutdown go straight to the table
+    writer.put(chat("d@e.f", 200))
+    assert ("d@e.f", 200, "hello") in stored(table)
+
+
+def test_old_timestamps_are_forgotten(table, monkeypatch):
+    monkeypatch.setattr(chat_store, "TIMESTAMP_WINDOW", 10)
+    writer = ChatWriteBehind(table, flush_interval=0.05)
+    now = int(time.time())
+    writer.put(chat("old@b.c", now - 60))
+    writer.put(chat("new@b.c", now))
+    writer.flush()
+    writer.close()
+    assert list(writer._last_timestamps) == ["new@b.c"]
@@ -0,0 +1,60 @@
+import pytest
+
+import conversation
+from conversation import ConversationMemory
+
+
+class ChatsTable:
+    """Chat items as load_chat_history returns them"""
+
+    def __init__(self):
+        self.items = []
+
+    def save(self, memory, role, message):
+        timestamp = len(self.items) + 1
+        self.items.append({"timestamp": timestamp, "role": role, "message": message})
+        memory.record("a@b.c", role, message, timestamp)
+
+    def load_recent(self, email):
+        return self.items[-20:]
+
+    def load_since(self, email, since):
+        return [item for item in self.items if item["timestamp"] > since]
+
+
+@pytest.fixture
+def chats(monkeypatch):
+    monkeypatch.setattr(conversation, "SYNC_INTERVAL", 0)
+    return ChatsTable()
+
+
+def worker(chats):
+    return ConversationMemory(
+        load_recent=chats.load_recent, load_since=chats.load_since
+    )
+
+
+def contents(memory):
+    return [message["content"] for message in memory.history_messages("a@b.c")]
+
+
+def test_turns_saved_by_other_workers_are_included(chats):
+    first, second = worker(chats), worker(chats)
+    chats.save(first, "user", "Q1")
+    chats.save(first, "assistant", "A1")
+    assert contents(second) == ["Q1", "A1"]
+    assert contents(first) == ["Q1", "A1"]
+
+    chats.save(second, "user", "Q2")
+    chats.save(second, "assistant", "A2")
+    assert contents(first) == ["Q1", "A1", "Q2", "A2"]
+    assert contents(second) == ["Q1", "A1", "Q2", "A2"]
+    assert first.fingerprint("a@b.c") == second.fingerprint("a@b.c")
+
+
+def test_turns_are_fetched_at_most_every_sync_interval(chats, monkeypatch):
+    memory = worker(chats)
+    contents(memory)
+    monkeypatch.setattr(conversation, "SYNC_INTERVAL", 60)
+    chats.items.append({"timestamp": 1, "role": "user", "message": "Q1"})
+    assert contents(memory) == []
@@ -0,0 +1,55 @@
+import os
+import threading
+
+import pandas as pd
+
+import ingest
+
+
+def workbook(path, profits):
+    frame = pd.DataFrame(
+        {"Property Address": ["1 Main St", "2 Main St"], "Profit": profits}
+    )
+    with pd.ExcelWriter(path) as writer:
+        frame.to_excel(writer, sheet_name="Flips", index=False)
+        frame.to_excel(writer, sheet_name="Other", index=False)
+    return str(path)
+
+
+def test_concurrent_ingests_of_one_workbook_all_succeed(tmp_path):
+    path = workbook(tmp_path / "portfolio.xlsx", [10, 20])
+    errors = []
+
+    def ingest_repeatedly():
+        for _ in range(5):
+            try:
+                sheets = ingest.ingest_workbook(path)
+                assert all(frame is not None for _, frame in sheets.values())
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=ingest_repeatedly) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert list(ingest.load_artifact(path)) == ["Flips", "Other"]
+
+
+def test_replaced_sheet_files_are_removed_once_stale(tmp_path, monkeypatch):
+    path = workbook(tmp_path / "portfolio.xlsx", [10, 20])
+    ingest.ingest_workbook(path)
+    directory = ingest.artifact_dir(path)
+    before = set(os.listdir(directory))
+
+    workbook(path, [10, 30])
+    ingest.ingest_workbook(path)
+    # Readers of the previous manifest may still need its files
+    assert before <= set(os.listdir(directory))
+
+    monkeypatch.setattr(ingest, "STALE_FILE_SECONDS", -1)
+    workbook(path, [10, 40])
+    sheets = ingest.ingest_workbook(path)
+    assert len(os.listdir(directory)) == len(sheets) + 1
+    assert ingest.load_artifact(path)["Flips"][1]["Profit"].tolist() == [10, 40]
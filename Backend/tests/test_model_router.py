@@ -0,0 +1,128 @@
+import pytest
+
+from model_router import (
+    ModelRouter,
+    depends_on_conversation,
+    direct_answer,
+    keyword_classifier,
+)
+
+
+def record(address, city, net_profit):
+    return {
+        "sheet": "Sold Flips",
+        "address": address,
+        "city": city,
+        "sale_price": 300000.0,
+        "total_cost": 250000.0,
+        "net_profit": net_profit,
+        "source": "reported",
+    }
+
+
+METRICS = {
+    "properties": 3,
+    "sheets": ["Sold Flips"],
+    "total_net_profit": 45000.0,
+    "profitable_properties": 2,
+    "loss_making_properties": 1,
+    "unlabeled_city_properties": 0,
+    "cities": [
+        {
+            "city": "Trenton",
+            "total_net_profit": 50000.0,
+            "properties": 2,
+            "average_net_profit": 25000.0,
+            "only_losses": False,
+        },
+        {
+            "city": "Austin",
+            "total_net_profit": -5000.0,
+            "properties": 1,
+            "average_net_profit": -5000.0,
+            "only_losses": True,
+        },
+    ],
+    "top": [
+        record("12 Willow Rd", "Trenton", 30000.0),
+        record("4 Maple Street", "Trenton", 20000.0),
+        record("9 Oak Street", "Austin", -5000.0),
+    ],
+    "bottom": [],
+}
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Which is my most profitable property?",
+        "What is the total net profit of my portfolio?",
+        "What is my overall profit so far?",
+        "Which city is the most profitable?",
+        "Which property has the biggest loss?",
+    ],
+)
+def test_portfolio_wide_questions_are_answered_directly(question):
+    assert keyword_classifier(question, METRICS) == "direct"
+    assert direct_answer(question, METRICS)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What is the overall profit on the Maple Street house?",
+        "What's the total profit on Oak Street?",
+        "What was the overall loss for Elm Street property?",
+        "What is the total loss in Austin?",
+        "Which city is the best to invest in?",
+        "Which is the most profitable property in Trenton?",
+    ],
+)
+def test_questions_about_one_property_or_place_reach_a_model(question):
+    assert direct_answer(question, METRICS) is None
+    assert keyword_classifier(question, METRICS) in ("small", "large")
+
+
+def test_advice_goes_to_the_large_model():
+    assert keyword_classifier("Which city is the best to invest in?") == "large"
+    assert keyword_classifier("Should I sell 9 Oak Street now?") == "large"
+
+
+def test_lookups_go_to_the_small_model():
+    assert keyword_classifier("What is the sale price of 9 Oak Street?") == "small"
+
+
+def test_no_direct_answer_without_a_portfolio():
+    router = ModelRouter(classifier=keyword_classifier)
+    route = router.route("Which is my most profitable property?", None)
+    assert route["route"] == "small"
+    assert route["reply"] is None
+
+
+def test_classifier_errors_fall_back_to_the_large_model():
+    def broken(message, metrics):
+        raise RuntimeError("boom")
+
+    route = ModelRouter(classifier=broken).route("Hi", METRICS)
+    assert route["route"] == "large"
+
+
+def test_biggest_loss_comes_from_the_top_list_when_bottom_is_empty():
+    reply = direct_answer("Which property has the biggest loss?", METRICS)
+    assert "9 Oak Street" in reply
+
+
+@pytest.mark.parametrize(
+    "question, follow_up",
+    [
+        ("Which city is the most profitable?", False),
+        ("What is the sale price of 9 Oak Street?", False),
+        ("Why?", True),
+        ("And Austin?", True),
+        ("What about the one in Trenton?", True),
+        ("What was its sale price?", True),
+        ("Should I sell 9 Oak Street now?", True),
+    ],
+)
+def test_follow_ups_depend_on_the_conversation(question, follow_up):
+    assert depends_on_conversation(question) == follow_up
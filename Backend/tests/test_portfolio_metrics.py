@@ -0,0 +1,39 @@
+import pandas as pd
+
+from portfolio_metrics import render_metrics, summarize_profits
+
+
+def profits(net_profits):
+    return pd.DataFrame(
+        {
+            "sheet": "Sold Flips",
+            "address": [f"{number} Main St" for number in range(len(net_profits))],
+            "city": "Trenton",
+            "sale_price": 300000.0,
+            "total_cost": 250000.0,
+            "net_profit": net_profits,
+            "source": "reported",
+        }
+    )
+
+
+def addresses(records):
+    return [record["address"] for record in records]
+
+
+def test_bottom_does_not_repeat_top_properties():
+    metrics = summarize_profits([profits([10.0, -20.0, 30.0, -40.0])], top_n=3)
+    assert addresses(metrics["top"]) == ["2 Main St", "0 Main St", "1 Main St"]
+    assert addresses(metrics["bottom"]) == ["3 Main St"]
+
+
+def test_bottom_only_lists_losses():
+    metrics = summarize_profits([profits([10.0, 20.0, 30.0, 40.0, 5.0])], top_n=2)
+    assert metrics["bottom"] == []
+    assert "Most loss-making" not in render_metrics(metrics)
+
+
+def test_bottom_lists_the_worst_losses_first():
+    net_profits = [50.0, 40.0, -10.0, -30.0, -20.0]
+    metrics = summarize_profits([profits(net_profits)], top_n=2)
+    assert addresses(metrics["bottom"]) == ["3 Main St", "4 Main St"]
@@ -0,0 +1,79 @@
+import pytest
+
+from conversation import ConversationMemory
+from model_router import depends_on_conversation
+from response_cache import ResponseCache
+
+QUESTION = "What is the net profit of the Maple Avenue property?"
+
+
+@pytest.mark.parametrize(
+    "cached, asked",
+    [
+        (QUESTION, "What is the net profit of the Maple Drive property?"),
+        ("Net profit on Oakwood Lane?", "Net profit on Oakwood Road?"),
+        ("Net profit on Riverside?", "Net profit on Lakeside?"),
+        ("Net profit on 12 Main St?", "Net profit on 21 Main St?"),
+    ],
+)
+def test_questions_about_other_properties_miss(cached, asked):
+    cache = ResponseCache(similarity=0.9)
+    cache.put("a@b.c", 1, cached, "reply")
+    assert cache.get("a@b.c", 1, asked) is None
+
+
+def test_rephrasings_with_the_same_words_hit():
+    cache = ResponseCache(similarity=0.9)
+    cache.put("a@b.c", 1, QUESTION, "reply")
+    assert cache.get("a@b.c", 1, "what is the NET PROFIT of the maple avenue property")
+    assert cache.get("a@b.c", 1, "Maple Avenue property: what is the net profit?")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_replies_are_scoped_to_the_conversation():
+    cache = ResponseCache()
+    cache.put("a@b.c", 1, "Why?", "because of the rates", context="first")
+    assert cache.get("a@b.c", 1, "Why?", context="second") is None
+    assert cache.get("a@b.c", 1, "Why?") is None
+    assert cache.get("a@b.c", 1, "Why?", context="first") == "because of the rates"
+
+
+def test_replies_are_scoped_to_the_file_version():
+    cache = ResponseCache()
+    cache.put("a@b.c", 1, QUESTION, "reply")
+    assert cache.get("a@b.c", 2, QUESTION) is None
+    cache.invalidate("a@b.c")
+    assert cache.get("a@b.c", 1, QUESTION) is None
+
+
+def ask(cache, memory, question, reply):
+    """What plan_reply and the chat endpoint do around the model call"""
+    context = ""
+    if depends_on_conversation(question):
+        context = memory.fingerprint("a@b.c")
+    cached = cache.get("a@b.c", 1, question, context)
+    if cached is None:
+        cache.put("a@b.c", 1, question, reply, context)
+    memory.record("a@b.c", "user", question)
+    memory.record("a@b.c", "assistant", cached or reply)
+    return cached
+
+
+def test_repeated_questions_hit_within_a_conversation():
+    cache = ResponseCache()
+    memory = ConversationMemory(load_recent=lambda email: [])
+    question = "Which city is the most profitable?"
+    assert ask(cache, memory, question, "Trenton") is None
+    assert ask(cache, memory, "Why?", "Rates") is None
+    assert ask(cache, memory, question, "Newark") == "Trenton"
+    assert ask(cache, memory, question, "Newark") == "Trenton"
+    assert cache.stats()["hits"] == 2
+
+
+def test_follow_ups_are_scoped_to_the_turns_before_them():
+    cache = ResponseCache()
+    memory = ConversationMemory(load_recent=lambda email: [])
+    ask(cache, memory, "Which city is the most profitable?", "Trenton")
+    assert ask(cache, memory, "And Austin?", "-$5,000") is None
+    assert ask(cache, memory, "And Austin?", "-$6,000") is None
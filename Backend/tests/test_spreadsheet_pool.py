@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+import pytest
+
+from spreadsheet_pool import SpreadsheetBusy, SpreadsheetPool, SpreadsheetTimeout
+
+
+def test_inline_tasks_return_their_result():
+    pool = SpreadsheetPool(workers=0, queue_size=1, timeout=5)
+    assert pool.run(sum, [1, 2, 3]) == 6
+
+
+def test_inline_tasks_raise_their_errors():
+    pool = SpreadsheetPool(workers=0, queue_size=1, timeout=5)
+    with pytest.raises(ZeroDivisionError):
+        pool.run(divmod, 1, 0)
+
+
+def test_inline_tasks_time_out_and_keep_their_slot():
+    pool = SpreadsheetPool(workers=0, queue_size=0, timeout=0.1)
+    with pytest.raises(SpreadsheetTimeout):
+        pool.run(time.sleep, 0.5)
+    assert pool.timeouts == 1
+    with pytest.raises(SpreadsheetBusy):
+        pool.run(sum, [1])
+    time.sleep(0.6)
+    assert pool.run(sum, [1]) == 1
+
+
+def test_calls_with_the_same_key_share_one_task():
+    pool = SpreadsheetPool(workers=0, queue_size=4, timeout=5)
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.2)
+        return value
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(pool.run(slow, 1, key=("a.xlsx", 1)))
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [1, 1, 1]
+    assert calls == [1]
+    assert pool.run(slow, 2, key=("a.xlsx", 1)) == 2
+
+
+def test_workers_past_their_deadline_are_recycled():
+    pool = SpreadsheetPool(workers=2, queue_size=2, timeout=1)
+    try:
+        first_pid = pool.run(os.getpid)
+        errors = []
+        others = []
+
+        def wait_on_stuck_task():
+            time.sleep(0.3)
+            try:
+                pool.run(time.sleep, 30, key="stuck")
+            except SpreadsheetTimeout as e:
+                errors.append(e)
+
+        def other_task():
+            time.sleep(0.3)
+            others.append(pool.run(sum, [1, 2]))
+
+        threads = [threading.Thread(target=wait_on_stuck_task)]
+        threads.append(threading.Thread(target=other_task))
+        for thread in threads:
+            thread.start()
+        with pytest.raises(SpreadsheetTimeout):
+            pool.run(time.sleep, 30, key="stuck")
+        for thread in threads:
+            thread.join()
+
+        assert pool.recycled == 1
+        assert len(errors) == 1
+        assert others == [3]
+        assert pool.run(os.getpid) != first_pid
+    finally:
+        pool.shutdown()
@@ -0,0 +1,55 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from upload_jobs import UploadJobs
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    with mock_aws():
+        yield boto3.resource("dynamodb", region_name="us-east-1").create_table(
+            TableName="UploadJobs",
+            KeySchema=[{"AttributeName": "job_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "job_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+
+def test_other_processes_see_every_status(table):
+    running = UploadJobs(workers=1, table=table)
+    polled = UploadJobs(workers=1, table=table)
+    job = running.create("a@b.c", "a@b.c/portfolio.xlsx")
+    assert polled.get(job["job_id"])["status"] == "queued"
+
+    running.update(job["job_id"], status="failed", error="unreadable")
+    failed = polled.get(job["job_id"])
+    assert (failed["status"], failed["error"]) == ("failed", "unreadable")
+
+
+def test_failures_of_submitted_jobs_are_recorded(table):
+    running = UploadJobs(workers=1, table=table)
+    job = running.create("a@b.c", "a@b.c/portfolio.xlsx")
+
+    def broken():
+        raise ValueError("The file could not be read as an Excel workbook")
+
+    running.submit(job["job_id"], broken)
+    running._executor.shutdown(wait=True)
+    assert UploadJobs(table=table).get(job["job_id"])["status"] == "failed"
+
+
+def test_expired_jobs_are_unknown(table):
+    running = UploadJobs(workers=1, ttl=-10, table=table)
+    job = running.create("a@b.c", "a@b.c/portfolio.xlsx")
+    assert UploadJobs(table=table).get(job["job_id"]) is None
+
+
+def test_jobs_stay_local_without_the_table(table):
+    table.delete()
+    jobs = UploadJobs(workers=1, table=table)
+    job = jobs.create("a@b.c", "a@b.c/portfolio.xlsx")
+    assert jobs.table is None
+    assert jobs.get(job["job_id"])["status"] == "queued"
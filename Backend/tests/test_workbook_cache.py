@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+from workbook_cache import WorkbookCache
+
+
+def test_concurrent_misses_load_once():
+    cache = WorkbookCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    threads = [
+        threading.Thread(target=cache.get_or_load, args=("a.xlsx", 1, "view", loader))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 4
+    assert cache.stats()["misses"] == 1
+    assert cache._key_locks == {}
+
+
+def test_failed_loads_release_their_key_lock():
+    cache = WorkbookCache()
+
+    def broken():
+        raise ValueError("unreadable")
+
+    with pytest.raises(ValueError):
+        cache.get_or_load("a.xlsx", 1, "view", broken)
+    assert cache._key_locks == {}
+    assert cache.get_or_load("a.xlsx", 1, "view", lambda: "value") == "value"
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,36 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character estimate
+    tiktoken = None
+
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "o200k_base")
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+
+
+def get_encoding():
+    """Returns the tiktoken encoding, or None when it isn't available"""
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {TOKEN_ENCODING}: {e}")
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    """Counts prompt tokens with tiktoken, or estimates them from length"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // CHARS_PER_TOKEN + 1
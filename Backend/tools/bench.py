@@ -0,0 +1,755 @@
+"""Offline load test for the backend.
+
+Runs the backend against local stand-ins (moto for DynamoDB and S3, or
+DynamoDB Local / MinIO via --dynamodb-endpoint / --s3-endpoint, and
+tools/fake_openai.py for OpenAI) with synthetic workbooks of increasing
+size, then reports latency percentiles, throughput and server memory per
+endpoint, workbook size and concurrency as JSON:
+
+    pip install "moto[server]" requests
+    python tools/bench.py --sizes 50 500 --concurrency 1 8 32 --output before.json
+    python tools/bench.py --sizes 50 500 --concurrency 1 8 32 --compare before.json
+
+The chat_direct, chat_small and chat_large scenarios ask questions the
+model router sends to each route; the fake small model answers faster
+(--small-first-token-delay / --small-token-delay). --no-routing sends them
+all to the large model for comparison.
+
+--server picks how the backend is served: flask (its development server),
+asgi (hypercorn) or gunicorn (with gunicorn.conf.py).
+
+--aws-faults and --openai-faults put tools/fault_proxy.py in front of the
+stand-ins and inject faults while measuring (not while setting up), e.g.
+--openai-faults error_rate=0.5 or --aws-faults delay_rate=0.2,delay=15,
+to see timeouts, retries and circuit breaking under a degraded upstream.
+
+Nothing outside a temporary directory is touched and no real AWS or OpenAI
+credentials are needed.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import requests
+
+import fault_proxy
+from synthetic_workbooks import build_workbooks
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS_DIR = os.path.join(BACKEND_DIR, "tools")
+REGION = "us-east-1"
+BUCKET = "rentwiseai-storage"
+ENDPOINTS = [
+    "upload",
+    "chartdata",
+    "chat",
+    "chat_stream",
+    "chat_direct",
+    "chat_small",
+    "chat_large",
+    "chats",
+    "signin",
+    "signup",
+]
+DEFAULT_ENDPOINTS = ["upload", "chartdata", "chat", "chats"]
+RSS_SAMPLE_INTERVAL = 0.1
+PASSWORD = "bench-password"
+SMALL_MODEL = "gpt-4o-mini"
+
+# Questions per chat route; {n} keeps model-bound ones out of the response cache
+ROUTE_QUESTIONS = {
+    "chat_direct": [
+        "Which is my most profitable property?",
+        "What is the total net profit of my portfolio?",
+        "Which city is the most profitable?",
+        "Which property has the biggest loss?",
+    ],
+    "chat_small": ["What is the sale price of property #{n}?"],
+    "chat_large": ["Should I sell property #{n} now or hold it for another year?"],
+}
+
+TABLES = {
+    "Users": [("email", "HASH", "S")],
+    "Files": [("email", "HASH", "S")],
+    "Chats": [("email", "HASH", "S"), ("timestamp", "RANGE", "N")],
+    "UploadJobs": [("job_id", "HASH", "S")],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=60, process=None, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except (requests.ConnectionError, requests.Timeout):
+            # gunicorn accepts connections before its workers are up
+            time.sleep(interval)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def create_resources(dynamodb_endpoint, s3_endpoint):
+    """Creates the tables and the bucket the backend expects"""
+    credentials = {
+        "region_name": REGION,
+        "aws_access_key_id": "bench",
+        "aws_secret_access_key": "bench",
+    }
+    dynamodb = boto3.resource("dynamodb", endpoint_url=dynamodb_endpoint, **credentials)
+    existing = {table.name for table in dynamodb.tables.all()}
+    for name, keys in TABLES.items():
+        if name in existing:
+            continue
+        dynamodb.create_table(
+            TableName=name,
+            KeySchema=[
+                {"AttributeName": key, "KeyType": kind} for key, kind, _ in keys
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": key, "AttributeType": type_} for key, _, type_ in keys
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+    s3 = boto3.client("s3", endpoint_url=s3_endpoint, **credentials)
+    try:
+        s3.create_bucket(Bucket=BUCKET)
+    except s3.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+
+def process_rss(pid):
+    """Resident memory in bytes of a process and all its descendants (Linux only)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces; fields after it don't
+                parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class RssSampler:
+    """Samples the server's memory in the background while a scenario runs"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.available = os.path.isdir("/proc")
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        if not self.available:
+            return None
+        rss = process_rss(self.pid)
+        self.peak = max(self.peak, rss)
+        return rss
+
+    def __enter__(self):
+        self.before = self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.sample()
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.after = self.sample()
+
+    def report(self):
+        if not self.available:
+            return None
+        megabytes = 1024 * 1024
+        return {
+            "before": round(self.before / megabytes, 1),
+            "peak": round(self.peak / megabytes, 1),
+            "after": round(self.after / megabytes, 1),
+        }
+
+
+class StandIns:
+    """The moto and fake OpenAI servers the backend talks to"""
+
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.moto = None
+        self.processes = []
+        # fault proxy state -> faults to inject while measuring
+        self.faults = []
+        self.proxies = []
+
+    def start(self):
+        dynamodb_endpoint = self.args.dynamodb_endpoint
+        s3_endpoint = self.args.s3_endpoint
+        if not (dynamodb_endpoint and s3_endpoint):
+            from moto.server import ThreadedMotoServer
+
+            # moto serves from this process; keep its access log off the report
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+            port = free_port()
+            self.moto = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+            self.moto.start()
+            dynamodb_endpoint = dynamodb_endpoint or f"http://127.0.0.1:{port}"
+            s3_endpoint = s3_endpoint or f"http://127.0.0.1:{port}"
+        create_resources(dynamodb_endpoint, s3_endpoint)
+
+        openai_port = free_port()
+        fake_openai = self.spawn(
+            [
+                sys.executable,
+                os.path.join(TOOLS_DIR, "fake_openai.py"),
+                "--port",
+                str(openai_port),
+                "--first-token-delay",
+                str(self.args.first_token_delay),
+                "--token-delay",
+                str(self.args.token_delay),
+                "--reply-tokens",
+                str(self.args.reply_tokens),
+                "--model-delay",
+                f"{SMALL_MODEL}={self.args.small_first_token_delay},"
+                f"{self.args.small_token_delay}",
+            ],
+            "fake_openai.log",
+        )
+        wait_until_up(f"http://127.0.0.1:{openai_port}/", process=fake_openai)
+        openai_endpoint = f"http://127.0.0.1:{openai_port}"
+        if self.args.aws_faults:
+            dynamodb_endpoint = self.proxy(dynamodb_endpoint, self.args.aws_faults)
+            s3_endpoint = self.proxy(s3_endpoint, self.args.aws_faults)
+        if self.args.openai_faults:
+            openai_endpoint = self.proxy(openai_endpoint, self.args.openai_faults)
+        return {
+            "AWS_ENDPOINT_URL_DYNAMODB": dynamodb_endpoint,
+            "AWS_ENDPOINT_URL_S3": s3_endpoint,
+            "OPENAI_BASE_URL": f"{openai_endpoint}/v1",
+        }
+
+    def proxy(self, upstream, faults):
+        """Puts a fault proxy in front of `upstream`; returns its URL"""
+        port = free_port()
+        server, state = fault_proxy.serve(port, upstream)
+        self.proxies.append(server)
+        self.faults.append((state, faults))
+        return f"http://127.0.0.1:{port}"
+
+    def inject_faults(self, enabled):
+        for state, faults in self.faults:
+            state.update(faults if enabled else fault_proxy.FAULTS)
+
+    def spawn(self, command, log_name, env=None):
+        log_file = open(os.path.join(self.workdir, log_name), "w")
+        process = subprocess.Popen(
+            command,
+            cwd=self.workdir,
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            # Its own process group, so stopping it also stops worker processes
+            start_new_session=True,
+        )
+        self.processes.append(process)
+        return process
+
+    def stop_process(self, process):
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+        if process in self.processes:
+            self.processes.remove(process)
+
+    def stop(self):
+        for process in reversed(self.processes):
+            self.stop_process(process)
+        for server in self.proxies:
+            server.shutdown()
+        if self.moto is not None:
+            self.moto.stop()
+
+
+def start_backend(
+    stand_ins, server, endpoints, jwt_secret, routing=True, extra_env=None, interval=0.1
+):
+    """Starts the backend in the work directory and returns (process, base url)"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        **endpoints,
+        CHAT_ROUTING="1" if routing else "0",
+        CHAT_SMALL_MODEL=SMALL_MODEL,
+        PYTHONPATH=os.pathsep.join(
+            filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])
+        ),
+        API_KEY="bench",
+        AWS_ACCESS_KEY="bench",
+        AWS_SECRET_KEY="bench",
+        AWS_DEFAULT_REGION=REGION,
+        JWT_SECRET_KEY=jwt_secret,
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        **(extra_env or {}),
+    )
+    if server == "asgi":
+        command = [
+            sys.executable,
+            "-m",
+            "hypercorn",
+            "--config",
+            os.path.join(BACKEND_DIR, "hypercorn.toml"),
+            "asgi:app",
+            "--bind",
+            f"127.0.0.1:{port}",
+        ]
+    elif server == "gunicorn":
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--config",
+            os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+            "--bind",
+            f"127.0.0.1:{port}",
+        ]
+    else:
+        command = [
+            sys.executable,
+            "-c",
+            "import app; application = app.create_app(); app.warm_up(); "
+            "app.spreadsheet_pool.start(); "
+            f"application.run(host='127.0.0.1', port={port}, threaded=True)",
+        ]
+    process = stand_ins.spawn(command, "backend.log", env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_up(f"{base_url}/health", process=process, interval=interval)
+    return process, base_url
+
+
+def make_tokens(jwt_secret, emails):
+    """Access tokens the backend accepts, minted the way it mints them"""
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token
+
+    token_app = Flask(__name__)
+    token_app.config["JWT_SECRET_KEY"] = jwt_secret
+    JWTManager(token_app)
+    with token_app.app_context():
+        return {
+            email: create_access_token(
+                identity=email, expires_delta=datetime.timedelta(days=1)
+            )
+            for email in emails
+        }
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    position = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[position]
+
+
+def latency_report(latencies):
+    ordered = sorted(latencies)
+    if not ordered:
+        return None
+    return {
+        "p50": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99": round(percentile(ordered, 0.99) * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+class Bench:
+    def __init__(self, base_url, tokens, workbooks, args):
+        self.base_url = base_url
+        self.tokens = tokens
+        self.workbooks = workbooks
+        self.args = args
+        self.jwt_secret = args.jwt_secret
+        self._local = threading.local()
+        self._questions = itertools.count()
+        self._registered = set()
+
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def call(self, method, path, email, **kwargs):
+        headers = {"Authorization": f"Bearer {self.tokens[email]}"}
+        return self.session().request(
+            method,
+            self.base_url + path,
+            headers=headers,
+            timeout=self.args.request_timeout,
+            **kwargs,
+        )
+
+    def upload(self, email, properties):
+        """Uploads a workbook; returns (response, seconds until the job finished)"""
+        started = time.perf_counter()
+        with open(self.workbooks[properties], "rb") as workbook:
+            response = self.call(
+                "POST",
+                "/api/upload",
+                email,
+                files={"file": (f"portfolio-{properties}.xlsx", workbook)},
+            )
+        if response.status_code != 202:
+            return response, None
+        job_id = response.json()["job_id"]
+        deadline = time.monotonic() + self.args.request_timeout
+        while True:
+            # Any worker must know the job, so every poll has to succeed
+            poll = self.call("GET", f"/api/upload/{job_id}", email)
+            if poll.status_code != 200:
+                return poll, None
+            if poll.json()["status"] in ("done", "failed"):
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Upload job {job_id} did not finish in time")
+            time.sleep(0.05)
+        if poll.json()["status"] == "failed":
+            return response, None
+        return response, time.perf_counter() - started
+
+    def prepare_users(self, properties, count):
+        """Bench users with the workbook of this size already uploaded"""
+        emails = [f"bench-{properties}-{n}@bench.local" for n in range(count)]
+        self.tokens.update(make_tokens(self.jwt_secret, emails))
+        with ThreadPoolExecutor(max_workers=min(count, 8)) as pool:
+            for response, seconds in pool.map(
+                lambda email: self.upload(email, properties), emails
+            ):
+                if response.status_code not in (200, 202) or (
+                    response.status_code == 202 and seconds is None
+                ):
+                    raise RuntimeError(f"Setup upload failed: {response.text}")
+        return emails
+
+    def register(self, emails):
+        """Signs the bench users up so they can sign in"""
+        for email in emails:
+            if email in self._registered:
+                continue
+            response = self.sign("/auth/signup", email)
+            if response.status_code not in (201, 400):
+                raise RuntimeError(f"Setup sign-up failed: {response.text}")
+            self._registered.add(email)
+
+    def sign(self, path, email):
+        return self.session().post(
+            self.base_url + path,
+            json={"name": email, "email": email, "password": PASSWORD},
+            timeout=self.args.request_timeout,
+        )
+
+    def request(self, endpoint, properties, users, number, run_id):
+        """Issues request `number` of a scenario; returns (status, seconds, job seconds)"""
+        if endpoint == "upload":
+            # A fresh user per request so content deduplication never kicks in
+            email = f"upload-{run_id}-{number}@bench.local"
+            self.tokens.update(make_tokens(self.jwt_secret, [email]))
+            response, job_seconds = self.upload(email, properties)
+            status = response.status_code
+            if status == 202 and job_seconds is None:
+                status = "job_failed"
+            # Only the request itself counts towards latency; the job is reported apart
+            return status, response.elapsed.total_seconds(), job_seconds
+
+        email = users[number % len(users)]
+        started = time.perf_counter()
+        if endpoint == "signin":
+            response = self.sign("/auth/signin", email)
+        elif endpoint == "signup":
+            response = self.sign(
+                "/auth/signup", f"signup-{run_id}-{number}@bench.local"
+            )
+        elif endpoint == "chartdata":
+            response = self.call("GET", "/api/chartdata", email)
+        elif endpoint == "chats":
+            response = self.call("GET", "/api/chats", email)
+        elif endpoint in ROUTE_QUESTIONS:
+            questions = ROUTE_QUESTIONS[endpoint]
+            message = questions[number % len(questions)].format(n=next(self._questions))
+            response = self.call("POST", "/api/chat", email, json={"message": message})
+            response.content
+        else:
+            # Distinct numbers keep the response cache from answering
+            message = f"What was the net profit on property #{next(self._questions)}?"
+            path = "/api/chat/stream" if endpoint == "chat_stream" else "/api/chat"
+            response = self.call("POST", path, email, json={"message": message})
+            response.content
+        return response.status_code, time.perf_counter() - started, None
+
+    def run(self, endpoint, properties, users, concurrency, server_pid):
+        run_id = f"{endpoint}-{properties}-{concurrency}-{time.time_ns()}"
+        total = self.args.requests
+        warmup = self.args.warmup
+        if endpoint == "signin":
+            self.register(users)
+
+        for number in range(warmup):
+            self.request(endpoint, properties, users, number, f"warmup-{run_id}")
+
+        counter = iter(range(total))
+        counter_lock = threading.Lock()
+        results = []
+
+        def worker():
+            while True:
+                with counter_lock:
+                    number = next(counter, None)
+                if number is None:
+                    return
+                try:
+                    results.append(
+                        self.request(endpoint, properties, users, number, run_id)
+                    )
+                except requests.RequestException as e:
+                    results.append((type(e).__name__, None, None))
+
+        with RssSampler(server_pid) as rss:
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        statuses = {}
+        for status, _, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        succeeded = [
+            seconds
+            for status, seconds, _ in results
+            if isinstance(status, int) and status < 400
+        ]
+        # How fast failures come back, e.g. 503s from an open circuit
+        failed = [
+            seconds
+            for status, seconds, _ in results
+            if isinstance(status, int) and status >= 400 and seconds is not None
+        ]
+        result = {
+            "endpoint": endpoint,
+            "workbook_properties": properties,
+            "workbook_bytes": os.path.getsize(self.workbooks[properties]),
+            "concurrency": concurrency,
+            "requests": len(results),
+            "errors": len(results) - len(succeeded),
+            "statuses": statuses,
+            "seconds": round(elapsed, 3),
+            "rps": round(len(succeeded) / elapsed, 2) if elapsed else None,
+            "latency_ms": latency_report(succeeded),
+            "error_latency_ms": latency_report(failed),
+            "rss_mb": rss.report(),
+        }
+        if endpoint == "upload":
+            result["job_latency_ms"] = latency_report(
+                [seconds for _, _, seconds in results if seconds is not None]
+            )
+        return result
+
+
+def result_key(result):
+    return (result["endpoint"], result["workbook_properties"], result["concurrency"])
+
+
+def format_result(result, baseline=None):
+    latency = result["latency_ms"] or {}
+    line = (
+        f"{result['endpoint']:<12} {result['workbook_properties']:>6} "
+        f"{result['concurrency']:>4} {result['rps'] or 0:>9.1f} "
+        f"{latency.get('p50', 0):>9.1f} {latency.get('p95', 0):>9.1f} "
+        f"{latency.get('p99', 0):>9.1f} {(result['rss_mb'] or {}).get('peak', 0):>8.1f} "
+        f"{result['errors']:>6}"
+    )
+    if baseline is None:
+        return line
+
+    def change(new, old):
+        if not old or new is None:
+            return "    n/a"
+        return f"{(new - old) / old * 100:>+6.1f}%"
+
+    old_latency = baseline["latency_ms"] or {}
+    return (
+        f"{line}   rps {change(result['rps'], baseline['rps'])}"
+        f"  p50 {change(latency.get('p50'), old_latency.get('p50'))}"
+        f"  p95 {change(latency.get('p95'), old_latency.get('p95'))}"
+        f"  p99 {change(latency.get('p99'), old_latency.get('p99'))}"
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--endpoints", nargs="+", choices=ENDPOINTS, default=DEFAULT_ENDPOINTS
+    )
+    parser.add_argument("--requests", type=int, default=100, help="per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests")
+    parser.add_argument(
+        "--server", choices=["flask", "asgi", "gunicorn"], default="flask"
+    )
+    parser.add_argument("--dynamodb-endpoint", help="e.g. DynamoDB Local")
+    parser.add_argument("--s3-endpoint", help="e.g. MinIO")
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--small-first-token-delay", type=float, default=0.08)
+    parser.add_argument("--small-token-delay", type=float, default=0.004)
+    parser.add_argument(
+        "--no-routing",
+        dest="routing",
+        action="store_false",
+        help="send every chat question to the large model",
+    )
+    parser.add_argument(
+        "--aws-faults",
+        type=fault_proxy.parse_faults,
+        help="faults injected into DynamoDB and S3 calls, e.g. error_rate=0.5",
+    )
+    parser.add_argument(
+        "--openai-faults",
+        type=fault_proxy.parse_faults,
+        help="faults injected into OpenAI calls, e.g. delay_rate=0.2,delay=90",
+    )
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--workbooks", help="directory to keep generated workbooks in")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args()
+    args.jwt_secret = os.urandom(32).hex()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as report_file:
+            baseline = {
+                result_key(result): result
+                for result in json.load(report_file)["results"]
+            }
+
+    workdir = tempfile.mkdtemp(prefix="rentwise-bench-")
+    workbooks = build_workbooks(
+        args.workbooks or os.path.join(workdir, "workbooks"), args.sizes
+    )
+    stand_ins = StandIns(args, workdir)
+    results = []
+    try:
+        endpoints = stand_ins.start()
+        backend, base_url = start_backend(
+            stand_ins, args.server, endpoints, args.jwt_secret, args.routing
+        )
+        bench = Bench(base_url, {}, workbooks, args)
+        print(f"Backend at {base_url}, logs in {workdir}", file=sys.stderr)
+        print(
+            f"{'endpoint':<12} {'props':>6} {'conc':>4} {'rps':>9} {'p50 ms':>9} "
+            f"{'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8} {'errors':>6}"
+        )
+        for properties in args.sizes:
+            stand_ins.inject_faults(False)
+            users = bench.prepare_users(properties, max(args.concurrency))
+            stand_ins.inject_faults(True)
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    result = bench.run(
+                        endpoint, properties, users, concurrency, backend.pid
+                    )
+                    results.append(result)
+                    print(format_result(result, baseline.get(result_key(result))))
+    finally:
+        stand_ins.stop()
+
+    report = {
+        "meta": {
+            "started": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "server": args.server,
+            "requests": args.requests,
+            "first_token_delay": args.first_token_delay,
+            "token_delay": args.token_delay,
+            "reply_tokens": args.reply_tokens,
+            "small_first_token_delay": args.small_first_token_delay,
+            "small_token_delay": args.small_token_delay,
+            "routing": args.routing,
+            "aws_faults": args.aws_faults,
+            "openai_faults": args.openai_faults,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Report written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
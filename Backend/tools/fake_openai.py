@@ -0,0 +1,179 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Serves `/v1/chat/completions` in both regular and streaming (SSE) mode with
+configurable latency, so the backend can be exercised offline. Like the
+real API it reports `prompt_tokens_details.cached_tokens` for prompt
+prefixes it has seen recently, and only the uncached part of a prompt
+adds to the first-token delay. --model-delay gives a model its own
+latency, e.g. a faster small model for comparing chat routes:
+
+    python tools/fake_openai.py --port 8081 --model-delay gpt-4o-mini=0.08,0.005
+    OPENAI_BASE_URL=http://localhost:8081/v1 python app.py
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+app.config.update(
+    FIRST_TOKEN_DELAY=0.2,
+    TOKEN_DELAY=0.02,
+    REPLY_TOKENS=60,
+    # model -> (first token delay, token delay), overriding the defaults
+    MODEL_DELAYS={},
+)
+
+# Prefix caching as the API documents it: from 1024 tokens, in 128-token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+recent_prompts = deque(maxlen=256)
+recent_prompts_lock = threading.Lock()
+
+WORDS = (
+    "Based on your uploaded portfolio the property at 612 Silver Ct shows a net "
+    "profit of $18,421.28 after sale costs and holding costs are included"
+).split()
+
+
+def fake_reply_tokens(max_tokens):
+    count = min(app.config["REPLY_TOKENS"], max_tokens or app.config["REPLY_TOKENS"])
+    return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+
+def cached_prefix_tokens(messages):
+    """Tokens of the longest prefix shared with a recent prompt, as cached"""
+    prompt = "".join(f"{m.get('role')}\n{m.get('content', '')}\n" for m in messages)
+    with recent_prompts_lock:
+        shared = max(
+            (len(os.path.commonprefix([prompt, seen])) for seen in recent_prompts),
+            default=0,
+        )
+        recent_prompts.append(prompt)
+    tokens = shared // 4
+    if tokens < CACHE_MIN_TOKENS:
+        return 0
+    return tokens - (tokens - CACHE_MIN_TOKENS) % CACHE_STEP_TOKENS
+
+
+def usage_for(messages, completion_tokens):
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    cached_tokens = min(cached_prefix_tokens(messages), prompt_tokens)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+def model_delays(model):
+    """(first token delay, token delay) of a model"""
+    return app.config["MODEL_DELAYS"].get(
+        model, (app.config["FIRST_TOKEN_DELAY"], app.config["TOKEN_DELAY"])
+    )
+
+
+def first_token_delay(delay, usage):
+    """`delay` scaled down by the share of cached prompt tokens"""
+    prompt_tokens = usage["prompt_tokens"]
+    if not prompt_tokens:
+        return delay
+    uncached = prompt_tokens - usage["prompt_tokens_details"]["cached_tokens"]
+    return delay * (0.2 + 0.8 * uncached / prompt_tokens)
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    body = request.json
+    model = body.get("model", "fake-model")
+    tokens = fake_reply_tokens(body.get("max_tokens"))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    usage = usage_for(body.get("messages", []), len(tokens))
+    first_delay, token_delay = model_delays(model)
+
+    if not body.get("stream"):
+        time.sleep(first_token_delay(first_delay, usage))
+        time.sleep(token_delay * len(tokens))
+        return jsonify(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+        )
+
+    def chunk(delta, finish_reason=None, choices=True, **extra):
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": (
+                [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                if choices
+                else []
+            ),
+            **extra,
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def generate():
+        time.sleep(first_token_delay(first_delay, usage))
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            yield chunk({"content": token})
+            time.sleep(token_delay)
+        yield chunk({}, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk({}, choices=False, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return Response(generate(), mimetype="text/event-stream")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument(
+        "--model-delay",
+        action="append",
+        default=[],
+        metavar="MODEL=FIRST,TOKEN",
+        help="first-token and per-token delay of one model",
+    )
+    args = parser.parse_args()
+
+    model_delays_arg = {}
+    for value in args.model_delay:
+        model, _, delays = value.partition("=")
+        first, token = delays.split(",")
+        model_delays_arg[model] = (float(first), float(token))
+
+    app.config.update(
+        FIRST_TOKEN_DELAY=args.first_token_delay,
+        TOKEN_DELAY=args.token_delay,
+        REPLY_TOKENS=args.reply_tokens,
+        MODEL_DELAYS=model_delays_arg,
+    )
+    app.run(host=args.host, port=args.port, threaded=True)
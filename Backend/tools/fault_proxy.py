@@ -0,0 +1,218 @@
+"""Fault-injecting HTTP proxy for testing the backend against a degraded upstream.
+
+Forwards every request to --upstream, except that at the configured rates
+it answers with an error status instead, delays the request, or drops the
+connection without answering. Put it in front of moto or
+tools/fake_openai.py:
+
+    python tools/fault_proxy.py --upstream http://127.0.0.1:8081 --error-rate 0.5
+    OPENAI_BASE_URL=http://localhost:8082/v1 python app.py
+
+The faults can be changed while it runs, e.g. to let the upstream recover,
+and GET /__faults reports them with the number of faults injected so far:
+
+    curl -X POST localhost:8082/__faults -d '{"error_rate": 0}'
+"""
+
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+FAULTS = {
+    "error_rate": 0.0,
+    "error_status": 503,
+    "delay_rate": 0.0,
+    "delay": 0.0,
+    "drop_rate": 0.0,
+}
+HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "transfer-encoding",
+    "te",
+    "trailer",
+    "upgrade",
+}
+
+
+def parse_faults(spec):
+    """Fault settings from "error_rate=0.2,delay_rate=0.1,delay=5" """
+    faults = {}
+    for setting in filter(None, spec.split(",")):
+        name, _, value = setting.partition("=")
+        name = name.strip().replace("-", "_")
+        if name not in FAULTS:
+            raise ValueError(f"Unknown fault {name!r}, use: {', '.join(FAULTS)}")
+        faults[name] = type(FAULTS[name])(float(value))
+    return faults
+
+
+class FaultState:
+    def __init__(self, faults=None, seed=None):
+        self.faults = {**FAULTS, **(faults or {})}
+        self.injected = {"error": 0, "delay": 0, "drop": 0}
+        self.forwarded = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def pick(self):
+        """The faults to inject into one request: (drop, error, delay)"""
+        with self.lock:
+            faults = dict(self.faults)
+            drop = self.random.random() < faults["drop_rate"]
+            error = not drop and self.random.random() < faults["error_rate"]
+            delay = self.random.random() < faults["delay_rate"] and faults["delay"]
+            for name, injected in (("drop", drop), ("error", error), ("delay", delay)):
+                if injected:
+                    self.injected[name] += 1
+            if not (drop or error):
+                self.forwarded += 1
+        return drop, error and faults["error_status"], delay
+
+    def update(self, faults):
+        with self.lock:
+            for name, value in faults.items():
+                if name not in FAULTS:
+                    raise ValueError(f"Unknown fault {name!r}")
+                self.faults[name] = type(FAULTS[name])(value)
+
+    def report(self):
+        with self.lock:
+            return {
+                "faults": dict(self.faults),
+                "injected": dict(self.injected),
+                "forwarded": self.forwarded,
+            }
+
+
+def make_handler(upstream, state, timeout):
+    target = urlsplit(upstream)
+
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else None
+
+        def control(self, body):
+            if self.command == "POST":
+                try:
+                    state.update(json.loads(body or b"{}"))
+                except (ValueError, TypeError) as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
+            self.send_json(200, state.report())
+
+        def forward(self):
+            body = self.read_body()
+            if self.path == "/__faults":
+                self.control(body)
+                return
+
+            drop, error_status, delay = state.pick()
+            if delay:
+                time.sleep(delay)
+            if drop:
+                self.close_connection = True
+                return
+            if error_status:
+                self.send_json(
+                    error_status,
+                    {"error": {"message": "Injected fault", "type": "server_error"}},
+                )
+                return
+
+            connection = http.client.HTTPConnection(
+                target.hostname, target.port, timeout=timeout
+            )
+            try:
+                headers = {
+                    name: value
+                    for name, value in self.headers.items()
+                    if name.lower() not in HOP_BY_HOP
+                }
+                connection.request(self.command, self.path, body, headers)
+                response = connection.getresponse()
+                self.relay(response)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up, e.g. its read deadline passed
+                self.close_connection = True
+            finally:
+                connection.close()
+
+        def relay(self, response):
+            """Copies a response, streaming it chunk by chunk when it has no length"""
+            self.send_response(response.status, response.reason)
+            for name, value in response.getheaders():
+                if name.lower() not in HOP_BY_HOP:
+                    self.send_header(name, value)
+            has_body = self.command != "HEAD" and response.status not in (204, 304)
+            chunked = has_body and response.getheader("Content-Length") is None
+            if chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            while has_body and (chunk := response.read1(64 * 1024)):
+                if chunked:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                else:
+                    self.wfile.write(chunk)
+                self.wfile.flush()
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = do_PATCH = forward
+
+    return ProxyHandler
+
+
+def serve(port, upstream, faults=None, host="127.0.0.1", seed=None, timeout=300):
+    """Starts the proxy on a background thread; returns (server, fault state)"""
+    state = FaultState(faults, seed)
+    server = ThreadingHTTPServer((host, port), make_handler(upstream, state, timeout))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--upstream", required=True, help="e.g. http://127.0.0.1:8081")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--delay-rate", type=float, default=0.0)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds")
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server, _ = serve(
+        args.port,
+        args.upstream,
+        {name: getattr(args, name) for name in FAULTS},
+        host=args.host,
+        seed=args.seed,
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,211 @@
+"""Startup benchmark for the backend.
+
+Measures what a deploy, a restart or a new worker costs, in fresh processes
+against the same local stand-ins as tools/bench.py:
+
+- import app / import asgi: seconds to import the module, as a worker does;
+- ready: seconds from spawning the server until /health answers;
+- first chats, chartdata, chat: latency of the first requests after a
+  restart, in that order, for a user whose workbook was uploaded before
+  the restart (so it is on local disk but not in memory).
+
+    python tools/startup_bench.py --runs 5 --output after.json
+    python tools/startup_bench.py --runs 5 --server gunicorn --compare after.json
+
+--warm-up-workbooks sets how many cached workbooks the server prepares
+before serving (0 to measure without).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import (
+    BACKEND_DIR,
+    Bench,
+    StandIns,
+    git_revision,
+    start_backend,
+)
+from synthetic_workbooks import build_workbooks
+
+IMPORTS = ["app", "asgi"]
+FIRST_REQUESTS = ["chats", "chartdata", "chat"]
+
+
+def import_seconds(module, workdir):
+    """Seconds a fresh interpreter takes to import `module`"""
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - started)"
+    )
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])
+        ),
+        API_KEY="bench",
+        AWS_ACCESS_KEY="bench",
+        AWS_SECRET_KEY="bench",
+        LOG_LEVEL="WARNING",
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=workdir,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def summary(name, seconds):
+    milliseconds = [value * 1000 for value in seconds]
+    return {
+        "name": name,
+        "runs": len(milliseconds),
+        "median": round(statistics.median(milliseconds), 1),
+        "min": round(min(milliseconds), 1),
+        "max": round(max(milliseconds), 1),
+    }
+
+
+def format_result(result, baseline=None):
+    line = (
+        f"{result['name']:<16} {result['median']:>10.1f} {result['min']:>10.1f} "
+        f"{result['max']:>10.1f}"
+    )
+    if baseline is None or not baseline["median"]:
+        return line
+    change = (result["median"] - baseline["median"]) / baseline["median"] * 100
+    return f"{line}   median {change:>+6.1f}% (was {baseline['median']:.1f})"
+
+
+def measure_restarts(stand_ins, endpoints, workbooks, args):
+    """Ready and first-request seconds over `args.runs` restarts"""
+    extra_env = {}
+    if args.warm_up_workbooks is not None:
+        extra_env["WARM_UP_WORKBOOKS"] = str(args.warm_up_workbooks)
+
+    backend, base_url = start_backend(
+        stand_ins, args.server, endpoints, args.jwt_secret, extra_env=extra_env
+    )
+    bench = Bench(base_url, {}, workbooks, args)
+    users = bench.prepare_users(args.properties, 1)
+    stand_ins.stop_process(backend)
+
+    ready = []
+    first = {endpoint: [] for endpoint in FIRST_REQUESTS}
+    for run in range(args.runs):
+        started = time.perf_counter()
+        backend, bench.base_url = start_backend(
+            stand_ins,
+            args.server,
+            endpoints,
+            args.jwt_secret,
+            extra_env=extra_env,
+            interval=0.01,
+        )
+        ready.append(time.perf_counter() - started)
+        for endpoint in FIRST_REQUESTS:
+            status, seconds, _ = bench.request(
+                endpoint, args.properties, users, run, f"startup-{run}"
+            )
+            if status != 200:
+                raise RuntimeError(f"First {endpoint} request failed with {status}")
+            first[endpoint].append(seconds)
+        stand_ins.stop_process(backend)
+    return ready, first
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--server", choices=["flask", "asgi", "gunicorn"], default="flask"
+    )
+    parser.add_argument("--properties", type=int, default=500, help="workbook size")
+    parser.add_argument("--warm-up-workbooks", type=int)
+    parser.add_argument("--dynamodb-endpoint", help="e.g. DynamoDB Local")
+    parser.add_argument("--s3-endpoint", help="e.g. MinIO")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--workbooks", help="directory to keep generated workbooks in")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    # The fake OpenAI server answers as it does by default in tools/bench.py
+    parser.set_defaults(
+        first_token_delay=0.2,
+        token_delay=0.01,
+        reply_tokens=60,
+        small_first_token_delay=0.08,
+        small_token_delay=0.004,
+        aws_faults=None,
+        openai_faults=None,
+    )
+    args = parser.parse_args()
+    args.jwt_secret = os.urandom(32).hex()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as report_file:
+            baseline = {
+                result["name"]: result for result in json.load(report_file)["results"]
+            }
+
+    workdir = tempfile.mkdtemp(prefix="rentwise-startup-")
+    workbooks = build_workbooks(
+        args.workbooks or os.path.join(workdir, "workbooks"), [args.properties]
+    )
+    results = [
+        summary(
+            f"import {module}",
+            [import_seconds(module, workdir) for _ in range(args.runs)],
+        )
+        for module in IMPORTS
+    ]
+    stand_ins = StandIns(args, workdir)
+    try:
+        endpoints = stand_ins.start()
+        ready, first = measure_restarts(stand_ins, endpoints, workbooks, args)
+    finally:
+        stand_ins.stop()
+    results.append(summary("ready", ready))
+    results.extend(
+        summary(f"first {endpoint}", seconds) for endpoint, seconds in first.items()
+    )
+
+    print(f"Logs in {workdir}", file=sys.stderr)
+    print(f"{'ms':<16} {'median':>10} {'min':>10} {'max':>10}")
+    for result in results:
+        print(format_result(result, baseline.get(result["name"])))
+
+    report = {
+        "meta": {
+            "started": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "server": args.server,
+            "runs": args.runs,
+            "properties": args.properties,
+            "warm_up_workbooks": args.warm_up_workbooks,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Report written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Synthetic portfolio workbooks for benchmarks and local testing.
+
+Writes workbooks with the "Sold Flips", "Flip Inventory Sheet" and "Kiavi
+Loans" layouts the dashboard relies on (title rows, header rows and column
+names as in real portfolios), filled with deterministic random properties:
+
+    python tools/synthetic_workbooks.py bench-data --sizes 50 500 5000
+"""
+
+import argparse
+import datetime
+import os
+import random
+
+from openpyxl import Workbook
+
+AS_OF = datetime.datetime(2024, 9, 10)
+
+STREETS = [
+    "Silver Ct",
+    "Lalor St",
+    "Keswick Dr",
+    "Andrew Street",
+    "Parklane",
+    "Columbia",
+    "Dennison",
+    "Silver Lake Road",
+    "Locust",
+    "Greenland",
+    "Dogwood Dr",
+    "Taylor St",
+]
+CITIES = ["Hamilton", "Newtown", "Piscataway", "Trenton", "Ewing", "Princeton"]
+LEADS = ["Sheriff Sale", "Homelight", "Direct Mail", "Wholesale", "Referral", "MLS"]
+CONTRACTORS = ["Politti", "Immanuel Home Improvement", None]
+
+SOLD_FLIPS_COLUMNS = [
+    "Property Address",
+    "Current Status",
+    "Purchase Date",
+    "Sold Date",
+    "# of Days Owned",
+    "Property Purchase Price",
+    "Purchase Costs",
+    "Holding Costs",
+    "Projected Rehab",
+    "Construction",
+    "Total Investment Cost (including Purchase, Holding, Rehab etc)",
+    "Property Sale Price",
+    "Total Sale Related Expenditure",
+    "Net Profit or Loss (Auto Calculated)",
+    "Net Profit or Loss Check",
+    "Difference",
+    "Debt Payback",
+    "Undrawn Rehab Funds",
+    "Lender",
+    "Loan Account Number",
+    "Projected cash flow ",
+    "Construction Cost Per Day",
+    "Type of Purchase",
+    "Notes",
+    "Lead",
+    "Contractor ",
+    "City",
+    None,
+]
+INVENTORY_COLUMNS = [
+    "Address",
+    "Current Status",
+    "Purchase Date",
+    "Projected Sale Date",
+    "# of Days Owned",
+    "Purchase Price",
+    "Purchase Closing Costs",
+    "Holding Costs",
+    "Projected Rehab",
+    "Construction",
+    "Total Invested",
+    "BS CHeck",
+    "Difference",
+    "Projected Sale Price",
+    "Projected Sale Costs",
+    "Projected Gross Profit",
+    "Debt Payback",
+    "Undrawn Rehab Funds",
+    "Lender",
+    "Loan Account Number",
+    "Projected cash flow ",
+    "Construction Cost Per Day",
+    "Type of Purchase",
+    "Notes",
+    "Lead",
+    "Contractor ",
+    "City",
+    "Purchase Date",
+]
+KIAVI_COLUMNS = [
+    "Address",
+    "Loan Number",
+    "Status",
+    "Balance ",
+    "Undrawn",
+    "Total",
+    "Est ARV",
+    "Rate",
+    "Payment",
+    "Payment",
+]
+
+
+def money(rng, low, high):
+    return round(rng.uniform(low, high), 2)
+
+
+def random_property(rng, number):
+    purchase_date = AS_OF - datetime.timedelta(days=rng.randint(30, 900))
+    purchase_price = money(rng, 60000, 450000)
+    purchase_costs = money(rng, 500, 40000)
+    holding_costs = money(rng, 0, 36000)
+    rehab = rng.choice([None, money(rng, 10000, 180000)])
+    construction = money(rng, 0, 180000)
+    invested = round(purchase_price + purchase_costs + holding_costs + construction, 2)
+    return {
+        "address": f"{rng.randint(1, 1999)} {rng.choice(STREETS)} #{number}",
+        "city": rng.choice(CITIES),
+        "lead": rng.choice(LEADS),
+        "contractor": rng.choice(CONTRACTORS),
+        "purchase_date": purchase_date,
+        "purchase_price": purchase_price,
+        "purchase_costs": purchase_costs,
+        "holding_costs": holding_costs,
+        "rehab": rehab,
+        "construction": construction,
+        "invested": invested,
+        "loan_number": 34600000 + number,
+    }
+
+
+def sold_flip_row(rng, prop):
+    sold_date = prop["purchase_date"] + datetime.timedelta(days=rng.randint(20, 420))
+    days = (sold_date - prop["purchase_date"]).days
+    sale_price = round(prop["invested"] * rng.uniform(0.85, 1.4), -2)
+    sale_costs = round(sale_price * rng.uniform(0.05, 0.11), 2)
+    profit = round(sale_price - sale_costs - prop["invested"], 2)
+    return [
+        prop["address"],
+        "Sold",
+        prop["purchase_date"],
+        sold_date,
+        days,
+        prop["purchase_price"],
+        prop["purchase_costs"],
+        prop["holding_costs"],
+        prop["rehab"],
+        prop["construction"],
+        prop["invested"],
+        sale_price,
+        sale_costs,
+        profit,
+        profit,
+        0,
+        None,
+        None,
+        "Kiavi",
+        prop["loan_number"],
+        round(sale_price - sale_costs, 2),
+        prop["construction"] / days,
+        "Flips",
+        None,
+        prop["lead"],
+        prop["contractor"],
+        prop["city"],
+        sold_date.strftime("%m/%Y"),
+    ]
+
+
+def inventory_row(rng, prop):
+    days = (AS_OF - prop["purchase_date"]).days
+    sale_price = round(prop["invested"] * rng.uniform(0.9, 1.5), -3)
+    sale_costs = round(sale_price * 0.07, 2)
+    debt = round(prop["purchase_price"] * 0.9, -2)
+    undrawn = round((prop["rehab"] or 0) * rng.uniform(0, 0.5), 2)
+    return [
+        prop["address"],
+        rng.choice(["Active", "Active", "Listed"]),
+        prop["purchase_date"],
+        None,
+        days,
+        prop["purchase_price"],
+        prop["purchase_costs"],
+        prop["holding_costs"],
+        prop["rehab"],
+        prop["construction"],
+        prop["invested"],
+        prop["invested"],
+        None,
+        sale_price,
+        sale_costs,
+        round(sale_price - sale_costs - prop["invested"], 2),
+        debt,
+        undrawn,
+        "Kiavi",
+        prop["loan_number"],
+        round(sale_price - sale_costs - debt, 2),
+        prop["construction"] / days,
+        "Flip",
+        None,
+        prop["lead"],
+        prop["contractor"],
+        prop["city"],
+        prop["purchase_date"].strftime("%m/%Y"),
+    ]
+
+
+def kiavi_row(rng, prop):
+    balance = round(prop["purchase_price"] * 0.9, -2)
+    undrawn = round((prop["rehab"] or 0) * rng.uniform(0, 0.5))
+    rate = rng.choice([0.0945, 0.0995, 0.1045])
+    return [
+        prop["address"],
+        prop["loan_number"],
+        "Current",
+        balance,
+        undrawn,
+        balance + undrawn,
+        round(prop["invested"] * 1.3, -3),
+        rate,
+        round(balance * rate / 12, 2),
+        balance * rate / 12,
+    ]
+
+
+def build_workbook(path, properties, seed=0):
+    """Writes a workbook with `properties` rows per sheet and returns its path.
+
+    The same `properties` and `seed` always produce the same sheets.
+    """
+    rng = random.Random(f"{seed}-{properties}")
+    sold = [random_property(rng, number) for number in range(properties)]
+    held = [random_property(rng, properties + number) for number in range(properties)]
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sold Flips")
+    sheet.append([AS_OF])
+    sheet.append(SOLD_FLIPS_COLUMNS)
+    for prop in sold:
+        sheet.append(sold_flip_row(rng, prop))
+
+    sheet = workbook.create_sheet("Flip Inventory Sheet")
+    sheet.append(["INVENTORY", AS_OF, None, None, None, "Current as of", AS_OF])
+    sheet.append(INVENTORY_COLUMNS)
+    for prop in held:
+        sheet.append(inventory_row(rng, prop))
+
+    sheet = workbook.create_sheet("Kiavi Loans")
+    sheet.append(["Kiavi Loans", None, None, None, None, None, AS_OF])
+    sheet.append([])
+    sheet.append(KIAVI_COLUMNS)
+    for prop in held:
+        sheet.append(kiavi_row(rng, prop))
+
+    workbook.save(path)
+    return path
+
+
+def build_workbooks(directory, sizes, seed=0):
+    """Writes one workbook per size, reusing ones already built; returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for properties in sizes:
+        path = os.path.join(directory, f"portfolio-{properties}-{seed}.xlsx")
+        if not os.path.exists(path):
+            build_workbook(path, properties, seed)
+        paths[properties] = path
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for properties, path in build_workbooks(
+        args.directory, args.sizes, args.seed
+    ).items():
+        print(
+            f"{properties} properties per sheet: {path} ({os.path.getsize(path)} bytes)"
+        )
@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+JOB_TTL = int(os.getenv("UPLOAD_JOB_TTL", "3600"))
+
+
+class UploadJobs:
+    """Registry of upload jobs and the in-process pool that runs them.
+
+    A job moves through queued -> ingesting -> uploading -> done, or ends
+    as failed with an error message. Finished jobs are kept for `ttl`
+    seconds so clients can still read their final status.
+
+    Jobs run in the process that accepted the upload, but clients may poll
+    any worker, so every status change is also written to `table` (keyed
+    by job_id, with an `expires` epoch for DynamoDB TTL) when one is given.
+    If the table can't be written, status stays readable in this process.
+    """
+
+    def __init__(self, workers=UPLOAD_WORKERS, ttl=JOB_TTL, table=None):
+        self.ttl = ttl
+        self.table = table
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="upload-job"
+        )
+
+    def create(self, email, file_path, status="queued", **fields):
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "email": email,
+            "file_path": file_path,
+            "status": status,
+            "error": None,
+            "created": now,
+            "updated": now,
+            **fields,
+        }
+        with self._lock:
+            self._prune(now)
+            self._jobs[job["job_id"]] = job
+        self._save(job)
+        return dict(job)
+
+    def _save(self, job):
+        """Writes the job where other processes can read it"""
+        if self.table is None:
+            return
+        item = {
+            key: int(value) if isinstance(value, float) else value
+            for key, value in job.items()
+            if value is not None
+        }
+        item["expires"] = int(job["updated"]) + self.ttl
+        try:
+            self.table.put_item(Item=item)
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code == "ResourceNotFoundException":
+                logger.warning(
+                    "Upload jobs table not found, job status is only "
+                    "visible to the process running the job"
+                )
+                self.table = None
+                return
+            logger.warning(f"Could not record upload job {job['job_id']}: {e}")
+
+    def _prune(self, now):
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["status"] in ("done", "failed") and now - job["updated"] > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, updated=time.time())
+            job = dict(job)
+        self._save(job)
+
+    def get(self, job_id):
+        """The job's latest status, from this process or the jobs table"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.table is None:
+            return None
+        try:
+            job = self.table.get_item(Key={"job_id": job_id}).get("Item")
+        except Exception as e:
+            logger.warning(f"Could not read upload job {job_id}: {e}")
+            return None
+        if job is None or job["expires"] < time.time():
+            return None
+        return job
+
+    def submit(self, job_id, func, *args):
+        """Runs `func(*args)` in the background, marking the job failed if it raises"""
+
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Upload job {job_id} failed: {e}")
+                self.update(job_id, status="failed", error=str(e))
+
+        self._executor.submit(run)
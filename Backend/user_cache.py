@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", "10"))
+MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class UserCache:
+    """Short-lived LRU of `Users` lookups, including misses.
+
+    Repeated sign-ins skip the DynamoDB read for `ttl` seconds, and unknown
+    emails are remembered for the shorter `negative_ttl` so a burst of
+    attempts against a missing account costs one read.
+    """
+
+    def __init__(self, ttl=TTL, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        """(whether the lookup is cached, the user item or None)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, email, user):
+        ttl = self.ttl if user is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[email] = (time.monotonic() + ttl, user)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
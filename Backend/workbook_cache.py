@@ -0,0 +1,135 @@
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def estimate_size(value):
+    """Rough in-memory size of a cached value in bytes"""
+    if hasattr(value, "memory_size"):
+        return value.memory_size()
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return sys.getsizeof(value)
+
+
+class WorkbookCache:
+    """In-process LRU of parsed workbooks, bounded by total bytes.
+
+    Entries are keyed by (file path, file version, kind) where the version is
+    whatever identifies one upload of the file (the `Files` table timestamp).
+    A new upload therefore never hits an older entry, and `invalidate` drops
+    every version of a path eagerly so stale frames don't sit in memory.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _lookup(self, key):
+        """Cached value of `key` or None; the caller holds self._lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get(self, path, version, kind):
+        with self._lock:
+            return self._lookup((os.path.abspath(path), version, kind))
+
+    def latest(self, path, kind):
+        """The most recently used value of `kind` for any version of `path`, or None"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in reversed(self._entries):
+                if key[0] == path and key[2] == kind:
+                    return self._entries[key][0]
+        return None
+
+    def put(self, path, version, kind, value):
+        key = (os.path.abspath(path), version, kind)
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                logger.warning(
+                    f"Not caching {kind} for {path}: {size} bytes exceeds cache limit"
+                )
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                logger.debug(f"Evicted {evicted_key} from workbook cache")
+
+    def get_or_load(self, path, version, kind, loader):
+        """Returns the cached value, calling `loader()` once on a miss.
+
+        Concurrent misses for the same key wait on a per-key lock so a
+        workbook is parsed once even when several requests arrive together.
+        """
+        key = (os.path.abspath(path), version, kind)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                with self._lock:
+                    value = self._lookup(key)
+                    if value is not None:
+                        self.hits += 1
+                        return value
+                    self.misses += 1
+                value = loader()
+                self.put(path, version, kind, value)
+                return value
+        finally:
+            # Also when loader() raises, so failed keys don't keep their lock
+            with self._lock:
+                if self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+
+    def invalidate(self, path):
+        """Drops every cached version of `path`"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self.current_bytes -= self._entries.pop(key)[1]
+        logger.info(f"Invalidated workbook cache for {path}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+workbook_cache = WorkbookCache(
+    int(os.getenv("WORKBOOK_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+)
@@ -14,7 +14,6 @@ import Profile from './Components/Profile/Profile';
 import Navbar from './Components/Navbar/Navbar';
 import Sidebar from './Components/Sidebar/Sidebar';
 import { UserContext } from './contexts/UserContext';
-import axios from 'axios';
 import './App.css';
 
 function App() {
@@ -64,23 +63,61 @@ function App() {
     }
 
     const endpoint = process.env.REACT_APP_BACKEND_URL;
-    axios
-      .post(
-        `${endpoint}/api/chat`,
-        { message: userMessage },
-        {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
+    let streamStarted = false;
+
+    // Appends streamed tokens to the assistant message being generated
+    const appendToken = (token) => {
+      setChatMessages((prevMessages) => {
+        if (!streamStarted) {
+          streamStarted = true;
+          return [...prevMessages, { role: 'assistant', message: token }];
         }
-      )
-      .then((response) => {
-        const botReply = response.data.reply;
-        if (botReply && botReply.trim() !== '') {
-          setChatMessages((prevMessages) => [
-            ...prevMessages,
-            { role: 'assistant', message: botReply },
-          ]);
+        const lastMessage = prevMessages[prevMessages.length - 1];
+        return [
+          ...prevMessages.slice(0, -1),
+          { ...lastMessage, message: lastMessage.message + token },
+        ];
+      });
+      setBotTyping(false);
+    };
+
+    const handleEvent = (rawEvent) => {
+      let eventName = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (!data) return;
+
+      const payload = JSON.parse(data);
+      if (eventName === 'error') throw new Error(payload.error);
+      if (payload.token) appendToken(payload.token);
+    };
+
+    fetch(`${endpoint}/api/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Authorization: `Bearer ${token}`,
+      },
+      body: JSON.stringify({ message: userMessage }),
+    })
+      .then(async (response) => {
+        if (!response.ok || !response.body) {
+          throw new Error(`Server responded with ${response.status}`);
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const events = buffer.split('\n\n');
+          buffer = events.pop();
+          events.forEach(handleEvent);
         }
       })
       .catch((error) => {
@@ -14,7 +14,10 @@ function Chat({ chatMessages, onSendMessage, botTyping, setChatMessages }) {
   const location = useLocation();
   const endpoint = process.env.REACT_APP_BACKEND_URL;
 
-  // Fetch previous chat history
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [hasOlder, setHasOlder] = useState(false);
+
+  // Fetch the latest page of chat history
   useEffect(() => {
     const token = localStorage.getItem('authToken');
     if (token) {
@@ -22,11 +25,31 @@ function Chat({ chatMessages, onSendMessage, botTyping, setChatMessages }) {
         .get(`${endpoint}/api/chats`, {
           headers: { Authorization: `Bearer ${token}` },
         })
-        .then((response) => setChatMessages(response.data.chats))
+        .then((response) => {
+          setChatMessages(response.data.chats);
+          setOlderCursor(response.data.cursor.before);
+          setHasOlder(response.data.hasMore);
+        })
         .catch((error) => console.error('Error fetching chat history:', error));
     }
   }, [endpoint, setChatMessages]);
 
+  // Fetch the page of history preceding the oldest loaded message
+  const loadOlderMessages = () => {
+    const token = localStorage.getItem('authToken');
+    axios
+      .get(`${endpoint}/api/chats`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { before: olderCursor },
+      })
+      .then((response) => {
+        setChatMessages((prev) => [...response.data.chats, ...prev]);
+        setOlderCursor(response.data.cursor.before);
+        setHasOlder(response.data.hasMore);
+      })
+      .catch((error) => console.error('Error fetching chat history:', error));
+  };
+
   // Check for pre-filled questions
   useEffect(() => {
     if (location.state?.question) {
@@ -65,6 +88,15 @@ function Chat({ chatMessages, onSendMessage, botTyping, setChatMessages }) {
     <div className='chat-page'>
       <div className='chat-container'>
         <div className='chat-box'>
+          {hasOlder && (
+            <button
+              type='button'
+              className='chat-load-older'
+              onClick={loadOlderMessages}
+            >
+              Load earlier messages
+            </button>
+          )}
           {chatMessages.map((msg, index) => (
             <div key={index} className={`chat-message ${msg.role}`}>
               {msg.role === 'assistant' && (
@@ -4,6 +4,8 @@ import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
 import { faPaperclip, faPaperPlane } from '@fortawesome/free-solid-svg-icons';
 import axios from 'axios';
 
+const UPLOAD_TIMEOUT_MS = 10 * 60 * 1000;
+
 const FooterChat = ({ inputMessage, setInputMessage, onSend }) => {
   const [file, setFile] = useState(null);
   const [showPreview, setShowPreview] = useState(false);
@@ -19,10 +21,30 @@ const FooterChat = ({ inputMessage, setInputMessage, onSend }) => {
     }
   };
 
+  // Poll an upload job until it is done or failed, giving up after a while
+  const waitForUpload = async (endpoint, token, jobId) => {
+    const deadline = Date.now() + UPLOAD_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      const { data } = await axios.get(`${endpoint}/api/upload/${jobId}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      if (data.status === 'done' || data.status === 'failed') {
+        return data;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+    throw new Error('The upload is taking too long, please try again');
+  };
+
   // Handle file upload
   const handleFileUpload = (file) => {
     const formData = new FormData();
     formData.append('file', file);
+    // There are no controls to list or remove workbooks yet, so each upload
+    // replaces the portfolio rather than adding to it
+    formData.append('replace', 'true');
     const token = localStorage.getItem('authToken');
     if (!token) {
       console.error('No auth token found. User might not be authenticated.');
@@ -37,8 +59,19 @@ const FooterChat = ({ inputMessage, setInputMessage, onSend }) => {
         },
       })
       .then((response) => {
+        if (response.status === 202) {
+          // Parsing continues in the background; wait for the job to finish
+          return waitForUpload(endpoint, token, response.data.job_id);
+        }
+        return response.data;
+      })
+      .then((job) => {
         setIsLoading(false);
-        console.log('File uploaded successfully:', response.data);
+        if (job.status === 'failed') {
+          console.error('Error processing file:', job.error);
+          return;
+        }
+        console.log('File uploaded successfully:', job);
       })
       .catch((error) => {
         setIsLoading(false);